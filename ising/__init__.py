@@ -5,11 +5,15 @@ from .constants import *
 from .hamiltonian import *
 from .spins import *
 from .thermo import *
+from .numpycalc import *
 from .fastc import *
 from .fastcwrapper import *
 from .despats import *
 from .montecarlo import *
 from .graph import *
+from .lattice import *
+from .transfer import *
+from .degeneracy import *
 
 # Handle versioneer
 from ._version import get_versions
@@ -103,7 +103,7 @@ Runs the Ising command line program.
     )
     parser.add_argument(
         "--backend",
-        choices=["monte-carlo", "c", "python"],
+        choices=["monte-carlo", "c", "python", "transfer-matrix"],
         default="c",
         help="Select which backend to use.",
     )
@@ -134,6 +134,13 @@ Runs the Ising command line program.
         )
     elif args["backend"] == "python":
         pass
+    elif args["backend"] == "transfer-matrix":
+        thermo.ThermoMethod.getsingleton().setstrat(
+            thermo.TransferMatrixStrategy.getsingleton()
+        )
+        thermo.PlotValsMethod.getsingleton().setstrat(
+            thermo.TransferMatrixStrategy.getsingleton()
+        )
 
     try:
         thermo.PlotValsMethod.getsingleton().getstrat().setthreads(args["threads"])
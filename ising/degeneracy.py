@@ -0,0 +1,316 @@
+#!/usr/bin/python3
+
+"""
+ising.degeneracy
+
+Exact degeneracy tables for periodic chains. The number of configurations of a
+ring with a given number of domain walls and magnetization has a closed form,
+so the thermodynamics can be found for very long rings without enumeration.
+"""
+
+try:
+    from . import hamiltonian
+    from . import spins
+    from . import thermo
+except ImportError:
+    import hamiltonian
+    import spins
+    import thermo
+
+import decimal
+import fractions
+import functools
+import math
+
+
+def _comb(total: int, choose: int):
+    """
+Returns the binomial coefficient, as math.comb does from Python 3.8.
+"""
+    if choose < 0 or choose > total:
+        return 0
+    return math.factorial(total) // (
+        math.factorial(choose) * math.factorial(total - choose)
+    )
+
+
+def ring_degeneracy(length: int, walls: int, mag: int):
+    """
+Returns the number of configurations of a ring with the given number of domain
+walls and magnetization. The up spins are split into walls / 2 runs, as are the
+down spins, and the runs can start at any of the positions.
+"""
+    if (length + mag) % 2 != 0 or abs(mag) > length or walls % 2 != 0:
+        return 0
+    ups = (length + mag) // 2
+    downs = length - ups
+    if walls == 0:
+        return 1 if ups == 0 or downs == 0 else 0
+    runs = walls // 2
+    if runs > ups or runs > downs:
+        return 0
+    return (
+        length * _comb(ups - 1, runs - 1) * _comb(downs - 1, runs - 1) // runs
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def ring_levels(length: int):
+    """
+Returns the density of states of a ring as a tuple of (couple, mag, count)
+levels, where couple is the sum of the nearest neighbor spin products. This is
+the same form that ising.fastc.p_dos returns. The counts are exact.
+"""
+    levels = [(length, -length, 1), (length, length, 1)]
+    for runs in range(1, length // 2 + 1):
+        # column[n] is the binomial coefficient (n choose runs - 1).
+        column = [0] * (runs - 1) + [1]
+        for n in range(runs, length - runs):
+            column.append(column[-1] * n // (n - runs + 1))
+        for ups in range(runs, length - runs + 1):
+            count = length * column[ups - 1] * column[length - ups - 1] // runs
+            levels.append((length - 4 * runs, 2 * ups - length, count))
+    return tuple(levels)
+
+
+def ring_moments(
+    length: int, coupling, magnet, temp, boltzmann, prec: int = 50
+):
+    """
+Finds the log of the partition function, the average energy, the variance of
+the energy, the average magnetization, and the variance of the magnetization of
+a ring, as decimals with prec significant digits.
+"""
+    with decimal.localcontext() as ctx:
+        ctx.prec = prec
+        ctx.Emax = decimal.MAX_EMAX
+        ctx.Emin = decimal.MIN_EMIN
+        beta = 1 / (decimal.Decimal(boltzmann) * decimal.Decimal(temp))
+        coup = decimal.Decimal(coupling)
+        mag = decimal.Decimal(magnet)
+        # Shift by the lowest energy so that the largest weight is one.
+        levels = ring_levels(length)
+        least = min(-coup * c + mag * m for c, m, _ in levels)
+        coup_weights = {}
+        mag_weights = {}
+        part = en1 = en2 = mag1 = mag2 = decimal.Decimal(0)
+        for couple, magnet_val, count in levels:
+            if couple not in coup_weights:
+                coup_weights[couple] = (beta * coup * couple).exp()
+            if magnet_val not in mag_weights:
+                mag_weights[magnet_val] = (
+                    -beta * (mag * magnet_val - least)
+                ).exp()
+            weight = count * coup_weights[couple] * mag_weights[magnet_val]
+            # Take the energy moments about the lowest energy.
+            energy = -coup * couple + mag * magnet_val - least
+            part += weight
+            en1 += weight * energy
+            en2 += weight * energy * energy
+            mag1 += weight * magnet_val
+            mag2 += weight * magnet_val * magnet_val
+        en1 /= part
+        mag1 /= part
+        return (
+            part.ln() - beta * least,
+            en1 + least,
+            en2 / part - en1 * en1,
+            mag1,
+            mag2 / part - mag1 * mag1,
+        )
+
+
+def ring_exact_moments(length: int, coup_weight, field_weight):
+    """
+Finds the partition function and the first two moments of the spin coupling
+and magnetization of a ring as exact fractions. coup_weight is exp(J / kT) and
+field_weight is exp(-h / kT), given as exact rationals.
+"""
+    coup_weight = fractions.Fraction(coup_weight)
+    field_weight = fractions.Fraction(field_weight)
+    part = coup1 = coup2 = mag1 = mag2 = fractions.Fraction(0)
+    for couple, mag, count in ring_levels(length):
+        weight = count * coup_weight ** couple * field_weight ** mag
+        part += weight
+        coup1 += weight * couple
+        coup2 += weight * couple * couple
+        mag1 += weight * mag
+        mag2 += weight * mag * mag
+    return part, coup1 / part, coup2 / part, mag1 / part, mag2 / part
+
+
+class DegeneracyStrategy(thermo.ThermoStrategy, thermo.PlotValsStrategy):
+    """
+Calculates values for rings exactly from the degeneracy tables, in high
+precision. Other Hamiltonians use the full calculation.
+"""
+
+    def __init__(self):
+        super().__init__()
+        self._prec = 50
+
+    def getprecision(self):
+        """
+Gets the number of significant digits.
+"""
+        return self._prec
+
+    def setprecision(self, prec: int):
+        """
+Sets the number of significant digits.
+"""
+        self._prec = prec
+
+    def _moments(self, hamilt, length, temp, boltzmann):
+        return ring_moments(
+            length,
+            hamilt.getcoupling(),
+            hamilt.getmagnet(),
+            temp,
+            boltzmann,
+            self.getprecision(),
+        )
+
+    def log_partition(
+        self,
+        hamilt: hamiltonian.Hamiltonian,
+        length: int,
+        temp: float,
+        boltzmann: float,
+    ):
+        """
+Calculates the natural log of the partition function.
+"""
+        if not isinstance(hamilt, hamiltonian.PeriodicHamiltonian):
+            return thermo.FullCalcStrategy.getsingleton().log_partition(
+                hamilt, length, temp, boltzmann
+            )
+        return float(self._moments(hamilt, length, temp, boltzmann)[0])
+
+    def partition(
+        self,
+        hamilt: hamiltonian.Hamiltonian,
+        length: int,
+        temp: float,
+        boltzmann: float,
+    ):
+        """
+Calculates the partition function.
+"""
+        if not isinstance(hamilt, hamiltonian.PeriodicHamiltonian):
+            return thermo.FullCalcStrategy.getsingleton().partition(
+                hamilt, length, temp, boltzmann
+            )
+        return math.exp(self.log_partition(hamilt, length, temp, boltzmann))
+
+    def average(
+        self,
+        func,
+        hamilt: hamiltonian.Hamiltonian,
+        length: int,
+        temp: float,
+        boltzmann: float,
+        *args,
+        **kwargs,
+    ):
+        """
+Calculates the average. The energy and the magnetization come from the tables,
+and anything else from FullCalcStrategy.
+"""
+        if isinstance(hamilt, hamiltonian.PeriodicHamiltonian) and not (
+            args or kwargs
+        ):
+            if func == hamilt.energy:
+                return self.energy(hamilt, length, temp, boltzmann)
+            if func in (thermo.magnetization, spins.SpinConfig.magnetization):
+                return float(self._moments(hamilt, length, temp, boltzmann)[3])
+        return thermo.FullCalcStrategy.getsingleton().average(
+            func, hamilt, length, temp, boltzmann, *args, **kwargs
+        )
+
+    def variance(
+        self,
+        func,
+        hamilt: hamiltonian.Hamiltonian,
+        length: int,
+        temp: float,
+        boltzmann: float,
+        *args,
+        **kwargs,
+    ):
+        """
+Calculates the variance. The energy and the magnetization come from the
+tables, and anything else from FullCalcStrategy.
+"""
+        if isinstance(hamilt, hamiltonian.PeriodicHamiltonian) and not (
+            args or kwargs
+        ):
+            if func == hamilt.energy:
+                return float(self._moments(hamilt, length, temp, boltzmann)[2])
+            if func in (thermo.magnetization, spins.SpinConfig.magnetization):
+                return float(self._moments(hamilt, length, temp, boltzmann)[4])
+        return thermo.FullCalcStrategy.getsingleton().variance(
+            func, hamilt, length, temp, boltzmann, *args, **kwargs
+        )
+
+    def energy(
+        self,
+        hamilt: hamiltonian.Hamiltonian,
+        length: int,
+        temp: float,
+        boltzmann: float,
+    ):
+        """
+Calculates the average energy.
+"""
+        if not isinstance(hamilt, hamiltonian.PeriodicHamiltonian):
+            return super().energy(hamilt, length, temp, boltzmann)
+        return float(self._moments(hamilt, length, temp, boltzmann)[1])
+
+    def heatcap(
+        self,
+        hamilt: hamiltonian.Hamiltonian,
+        length: int,
+        temp: float,
+        boltzmann: float,
+    ):
+        """
+Calculates the heat capacity.
+"""
+        if not isinstance(hamilt, hamiltonian.PeriodicHamiltonian):
+            return super().heatcap(hamilt, length, temp, boltzmann)
+        return float(self._moments(hamilt, length, temp, boltzmann)[2]) / (
+            boltzmann * temp ** 2
+        )
+
+    def magneticsus(
+        self,
+        hamilt: hamiltonian.Hamiltonian,
+        length: int,
+        temp: float,
+        boltzmann: float,
+    ):
+        """
+Calculates the magnetic susceptibility.
+"""
+        if not isinstance(hamilt, hamiltonian.PeriodicHamiltonian):
+            return super().magneticsus(hamilt, length, temp, boltzmann)
+        return float(self._moments(hamilt, length, temp, boltzmann)[4]) / (
+            boltzmann * temp
+        )
+
+    def calc_plot_vals(self, hamilt: hamiltonian.Hamiltonian, length, temps, boltzmann):
+        """
+Returns the energies, heat capacities, and magnetic susceptibilities at several
+temperatures.
+"""
+        if not isinstance(hamilt, hamiltonian.PeriodicHamiltonian):
+            return thermo.SequentialStrategy.getsingleton().calc_plot_vals(
+                hamilt, length, temps, boltzmann
+            )
+        moments = [self._moments(hamilt, length, t, boltzmann) for t in temps]
+        return (
+            [float(mom[1]) for mom in moments],
+            [float(mom[2]) / (boltzmann * t ** 2) for mom, t in zip(moments, temps)],
+            [float(mom[4]) / (boltzmann * t) for mom, t in zip(moments, temps)],
+        )
@@ -8,22 +8,225 @@ try:
     from . import hamiltonian
     from . import thermo
     from . import spins
+    from . import despats
 except ImportError:
     import hamiltonian
     import thermo
     import spins
+    import despats
 
 import os
+import numpy as np
+
+# The most sites that the C kernels enumerate at once.
+_WIDTH = 63
+
+# The most spins of a GraphHamiltonian that are enumerated in C. Each of the
+# 2 ** length configurations is visited, so larger graphs would never finish,
+# and are left to the fallbacks.
+_GRAPH_WIDTH = 40
+
+# The number of configurations handed to a batched observable at once.
+_BATCH = 4096
+
+
+def dos_chunk(length: int, start: int, stop: int, threads: int = 1):
+    """
+Finds the density of states of the configurations start <= i < stop of a
+periodic chain, as a list of (couple, mag, count) tuples. The full range is
+0 to 2 ** length. Chunks can be run separately and put together with merge_dos,
+and chains longer than 64 sites are handled by fixing the high sites, up to
+127 sites.
+"""
+    if length <= _WIDTH:
+        return fastc.p_dos_range(length, length, None, start, stop, threads)
+    width = _WIDTH
+    fixed = length - width
+    out = []
+    high = start >> width
+    while start < stop:
+        end = min(stop, (high + 1) << width)
+        # The fixed sites form an open chain.
+        diffs = (high ^ (high >> 1)) & ((1 << (fixed - 1)) - 1)
+        prefix = (
+            fixed - 1 - bin(diffs).count("1"),
+            bin(high).count("1"),
+            (high >> (fixed - 1)) & 1,
+            high & 1,
+        )
+        out.append(
+            fastc.p_dos_range(
+                length,
+                width,
+                prefix,
+                start - (high << width),
+                end - (high << width),
+                threads,
+            )
+        )
+        start = end
+        high += 1
+    return merge_dos(*out)
+
+
+def merge_dos(*levels):
+    """
+Sums the counts of several densities of states, such as those from dos_chunk.
+"""
+    counts = {}
+    for level in levels:
+        for couple, mag, count in level:
+            counts[couple, mag] = counts.get((couple, mag), 0) + count
+    return [(couple, mag, count) for (couple, mag), count in sorted(counts.items())]
+
+
+def spin_array(configs, length: int):
+    """
+Turns an array of configuration integers into a two dimensional array of 1's
+and -1's, with one row per configuration. Column i is the spin at position i,
+as for SpinInteger.
+"""
+    configs = np.asarray(configs, dtype=np.uint64)
+    shifts = np.arange(length - 1, -1, -1, dtype=np.uint64)
+    bits = (configs[:, np.newaxis] >> shifts) & np.uint64(1)
+    return 2 * bits.astype(np.int8) - 1
+
+
+def _is_graph(hamilt, length: int):
+    """
+Whether a Hamiltonian can be enumerated with fastc.g_plots, which is limited to
+graphs of at most _GRAPH_WIDTH spins.
+"""
+    return isinstance(hamilt, hamiltonian.GraphHamiltonian) and length <= _GRAPH_WIDTH
+
+
+def graph_arrays(hamilt: hamiltonian.GraphHamiltonian, length: int):
+    """
+Turns the compiled couplings of a GraphHamiltonian into the arguments of
+fastc.g_plots: a flat dense matrix of couplings, the fields, and the constant
+energy.
+"""
+    indptr, indices, coefs, fields, offset = hamilt.compile(length)
+    couplings = np.zeros((length, length))
+    couplings[np.repeat(np.arange(length), np.diff(indptr)), indices] = coefs
+    return couplings.reshape(-1), np.ascontiguousarray(fields), offset
+
+
+def graph_plots(
+    hamilt: hamiltonian.GraphHamiltonian, length: int, temps, boltzmann, threads
+):
+    """
+Finds the natural logs of the partition function, the energies, the heat
+capacities, and the magnetic susceptibilities of a GraphHamiltonian at several
+temperatures, in C. threads is a number of threads or a fastc.Pool.
+"""
+    temps = np.ascontiguousarray(temps, dtype=np.float64)
+    out = tuple(np.empty_like(temps) for _ in range(4))
+    couplings, fields, offset = graph_arrays(hamilt, length)
+    return fastc.g_plots(couplings, fields, offset, temps, boltzmann, threads, out=out)
+
+
+class BatchedObservable:
+    """
+An observable that finds its values for many configurations at once. The
+function takes a NumPy array of configuration integers and the length of the
+chain, or a two dimensional array of spins from spin_array if as_spins is True,
+and returns an array of values. The C strategies call it on thousands of
+configurations at a time. Other strategies call it on one spin configuration at
+a time, like any other observable.
+"""
+
+    def __init__(self, func, as_spins: bool = False):
+        self._func = func
+        self._as_spins = as_spins
+
+    def batch(self, configs, length: int):
+        """
+Finds the values for an array of configuration integers.
+"""
+        configs = np.frombuffer(configs, dtype=np.uint64)
+        if self._as_spins:
+            return self._func(spin_array(configs, length))
+        return self._func(configs, length)
+
+    def __call__(self, spin):
+        if hasattr(spin, "to_int"):
+            conf = spin.to_int()
+        else:
+            conf = sum(1 << (len(spin) - i - 1) for i, s in enumerate(spin) if s == 1)
+        return float(
+            np.asarray(self.batch(np.array([conf], dtype=np.uint64), len(spin)))[0]
+        )
+
+
+def batched(func=None, as_spins: bool = False):
+    """
+Makes a BatchedObservable out of a function. Can be used as a decorator, with or
+without arguments.
+"""
+    if func is None:
+        return lambda f: BatchedObservable(f, as_spins)
+    return BatchedObservable(func, as_spins)
+
+
+# The observables that CThermoStrategy finds in C, by the names that
+# fastc.p_dos_observe uses. The energy of a PeriodicHamiltonian is also found
+# there.
+NATIVE_OBSERVABLES = {
+    thermo.magnetization: "magnet",
+    spins.SpinConfig.magnetization: "magnet",
+    thermo.abs_magnetization: "abs_magnet",
+    thermo.magnetization2: "magnet2",
+    thermo.magnetization4: "magnet4",
+    thermo.correlation: "correlation",
+    thermo.domain_walls: "walls",
+}
+
+
+class DOSCache(despats.Singleton):
+    """
+Holds the densities of states of periodic chains, so they can be reused with
+different coupling constants, magnetic constants, and Boltzmann constants.
+"""
+
+    def __init__(self):
+        self._dos = {}
+
+    def getdos(self, length: int, threads, symmetric: bool = False):
+        """
+Gets the density of states for a chain, enumerating it if it is not stored.
+threads is either a number of threads or a fastc.Pool. If symmetric is True,
+only one configuration of each set of rotations and spin flips is enumerated.
+The counts are the same either way.
+"""
+        if length not in self._dos:
+            self._dos[length] = fastc.p_dos(length, threads, symmetric)
+        return self._dos[length]
+
+    def setdos(self, length: int, levels):
+        """
+Stores a density of states, such as one merged from chunks.
+"""
+        self._dos[length] = levels
+
+    def clear(self):
+        """
+Forgets all of the stored densities of states.
+"""
+        self._dos.clear()
 
 
 class CThermoStrategy(thermo.ThermoStrategy):
     """
-Calculates values in C. Only partition function is threaded.
+Calculates values in C. The partition function, the energy, and the
+NATIVE_OBSERVABLES of periodic chains come from a cached density of states.
 """
 
     def __init__(self):
         super().__init__()
         self._threads = max(32, 4 + os.cpu_count())
+        self._pool = None
+        self._symmetric = False
 
     def getthreads(self):
         """
@@ -31,11 +234,74 @@ Gets the number of threads.
 """
         return self._threads
 
+    def getpool(self):
+        """
+Gets the thread pool, starting it if it has not been started.
+"""
+        if self._pool is None:
+            self._pool = fastc.Pool(self._threads)
+        return self._pool
+
     def setthreads(self, threads: int):
         """
-Sets the number of threads.
+Sets the number of threads, and replaces the thread pool with one of that size.
+The old pool shuts down once no other thread is using it.
 """
         self._threads = threads
+        self._pool = fastc.Pool(threads)
+
+    def getsymmetry(self):
+        """
+Gets whether densities of states are enumerated up to rotations and spin flips.
+"""
+        return self._symmetric
+
+    def setsymmetry(self, symmetric: bool):
+        """
+Sets whether densities of states are enumerated up to rotations and spin flips.
+This visits about 2 * length times fewer configurations, with the same result.
+"""
+        self._symmetric = symmetric
+
+    def _getdos(self, length):
+        """
+Gets the density of states from the cache.
+"""
+        return DOSCache.getsingleton().getdos(
+            length, self.getpool(), self._symmetric
+        )
+
+    def _native(self, func, hamilt, length, temp, boltzmann):
+        """
+Finds the average and variance of an observable from the density of states, if
+it is the energy of the Hamiltonian or one of NATIVE_OBSERVABLES. The energy of
+a GraphHamiltonian is found by enumerating it in C. Otherwise, returns None.
+"""
+        if _is_graph(hamilt, length) and func == hamilt.energy:
+            _, ens, heats, _ = graph_plots(
+                hamilt, length, [temp], boltzmann, self.getpool()
+            )
+            return ens[0], heats[0] * temp * temp * boltzmann
+        if not isinstance(hamilt, hamiltonian.PeriodicHamiltonian):
+            return None
+        if func == hamilt.energy:
+            name = "energy"
+        else:
+            try:
+                name = NATIVE_OBSERVABLES.get(func)
+            except TypeError:
+                return None
+        if name is None:
+            return None
+        return fastc.p_dos_observe(
+            self._getdos(length),
+            length,
+            name,
+            hamilt.getcoupling(),
+            hamilt.getmagnet(),
+            temp,
+            boltzmann,
+        )
 
     def partition(
         self,
@@ -48,18 +314,43 @@ Sets the number of threads.
 Calculates the partition function.
 """
         if isinstance(hamilt, hamiltonian.PeriodicHamiltonian):
-            return fastc.p_partition(
-                length,
+            return fastc.p_dos_partition(
+                self._getdos(length),
                 hamilt.getcoupling(),
                 hamilt.getmagnet(),
                 temp,
                 boltzmann,
-                self.getthreads(),
             )
+        if _is_graph(hamilt, length):
+            return np.exp(self.log_partition(hamilt, length, temp, boltzmann))
         return thermo.FullCalcStrategy.getsingleton().partition(
             hamilt, length, temp, boltzmann
         )
 
+    def log_partition(
+        self,
+        hamilt: hamiltonian.Hamiltonian,
+        length: int,
+        temp: float,
+        boltzmann: float,
+    ):
+        """
+Calculates the natural log of the partition function.
+"""
+        if isinstance(hamilt, hamiltonian.PeriodicHamiltonian):
+            return fastc.p_dos_log_partition(
+                self._getdos(length),
+                hamilt.getcoupling(),
+                hamilt.getmagnet(),
+                temp,
+                boltzmann,
+            )
+        if _is_graph(hamilt, length):
+            return graph_plots(hamilt, length, [temp], boltzmann, self.getpool())[0][0]
+        return thermo.FullCalcStrategy.getsingleton().log_partition(
+            hamilt, length, temp, boltzmann
+        )
+
     def average(
         self,
         func,
@@ -73,7 +364,23 @@ Calculates the partition function.
         """
 Calculates the average.
 """
+        if not args and not kwargs:
+            native = self._native(func, hamilt, length, temp, boltzmann)
+            if native is not None:
+                return native[0]
         if isinstance(hamilt, hamiltonian.PeriodicHamiltonian):
+            if isinstance(func, BatchedObservable):
+                return fastc.p_average(
+                    lambda confs: np.ascontiguousarray(
+                        func.batch(confs, length), dtype=np.float64
+                    ),
+                    length,
+                    hamilt.getcoupling(),
+                    hamilt.getmagnet(),
+                    temp,
+                    boltzmann,
+                    batch=_BATCH,
+                )
             return fastc.p_average(
                 lambda sp: func(spins.SpinInteger(sp, length)),
                 length,
@@ -99,7 +406,23 @@ Calculates the average.
         """
 Calculates the variance.
 """
+        if not args and not kwargs:
+            native = self._native(func, hamilt, length, temp, boltzmann)
+            if native is not None:
+                return native[1]
         if isinstance(hamilt, hamiltonian.PeriodicHamiltonian):
+            if isinstance(func, BatchedObservable):
+                return fastc.p_variance(
+                    lambda confs: np.ascontiguousarray(
+                        func.batch(confs, length), dtype=np.float64
+                    ),
+                    length,
+                    hamilt.getcoupling(),
+                    hamilt.getmagnet(),
+                    temp,
+                    boltzmann,
+                    batch=_BATCH,
+                )
             return fastc.p_variance(
                 lambda sp: func(spins.SpinInteger(sp, length)),
                 length,
@@ -121,6 +444,8 @@ Calculates the values for the plotter in C. Very parallelized.
     def __init__(self):
         super().__init__()
         self._threads = max(32, 4 + os.cpu_count())
+        self._pool = None
+        self._symmetric = False
 
     def getthreads(self):
         """
@@ -128,11 +453,42 @@ Gets the number of threads.
 """
         return self._threads
 
+    def getpool(self):
+        """
+Gets the thread pool, starting it if it has not been started.
+"""
+        if self._pool is None:
+            self._pool = fastc.Pool(self._threads)
+        return self._pool
+
     def setthreads(self, threads):
         """
-Sets the number of threads.
+Sets the number of threads, and replaces the thread pool with one of that size.
+The old pool shuts down once no other thread is using it.
 """
         self._threads = threads
+        self._pool = fastc.Pool(threads)
+
+    def getsymmetry(self):
+        """
+Gets whether densities of states are enumerated up to rotations and spin flips.
+"""
+        return self._symmetric
+
+    def setsymmetry(self, symmetric: bool):
+        """
+Sets whether densities of states are enumerated up to rotations and spin flips.
+This visits about 2 * length times fewer configurations, with the same result.
+"""
+        self._symmetric = symmetric
+
+    def _getdos(self, length):
+        """
+Gets the density of states from the cache.
+"""
+        return DOSCache.getsingleton().getdos(
+            length, self.getpool(), self._symmetric
+        )
 
     def calc_plot_vals(self, hamilt: hamiltonian.Hamiltonian, length, temps, boltzmann):
         """
@@ -140,15 +496,21 @@ Returns the energies, heat capacities, and magnetic susceptibilities at several
 temperatures.
 """
         if isinstance(hamilt, hamiltonian.PeriodicHamiltonian):
-            return fastc.p_plots(
-                length,
+            temps = np.ascontiguousarray(temps, dtype=np.float64)
+            out = tuple(np.empty_like(temps) for _ in range(3))
+            return fastc.p_dos_plots(
+                self._getdos(length),
                 hamilt.getcoupling(),
                 hamilt.getmagnet(),
-                list(temps),
+                temps,
                 boltzmann,
-                self.getthreads(),
+                out=out,
             )
-        return super().calc_plot_vals(hamilt, length, temps, boltzmann)
+        if _is_graph(hamilt, length):
+            return graph_plots(hamilt, length, temps, boltzmann, self.getpool())[1:]
+        return thermo.SequentialStrategy.getsingleton().calc_plot_vals(
+            hamilt, length, temps, boltzmann
+        )
 
 
 try:
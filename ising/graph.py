@@ -11,6 +11,14 @@ try:
 except ImportError:
     import despats
 
+import bisect
+import collections
+import collections.abc
+import heapq
+import itertools
+import weakref
+import numpy as np
+
 
 class Copyable:
     """
@@ -31,7 +39,21 @@ Returns whether an object is copyable.
         return hasattr(obj, "copy")
 
 
-class Vertex(Copyable):
+class _Owned:
+    """
+Remembers the graphs that index an object, so changing the object in place can
+mark them as changed.
+"""
+
+    def _addowner(self, graph):
+        self.__dict__.setdefault("_owners", weakref.WeakSet()).add(graph)
+
+    def _touchowners(self):
+        for owner in list(self.__dict__.get("_owners", ())):
+            owner.touch()
+
+
+class Vertex(Copyable, _Owned):
     """
 Represents a vertex in a graph.
 """
@@ -48,9 +70,10 @@ Gets the data at a vertex.
 
     def setdata(self, data):
         """
-Sets the data at a vertex.
+Sets the data at a vertex, and marks the graphs that hold it as changed.
 """
         self._data = data
+        self._touchowners()
         return data
 
     def getindex(self):
@@ -87,7 +110,7 @@ Gets the unique index of the vertex.
         return self.getindex()
 
 
-class Edge(Copyable):
+class Edge(Copyable, _Owned):
     """
 Represents an edge in a graph.
 """
@@ -118,23 +141,28 @@ Returns the length of the edge.
 
     def setstart(self, vert):
         """
-Sets the starting node of the edge.
+Sets the starting node of the edge, and marks the graphs that hold it as
+changed.
 """
         self._start = vert
+        self._touchowners()
         return vert
 
     def setend(self, vert):
         """
-Sets the ending node of the edge.
+Sets the ending node of the edge, and marks the graphs that hold it as
+changed.
 """
         self._end = vert
+        self._touchowners()
         return vert
 
     def setlength(self, length):
         """
-Sets the length of the edge.
+Sets the length of the edge, and marks the graphs that hold it as changed.
 """
         self._length = length
+        self._touchowners()
         return length
 
     def getindex(self):
@@ -278,8 +306,16 @@ Makes several vertices.
             return [self.makevertex(d) for d, _ in zip(data, range(nverts))]
         return [self.makevertex(data) for _ in range(nverts)]
 
+    def reserve(self, count: int):
+        """
+Reserves a range of vertex indices for an ArrayGraph, and returns the first.
+"""
+        first = self._index
+        self._index += count
+        return first
+
 
-class EdgeFactory(despats.Singleton):  # pylint: disable=too-few-public-methods
+class EdgeFactory(despats.Singleton):
     """
 Represents an edge factory.
 """
@@ -299,11 +335,31 @@ Makes an edge.
         self._index += 1
         return out
 
+    def reserve(self, count: int):
+        """
+Reserves a range of edge indices for an ArrayGraph, and returns the first.
+"""
+        first = self._index
+        self._index += count
+        return first
+
+
+def _key(item):
+    """
+Returns the index of a vertex or edge, or the item itself otherwise, for
+looking things up in a graph's indices. A vertex or edge equals its index.
+"""
+    if isinstance(item, (Vertex, Edge)):
+        return item.getindex()
+    return item
+
 
 # Base representation.
 class Graph:
     """
-Represents a general graph.
+Represents a general graph. Hash indices from vertex and edge indices, from
+vertices to their edges, and from pairs of ends to edges are kept up to date as
+things are added, so lookups do not scan the whole graph.
 """
 
     def __init__(self, verts, edges):
@@ -315,6 +371,63 @@ Represents a general graph.
             self._edges = []
         else:
             self._edges = edges
+        self._version = 0
+        self._clear_indices()
+
+    def _clear_indices(self):
+        """
+Forgets the indices, so they are built again on the next lookup.
+"""
+        self._vert_index = {}
+        self._edge_index = {}
+        self._incident = {}
+        self._ends = {}
+        self._nverts = 0
+        self._nedges = 0
+
+    def _index_vert(self, vert):
+        vert._addowner(self)
+        self._vert_index.setdefault(_key(vert), []).append(vert)
+
+    def _index_edge(self, edge):
+        edge._addowner(self)
+        self._edge_index.setdefault(edge.getindex(), []).append(edge)
+        start, end = _key(edge.getstart()), _key(edge.getend())
+        self._incident.setdefault(start, []).append(edge)
+        self._ends.setdefault((start, end), []).append(edge)
+        if isinstance(edge, UndirectedEdge) and start != end:
+            self._incident.setdefault(end, []).append(edge)
+            self._ends.setdefault((end, start), []).append(edge)
+
+    def _sync(self):
+        """
+Indexes anything appended to the lists of vertices and edges since the last
+lookup. If the lists shrank, everything is indexed again.
+"""
+        if self._nverts > len(self._verts) or self._nedges > len(self._edges):
+            self._clear_indices()
+        for vert in self._verts[self._nverts :]:
+            self._index_vert(vert)
+        for edge in self._edges[self._nedges :]:
+            self._index_edge(edge)
+        self._nverts = len(self._verts)
+        self._nedges = len(self._edges)
+
+    def getversion(self):
+        """
+Returns a number that changes whenever vertices or edges are added or changed.
+Things built from the graph use it to know when to build again.
+"""
+        return self._version
+
+    def touch(self):
+        """
+Marks the graph as changed, so that the indices are built again. The setters of
+the vertices and edges in the graph call this, but it needs to be called after
+changing them any other way, such as the data of a vertex in place.
+"""
+        self._version += 1
+        self._clear_indices()
 
     def getverts(self):
         """
@@ -326,7 +439,8 @@ Returns the list of vertices.
         """
 Gets a vertex with the specified index.
 """
-        for vert in self.getverts():
+        self._sync()
+        for vert in self._vert_index.get(_key(index), ()):
             if vert.getindex() == index or vert == index:
                 return vert
         return None
@@ -341,8 +455,9 @@ Returns the list of edges.
         """
 Gets an edge with a specified start and end indices, or a specified index.
 """
+        self._sync()
         if hasattr(index, "__iter__"):
-            for edg in self.getedges():
+            for edg in self._ends.get((_key(index[0]), _key(index[1])), ()):
                 if isinstance(edg, UndirectedEdge):
                     if (
                         (edg.getstart() == index[0] and edg.getend() == index[1])
@@ -359,99 +474,609 @@ Gets an edge with a specified start and end indices, or a specified index.
                     ):
                         return edg
         else:
-            for edg in self.getedges():
+            for edg in self._edge_index.get(_key(index), ()):
                 if edg.getindex() == index:
                     return edg
         return None
 
+    def getincident(self, vert):
+        """
+Returns the edges that can be traversed from a vertex, in the order they were
+added.
+"""
+        self._sync()
+        return [
+            edg for edg in self._incident.get(_key(vert), ()) if edg.cantraverse(vert)
+        ]
+
     def addverts(self, vert):
         """
 Can do single vertices or a collection of vertices.
 """
+        self._sync()
         if hasattr(vert, "__iter__"):
             assert all(map(lambda x: isinstance(x, Vertex), vert))
             for ver in vert:
                 self._verts.append(ver)
+                self._index_vert(ver)
         else:
             self._verts.append(vert)
+            self._index_vert(vert)
+        self._nverts = len(self._verts)
+        self._version += 1
         return self._verts
 
     def addedges(self, edge):
         """
 Can do single edges or a collection of edges.
 """
+        self._sync()
         if hasattr(edge, "__iter__"):
             assert all(map(lambda x: isinstance(x, Edge), edge))
             for edg in edge:
                 self._edges.append(edg)
+                self._index_edge(edg)
         elif isinstance(edge, Edge):
             self._edges.append(edge)
+            self._index_edge(edge)
+        self._nedges = len(self._edges)
+        self._version += 1
         return self._edges
 
     def hasvertex(self, vert):
         """
 Returns whether a vertex is in the graph.
 """
-        return vert in self.getverts()
+        self._sync()
+        return any(ver == vert for ver in self._vert_index.get(_key(vert), ()))
 
     def hasedge(self, edge):
         """
 Returns whether an edge is in the graph.
 """
-        return edge in self.getedges()
+        self._sync()
+        if isinstance(edge, Edge):
+            cands = self._ends.get(
+                (_key(edge.getstart()), _key(edge.getend())), ()
+            )
+        else:
+            cands = self._edge_index.get(_key(edge), ())
+        return any(edg == edge for edg in cands)
 
     def getneighbors(self, vert):
         """
 Returns the neighbors of a vertex.
 """
-        neigh = []
-        for edg in self.getedges():
-            if edg.cantraverse(vert):
-                neigh.append(
-                    tuple(list(edg.traverse(vert)) + [isinstance(edg, UndirectedEdge)])
-                )
-        return neigh
+        return [
+            tuple(list(edg.traverse(vert)) + [isinstance(edg, UndirectedEdge)])
+            for edg in self.getincident(vert)
+        ]
 
     def __str__(self):
         return "{" + str(self.getedges()) + ", " + str(self.getverts()) + "}"
 
 
-def dijkstra(graph: Graph, start: Vertex, end: Vertex):
+def _scalar(val):
     """
-Dijkstra's shortest path. Useful for testing the graph implementation.
-"""
-    visited = {start: (0, None)}
-    openset = [(start, n) for n in graph.getneighbors(start)]
-
-    while len(openset) > 0:
-        vert = openset.pop()
-        dist = visited[vert[0]][0] + vert[1][1]
-        if (vert[1][0] in visited and visited[vert[1][0]][0] > dist) or vert[1][
-            0
-        ] not in visited:
-            # Update if vertex is new, or if the distance it has is shorter.
-            visited[vert[1][0]] = (dist, vert[0])
-            # Only generate neighbors if it was added.
-            openset = openset + [
-                (vert[1][0], n) for n in graph.getneighbors(vert[1][0])
-            ]
-    if end in visited:
-        verts = []
-        edges = []
-        curr = end
-        while curr != start:
-            verts.append(curr)
-            edges.append(
-                graph.getedge(
-                    (
-                        visited[curr][1],
-                        curr,
-                        visited[curr][0] - visited[visited[curr][1]][0],
-                    )
-                )
+Turns NumPy scalars into Python values.
+"""
+    if isinstance(val, np.generic):
+        return val.item()
+    return val
+
+
+class VertexView(Vertex):
+    """
+A vertex of an ArrayGraph. It holds only the graph and its position there, and
+reads and writes the graph's arrays.
+"""
+
+    __slots__ = ("_graph", "_pos")
+
+    def __init__(self, graph, pos):  # pylint: disable=super-init-not-called
+        self._graph = graph
+        self._pos = pos
+
+    @property
+    def _data(self):
+        return _scalar(self._graph._vdata[self._pos])
+
+    @_data.setter
+    def _data(self, data):
+        self._graph._vdata[self._pos] = data
+        self._graph.touch()
+
+    @property
+    def _index(self):
+        return self._graph._vert_index_at(self._pos)
+
+    def _setindex(self, index: int):
+        raise TypeError("The vertices of an ArrayGraph can not be reindexed.")
+
+
+class _EdgeViewMixin:
+    """
+Reads and writes an edge of an ArrayGraph through its arrays.
+"""
+
+    __slots__ = ("_graph", "_pos")
+
+    def __init__(self, graph, pos):
+        self._graph = graph
+        self._pos = pos
+
+    @property
+    def _start(self):
+        return VertexView(self._graph, int(self._graph._starts[self._pos]))
+
+    @_start.setter
+    def _start(self, vert):
+        self._graph._starts[self._pos] = self._graph._vert_pos(vert)
+        self._graph.touch()
+
+    @property
+    def _end(self):
+        return VertexView(self._graph, int(self._graph._ends[self._pos]))
+
+    @_end.setter
+    def _end(self, vert):
+        self._graph._ends[self._pos] = self._graph._vert_pos(vert)
+        self._graph.touch()
+
+    @property
+    def _length(self):
+        return _scalar(self._graph._lengths[self._pos])
+
+    @_length.setter
+    def _length(self, length):
+        self._graph._lengths[self._pos] = length
+        self._graph.touch()
+
+    @property
+    def _index(self):
+        return self._graph._edge_index_at(self._pos)
+
+    def _setindex(self, index):
+        raise TypeError("The edges of an ArrayGraph can not be reindexed.")
+
+
+class EdgeView(_EdgeViewMixin, Edge):
+    """
+A directed edge of an ArrayGraph.
+"""
+
+    __slots__ = ()
+
+
+class UndirectedEdgeView(_EdgeViewMixin, UndirectedEdge):
+    """
+An undirected edge of an ArrayGraph.
+"""
+
+    __slots__ = ()
+
+
+class _Views(collections.abc.Sequence):
+    """
+A read only list of the vertices or edges of an ArrayGraph, made as they are
+asked for.
+"""
+
+    def __init__(self, count, make):
+        self._count = count
+        self._make = make
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, pos):
+        if isinstance(pos, slice):
+            return [self._make(i) for i in range(*pos.indices(self._count))]
+        if pos < 0:
+            pos += self._count
+        if not 0 <= pos < self._count:
+            raise IndexError("Graph index out of range.")
+        return self._make(pos)
+
+
+class ArrayGraph(Graph):
+    """
+A graph held in NumPy arrays: the data of each vertex, the positions of the
+ends of each edge, the lengths, and whether each edge is directed. Vertices and
+edges are given out as views that have the same methods as Vertex and Edge, and
+changes through them go into the arrays. Ranges of indices are reserved from
+the factories, so the views have indices like any other vertex or edge.
+"""
+
+    def __init__(self, data, starts=(), ends=(), lengths=1, directed=False):
+        """
+data is the number of vertices, whose data are then 0, 1, 2, ..., or an array of
+the data. starts and ends are the positions of the ends of each edge in the
+vertex array. lengths and directed are single values or arrays.
+"""
+        super().__init__([], [])
+        self._vdata = np.zeros(0, dtype=np.int64)
+        self._vblocks = []
+        self._starts = np.zeros(0, dtype=np.int32)
+        self._ends = np.zeros(0, dtype=np.int32)
+        self._lengths = np.zeros(0)
+        self._directed = np.zeros(0, dtype=bool)
+        self._eblocks = []
+        self._adjacency = None
+        self.addvertarray(data)
+        self.addedgearray(starts, ends, lengths, directed)
+
+    @staticmethod
+    def _append(old, new):
+        if len(old) == 0:
+            return new.copy()
+        return np.concatenate([old, new.astype(np.result_type(old, new))])
+
+    def addvertarray(self, data):
+        """
+Adds vertices in bulk, and returns the position of the first. data is a number
+of vertices, whose data are their positions, or an array of their data.
+"""
+        first = len(self._vdata)
+        if np.ndim(data) == 0:
+            data = np.arange(first, first + int(data), dtype=np.int64)
+        data = np.asarray(data)
+        if first + len(data) > np.iinfo(np.int32).max:
+            self._starts = self._starts.astype(np.int64)
+            self._ends = self._ends.astype(np.int64)
+        self._vblocks.append(
+            (first, VertexFactory.getsingleton().reserve(len(data)), len(data))
+        )
+        self._vdata = self._append(self._vdata, data)
+        self.touch()
+        return first
+
+    def addedgearray(self, starts, ends, lengths=1, directed=False):
+        """
+Adds edges in bulk between the vertices at the given positions, and returns
+the position of the first.
+"""
+        first = len(self._starts)
+        starts = np.asarray(starts, dtype=self._starts.dtype).reshape(-1)
+        ends = np.asarray(ends, dtype=self._ends.dtype).reshape(-1)
+        if len(starts) != len(ends):
+            raise ValueError("There must be as many starts as ends.")
+        if len(starts) and (
+            min(starts.min(), ends.min()) < 0
+            or max(starts.max(), ends.max()) >= len(self._vdata)
+        ):
+            raise IndexError("Edges must join vertices in the graph.")
+        count = len(starts)
+        self._eblocks.append(
+            (first, EdgeFactory.getsingleton().reserve(count), count)
+        )
+        self._starts = self._append(self._starts, starts)
+        self._ends = self._append(self._ends, ends)
+        self._lengths = self._append(
+            self._lengths, np.broadcast_to(np.asarray(lengths), (count,))
+        )
+        self._directed = self._append(
+            self._directed, np.broadcast_to(np.asarray(directed, dtype=bool), (count,))
+        )
+        self.touch()
+        return first
+
+    def getarrays(self):
+        """
+Returns the arrays that hold the graph: the vertex data, the positions of the
+starts and ends of the edges, their lengths, and whether each is directed.
+Changing them in place needs a call to touch.
+"""
+        return self._vdata, self._starts, self._ends, self._lengths, self._directed
+
+    def getpairarrays(self):
+        """
+Returns the same pairs as GraphHamiltonian.getpairs as three arrays: the data
+of the first vertex, the data of the second, and the coefficient.
+"""
+        data = self._vdata
+        undirected = ~self._directed
+        twice = undirected & (self._starts != self._ends)
+        coefs = np.where(undirected, -self._lengths / 2, -self._lengths)
+        return (
+            np.concatenate([data[self._starts], data[self._ends[twice]]]),
+            np.concatenate([data[self._ends], data[self._starts[twice]]]),
+            np.concatenate([coefs, coefs[twice]]),
+        )
+
+    @staticmethod
+    def _index_at(blocks, pos):
+        block = blocks[bisect.bisect_right(blocks, (pos, float("inf"))) - 1]
+        return block[1] + pos - block[0]
+
+    @staticmethod
+    def _pos_of(blocks, index):
+        if isinstance(index, bool) or not isinstance(index, (int, np.integer)):
+            return None
+        for first, base, count in blocks:
+            if base <= index < base + count:
+                return first + index - base
+        return None
+
+    def _vert_index_at(self, pos):
+        return self._index_at(self._vblocks, pos)
+
+    def _edge_index_at(self, pos):
+        return self._index_at(self._eblocks, pos)
+
+    def _vert_pos(self, vert):
+        """
+Finds the position of a vertex in the arrays, from a view or an index.
+"""
+        if isinstance(vert, VertexView) and vert._graph is self:
+            return vert._pos
+        pos = self._pos_of(self._vblocks, _key(vert))
+        if pos is None:
+            raise ValueError("The vertex is not in this graph.")
+        return pos
+
+    def _adjacent(self):
+        """
+Returns the edges that can be traversed from each vertex, as row pointers and
+edge positions in compressed sparse rows, in the order the edges were added.
+"""
+        if self._adjacency is None:
+            twice = (~self._directed) & (self._starts != self._ends)
+            rows = np.concatenate([self._starts, self._ends[twice]])
+            edges = np.concatenate(
+                [
+                    np.arange(len(self._starts), dtype=np.int64),
+                    np.flatnonzero(twice),
+                ]
+            )
+            order = np.lexsort((edges, rows))
+            indptr = np.zeros(len(self._vdata) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(rows, minlength=len(self._vdata)), out=indptr[1:])
+            self._adjacency = (indptr, edges[order])
+        return self._adjacency
+
+    def getadjacency(self):
+        """
+Returns the edges that can be traversed from each vertex, as row pointers and
+the positions of the edges, in compressed sparse rows.
+"""
+        return self._adjacent()
+
+    def getposition(self, vert):
+        """
+Returns the position of a vertex in the arrays, from the vertex or its index.
+"""
+        return self._vert_pos(vert)
+
+    def _make_vert(self, pos):
+        return VertexView(self, pos)
+
+    def _make_edge(self, pos):
+        if self._directed[pos]:
+            return EdgeView(self, pos)
+        return UndirectedEdgeView(self, pos)
+
+    def touch(self):
+        """
+Marks the graph as changed.
+"""
+        self._version += 1
+        self._adjacency = None
+
+    def getverts(self):
+        """
+Returns a read only list of views of the vertices.
+"""
+        return _Views(len(self._vdata), self._make_vert)
+
+    def getvert(self, index):
+        """
+Gets a vertex with the specified index.
+"""
+        pos = self._pos_of(self._vblocks, _key(index))
+        if pos is None:
+            return None
+        return VertexView(self, pos)
+
+    def getedges(self):
+        """
+Returns a read only list of views of the edges.
+"""
+        return _Views(len(self._starts), self._make_edge)
+
+    def getedge(self, index, cutoff=1e-6):
+        """
+Gets an edge with a specified start and end, or a specified index.
+"""
+        if not hasattr(index, "__iter__"):
+            pos = self._pos_of(self._eblocks, _key(index))
+            return None if pos is None else self._make_edge(pos)
+        try:
+            start = self._vert_pos(index[0])
+            end = self._vert_pos(index[1])
+        except ValueError:
+            return None
+        indptr, edges = self._adjacent()
+        for pos in edges[indptr[start] : indptr[start + 1]]:
+            other = self._ends[pos] if self._starts[pos] == start else self._starts[pos]
+            if other == end and (
+                len(index) != 3 or abs(self._lengths[pos] - index[2]) < cutoff
+            ):
+                return self._make_edge(int(pos))
+        return None
+
+    def getincident(self, vert):
+        """
+Returns the edges that can be traversed from a vertex, in the order they were
+added.
+"""
+        try:
+            pos = self._vert_pos(vert)
+        except ValueError:
+            return []
+        indptr, edges = self._adjacent()
+        return [self._make_edge(int(edg)) for edg in edges[indptr[pos] : indptr[pos + 1]]]
+
+    def addverts(self, vert):
+        raise TypeError("Add vertices to an ArrayGraph with addvertarray.")
+
+    def addedges(self, edge):
+        raise TypeError("Add edges to an ArrayGraph with addedgearray.")
+
+    def hasvertex(self, vert):
+        """
+Returns whether a vertex is in the graph.
+"""
+        if isinstance(vert, VertexView):
+            return vert._graph is self
+        found = self.getvert(_key(vert))
+        return found is not None and found == vert
+
+    def hasedge(self, edge):
+        """
+Returns whether an edge is in the graph.
+"""
+        if isinstance(edge, (EdgeView, UndirectedEdgeView)) and edge._graph is self:
+            return True
+        if isinstance(edge, Edge):
+            return any(
+                edg == edge for edg in self.getincident(edge.getstart())
             )
-            curr = visited[curr][1]
+        return self.getedge(_key(edge)) is not None
 
-        print(Graph(verts, edges))
-        return Graph(verts, edges)
-    return None
+    def __str__(self):
+        return (
+            f"{{ArrayGraph with {len(self._vdata)} vertices "
+            + f"and {len(self._starts)} edges}}"
+        )
+
+
+def dijkstra(graph: Graph, start: Vertex, end: Vertex):
+    """
+Dijkstra's shortest path, with a binary heap. Returns a graph of the vertices
+on the path after the start, from the end back, and the edges between them, or
+None if the end can not be reached.
+"""
+    dists = {_key(start): 0}
+    back = {}
+    done = set()
+    # The counter breaks ties, so vertices are never compared.
+    count = itertools.count()
+    heap = [(0, next(count), start)]
+    while heap:
+        dist, _, vert = heapq.heappop(heap)
+        if _key(vert) in done:
+            continue
+        done.add(_key(vert))
+        if _key(vert) == _key(end):
+            break
+        for edg in graph.getincident(vert):
+            other, length = edg.traverse(vert)
+            if _key(other) not in dists or dist + length < dists[_key(other)]:
+                dists[_key(other)] = dist + length
+                back[_key(other)] = (vert, edg)
+                heapq.heappush(heap, (dist + length, next(count), other))
+    if _key(end) not in done:
+        return None
+    verts = []
+    edges = []
+    curr = end
+    while _key(curr) != _key(start):
+        verts.append(curr)
+        curr, edg = back[_key(curr)]
+        edges.append(edg)
+    return Graph(verts, edges)
+
+
+def _rows(graph: Graph):
+    """
+Lists the neighbors of each vertex by position in getverts, with the lengths of
+the edges to them. Returns the vertices, a function from a vertex to its
+position, and the lists.
+"""
+    verts = graph.getverts()
+    if isinstance(graph, ArrayGraph):
+        _, starts, ends, lengths, _ = graph.getarrays()
+        indptr, edges = graph.getadjacency()
+        rows = np.repeat(np.arange(len(verts)), np.diff(indptr))
+        others = np.where(starts[edges] == rows, ends[edges], starts[edges])
+        neighbors = [
+            list(zip(others[a:b].tolist(), lengths[edges[a:b]].tolist()))
+            for a, b in zip(indptr[:-1].tolist(), indptr[1:].tolist())
+        ]
+        return verts, graph.getposition, neighbors
+    positions = {}
+    for pos, vert in enumerate(verts):
+        positions.setdefault(_key(vert), pos)
+    neighbors = []
+    for vert in verts:
+        row = []
+        for edg in graph.getincident(vert):
+            other, length = edg.traverse(vert)
+            if _key(other) in positions:
+                row.append((positions[_key(other)], length))
+        neighbors.append(row)
+    return verts, lambda vert: positions[_key(vert)], neighbors
+
+
+def _bfs(neighbors, source, out):
+    """
+Fills out with the number of edges from the source to each vertex.
+"""
+    out[source] = 0
+    queue = collections.deque([source])
+    while queue:
+        pos = queue.popleft()
+        dist = out[pos] + 1
+        for other, _ in neighbors[pos]:
+            if dist < out[other]:
+                out[other] = dist
+                queue.append(other)
+
+
+def _heap_search(neighbors, source, out):
+    """
+Fills out with the length of the shortest path from the source to each vertex.
+"""
+    out[source] = 0
+    heap = [(0, source)]
+    while heap:
+        dist, pos = heapq.heappop(heap)
+        if dist > out[pos]:
+            continue
+        for other, length in neighbors[pos]:
+            if dist + length < out[other]:
+                out[other] = dist + length
+                heapq.heappush(heap, (dist + length, other))
+
+
+def distances(graph: Graph, sources, hops: bool = False):
+    """
+Finds the shortest distances from each of several vertices to every vertex.
+Returns an array with a row for each source and a column for each vertex, in
+the order of getverts, with inf where there is no path. If hops is True, or
+every edge has length 1, distances are numbers of edges and come from a
+breadth first search. Otherwise, they come from Dijkstra's algorithm, so no
+length may be negative.
+"""
+    verts, position, neighbors = _rows(graph)
+    unit = hops or all(length == 1 for row in neighbors for _, length in row)
+    if not unit and any(length < 0 for row in neighbors for _, length in row):
+        raise ValueError("Shortest paths need lengths that are not negative.")
+    out = np.full((len(sources), len(verts)), np.inf)
+    for row, source in enumerate(sources):
+        dists = [np.inf] * len(verts)
+        if unit:
+            _bfs(neighbors, position(source), dists)
+        else:
+            _heap_search(neighbors, position(source), dists)
+        out[row] = dists
+    return out
+
+
+def all_distances(graph: Graph, hops: bool = False):
+    """
+Finds the shortest distances between every pair of vertices, as a square array
+in the order of getverts. See distances.
+"""
+    return distances(graph, graph.getverts(), hops)
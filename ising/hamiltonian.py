@@ -16,6 +16,25 @@ except ImportError:
     import spins
     import graph
 
+import numpy as np
+
+
+def spin_rows(configs, length: int = None):
+    """
+Turns configurations into a two dimensional array of 1's and -1's, with one row
+per configuration. configs is either an array of configuration integers, which
+needs the length, or already a two dimensional array of spins. Column i is the
+spin at position i, as for SpinInteger.
+"""
+    configs = np.asarray(configs)
+    if configs.ndim == 2:
+        return configs
+    if length is None:
+        raise ValueError("The length is needed for configuration integers.")
+    shifts = np.arange(length - 1, -1, -1, dtype=np.uint64)
+    bits = (configs.astype(np.uint64)[:, np.newaxis] >> shifts) & np.uint64(1)
+    return 2 * bits.astype(np.int8) - 1
+
 
 class Hamiltonian:
     """
@@ -28,6 +47,33 @@ Returns the energy of a configuration under the hamiltonian.
 """
         raise NotImplementedError
 
+    def energy_batch(self, configs, length: int = None):
+        """
+Returns the energies of many configurations as an array of doubles. configs is
+either an array of configuration integers, which needs the length, or a two
+dimensional array of 1's and -1's with one row per configuration. This calls
+energy on each configuration. Subclasses find them all at once.
+"""
+        configs = np.asarray(configs)
+        if configs.ndim == 2:
+            spin_list = (spins.SpinMatrix(row.tolist()) for row in configs)
+        elif length is None:
+            raise ValueError("The length is needed for configuration integers.")
+        else:
+            spin_list = (spins.SpinInteger(int(conf), length) for conf in configs)
+        return np.fromiter(
+            (self.energy(spin) for spin in spin_list), dtype=np.float64, count=len(configs)
+        )
+
+    def delta_energy(self, spin: spins.SpinConfig, index: int):
+        """
+Returns the change in energy from flipping one spin. This flips a copy and finds
+both energies. Subclasses only look at the neighbors of the spin.
+"""
+        flipped = spins.SpinMatrix(list(spin))
+        flipped[index] = -flipped[index]
+        return self.energy(flipped) - self.energy(spin)
+
     def temperature(self, spin: spins.SpinConfig, boltzmann=constants.BOLTZMANN_K):
         """
 Finds E/k.
@@ -92,6 +138,30 @@ Find the raw energy of a spin configuration.
             spin[i - 1] * spin[i] for i in range(len(spin))
         ) + self.getmagnet() * sum(spin)
 
+    def delta_energy(self, spin: spins.SpinConfig, index: int):
+        """
+Returns the change in energy from flipping one spin.
+"""
+        length = len(spin)
+        index %= length
+        if length == 1:
+            # The spin is its own neighbor, so only the field changes.
+            return -2 * spin[index] * self.getmagnet()
+        neighbors = spin[index - 1] + spin[(index + 1) % length]
+        return (
+            -2 * spin[index] * (-self.getcoupling() * neighbors + self.getmagnet())
+        )
+
+    def energy_batch(self, configs, length: int = None):
+        """
+Returns the energies of many configurations as an array of doubles.
+"""
+        rows = spin_rows(configs, length)
+        couple = (rows * np.roll(rows, 1, axis=1)).sum(axis=1)
+        return -self.getcoupling() * couple + self.getmagnet() * rows.sum(axis=1).astype(
+            np.float64
+        )
+
 
 # Non-periodic boundary condition.
 class NPHamiltonian(ConstantHamiltonian):
@@ -104,6 +174,31 @@ Represents a Hamiltonian with a non-periodic boundary condition.
             spin[i] * spin[i + 1] for i in range(len(spin) - 1)
         ) + self.getmagnet() * sum(spin)
 
+    def delta_energy(self, spin: spins.SpinConfig, index: int):
+        """
+Returns the change in energy from flipping one spin.
+"""
+        length = len(spin)
+        index %= length
+        neighbors = 0
+        if index > 0:
+            neighbors += spin[index - 1]
+        if index < length - 1:
+            neighbors += spin[index + 1]
+        return (
+            -2 * spin[index] * (-self.getcoupling() * neighbors + self.getmagnet())
+        )
+
+    def energy_batch(self, configs, length: int = None):
+        """
+Returns the energies of many configurations as an array of doubles.
+"""
+        rows = spin_rows(configs, length)
+        couple = (rows[:, :-1] * rows[:, 1:]).sum(axis=1)
+        return -self.getcoupling() * couple + self.getmagnet() * rows.sum(axis=1).astype(
+            np.float64
+        )
+
 
 # Generalized boundary condition.
 class GraphHamiltonian(Hamiltonian):
@@ -119,6 +214,7 @@ mags here is either a list of magnet constants, or a single constant.
 """
         self._graph = conns
         self._mags = mags
+        self._compiled = None
 
     def getconns(self):
         """
@@ -128,7 +224,7 @@ Gets the underlying graph.
 
     def getmagnet(self):
         """
-Gets the list of magnetization strengths
+Gets the list of magnetization strengths. Call touch after changing it in place.
 """
         return self._mags
 
@@ -137,32 +233,161 @@ Gets the list of magnetization strengths
 Sets the list of magnetization strengths.
 """
         self._mags = mags
+        self._compiled = None
         return mags
 
-    def energy(self, spin: spins.SpinConfig):
-        couple = 0
+    def touch(self):
+        """
+Forgets the compiled couplings, so they are built again. Changes to the graph
+are found on their own, but changes to the magnet constants in place are not.
+"""
+        self._compiled = None
+
+    def getpairs(self):
+        """
+Lists the pairs of spin indices that are coupled, with the coefficient of the
+product of each pair. The graph is walked the same way as in energy, so an
+undirected edge is listed from both ends with half of its length.
+"""
+        pairs = []
         for vert in self.getconns().getverts():
-            neigh = self.getconns().getneighbors(vert)
-            print(neigh)
-            for nei in neigh:
-                # Undirected edges end up being double counted. Don't do that.
-                if nei[2]:
-                    couple += (
-                        -nei[1] / 2 * (spin[vert.getdata()] * spin[nei[0].getdata()])
-                    )
-                else:
-                    couple += -nei[1] * (spin[vert.getdata()] * spin[nei[0].getdata()])
+            for nei in self.getconns().getneighbors(vert):
+                coef = -nei[1] / 2 if nei[2] else -nei[1]
+                pairs.append((vert.getdata(), nei[0].getdata(), coef))
+        return pairs
 
+    def _compile(self, length: int):
+        """
+Builds and caches the compiled couplings, along with the row of each coupling.
+Graphs with getpairarrays, such as graph.ArrayGraph, are compiled without
+making a vertex or edge.
+"""
+        conns = self.getconns()
+        stamp = (
+            length,
+            conns.getversion(),
+            len(conns.getverts()),
+            len(conns.getedges()),
+        )
+        if self._compiled is not None and self._compiled[0] == stamp:
+            return self._compiled[1]
+        if hasattr(conns, "getpairarrays"):
+            firsts, seconds, coefs = conns.getpairarrays()
+        else:
+            pairs = self.getpairs()
+            firsts = [pair[0] for pair in pairs]
+            seconds = [pair[1] for pair in pairs]
+            coefs = [pair[2] for pair in pairs]
+        firsts = np.asarray(firsts, dtype=np.int64) % length
+        seconds = np.asarray(seconds, dtype=np.int64) % length
+        coefs = np.asarray(coefs, dtype=np.float64)
+        # The product of a spin with itself is always 1.
+        same = firsts == seconds
+        offset = float(coefs[same].sum())
+        rows = np.concatenate([firsts[~same], seconds[~same]])
+        cols = np.concatenate([seconds[~same], firsts[~same]])
+        vals = np.concatenate([coefs[~same], coefs[~same]])
+        # Sort by row, then column, and add up couplings between the same spins.
+        order = np.lexsort((cols, rows))
+        rows, cols, vals = rows[order], cols[order], vals[order]
+        if len(rows) > 0:
+            new = np.ones(len(rows), dtype=bool)
+            new[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+            heads = np.flatnonzero(new)
+            rows, cols, vals = rows[heads], cols[heads], np.add.reduceat(vals, heads)
         if hasattr(self.getmagnet(), "__iter__"):
-            try:
-                mag = sum(spin[i] * self.getmagnet()[i] for i in range(len(spin)))
-            except Exception as exc:
+            fields = list(self.getmagnet())
+            if len(fields) < length:
                 raise Exception(
                     "The number of magnet constants needs to"
                     + " be the same as the number of spins."
-                ) from exc
+                )
+            fields = np.array(fields[:length], dtype=np.float64)
+        else:
+            fields = np.full(length, self.getmagnet(), dtype=np.float64)
+        indptr = np.zeros(length + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=length), out=indptr[1:])
+        compiled = {
+            "sparse": (indptr, cols, vals, fields, offset),
+            "rows": rows,
+        }
+        self._compiled = (stamp, compiled)
+        return compiled
+
+    def compile(self, length: int):
+        """
+Compiles the couplings for a number of spins into compressed sparse rows. Returns
+the row pointers, the index of the other spin of each coupling, the couplings,
+the field on each spin, and the energy that does not depend on the spins, from
+spins coupled to themselves. Each coupling is stored in the rows of both of its
+spins, so the energy is half the sum over every stored coupling of it times both
+spins, plus the fields times the spins, plus the constant. These are kept until
+the graph changes or the field is set.
+"""
+        return self._compile(length)["sparse"]
+
+    def getlocal(self, length: int):
+        """
+Gets the couplings of each spin to the others, and the field on each spin, for
+a number of spins. Returns a list with a list of (index, coupling) pairs for
+each spin, and a list of the fields. A spin coupled to itself is left out,
+since flipping it does not change that term. These are made from the compiled
+couplings the first time they are needed, and kept with them.
+"""
+        compiled = self._compile(length)
+        if "local" not in compiled:
+            indptr, indices, coefs, fields, _ = compiled["sparse"]
+            compiled["local"] = (
+                [
+                    list(zip(indices[a:b].tolist(), coefs[a:b].tolist()))
+                    for a, b in zip(indptr[:-1], indptr[1:])
+                ],
+                fields.tolist(),
+            )
+        return compiled["local"]
+
+    def delta_energy(self, spin: spins.SpinConfig, index: int):
+        """
+Returns the change in energy from flipping one spin, from the couplings to its
+neighbors.
+"""
+        neighbors, fields = self.getlocal(len(spin))
+        index %= len(spin)
+        field = fields[index]
+        for other, coup in neighbors[index]:
+            field += coup * spin[other]
+        return -2 * spin[index] * field
+
+    def energy_batch(self, configs, length: int = None):
+        """
+Returns the energies of many configurations as an array of doubles.
+"""
+        vals = spin_rows(configs, length).astype(np.float64)
+        compiled = self._compile(vals.shape[1])
+        _, indices, coefs, fields, offset = compiled["sparse"]
+        return (
+            0.5 * ((vals[:, compiled["rows"]] * vals[:, indices]) @ coefs)
+            + vals @ fields
+            + offset
+        )
+
+    def energy(self, spin: spins.SpinConfig):
+        """
+Finds the energy of a spin configuration from the compiled couplings.
+"""
+        compiled = self._compile(len(spin))
+        _, indices, coefs, fields, offset = compiled["sparse"]
+        if hasattr(spin, "to_int"):
+            # Unpack the bits of the integer, which may be longer than 64 bits.
+            width = (len(spin) + 7) // 8
+            bits = np.unpackbits(
+                np.frombuffer(spin.to_int().to_bytes(width, "big"), dtype=np.uint8)
+            )
+            vals = 2 * bits[8 * width - len(spin) :].astype(np.int8) - 1
         else:
-            mag = self.getmagnet() * sum(spin)
-        print(couple)
-        print(mag)
-        return couple + mag
+            vals = np.fromiter(spin, dtype=np.float64, count=len(spin))
+        return float(
+            0.5 * np.dot(coefs, vals[compiled["rows"]] * vals[indices])
+            + np.dot(fields, vals)
+            + offset
+        )
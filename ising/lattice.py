@@ -0,0 +1,229 @@
+#!/usr/bin/python3
+
+"""
+ising.lattice
+
+Builds Hamiltonians on regular lattices. The bonds are made with array
+operations on the positions of the cells, and held in a graph.ArrayGraph, so
+no vertex or edge objects are made. Each bond adds -J s_i s_j to the energy,
+and each site adds h s_i, as for the one dimensional Hamiltonians.
+"""
+
+try:
+    from . import hamiltonian
+    from . import graph
+except ImportError:
+    import hamiltonian
+    import graph
+
+import numpy as np
+
+# The bonds of each lattice, as (first site in the cell, second site in the
+# cell, offset to the cell of the second site).
+CHAIN = [(0, 0, (1,))]
+SQUARE = [(0, 0, (0, 1)), (0, 0, (1, 0))]
+TRIANGULAR = SQUARE + [(0, 0, (1, 1))]
+# A brick wall: site 0 of a cell is joined to site 1 of its own cell, the cell
+# to its left, and the cell above.
+HONEYCOMB = [(0, 1, (0, 0)), (0, 1, (0, -1)), (0, 1, (-1, 0))]
+CUBIC = [(0, 0, (0, 0, 1)), (0, 0, (0, 1, 0)), (0, 0, (1, 0, 0))]
+
+
+class LatticeHamiltonian(hamiltonian.GraphHamiltonian):
+    """
+A GraphHamiltonian made by build. It remembers how the lattice was made, so
+strategies can use its structure, as long as the graph has not been changed.
+"""
+
+    def __init__(self, conns, mags, shape, kinds, basis, coupling, periodic):
+        super().__init__(conns, mags)
+        self._shape = tuple(int(size) for size in shape)
+        self._kinds = list(kinds)
+        self._basis = basis
+        self._coupling = coupling
+        self._periodic = tuple(
+            np.broadcast_to(np.asarray(periodic, dtype=bool), (len(self._shape),))
+        )
+        self._version = conns.getversion()
+
+    def getshape(self):
+        """
+Gets the number of cells along each axis.
+"""
+        return self._shape
+
+    def getkinds(self):
+        """
+Gets the kinds of bonds out of each cell.
+"""
+        return self._kinds
+
+    def getbasis(self):
+        """
+Gets the number of sites in each cell.
+"""
+        return self._basis
+
+    def getcoupling(self):
+        """
+Gets the couplings the lattice was made with, as an array.
+"""
+        return self._coupling
+
+    def getperiodic(self):
+        """
+Gets whether each axis is periodic.
+"""
+        return self._periodic
+
+    def isintact(self):
+        """
+Whether the graph is still the one that was built.
+"""
+        return self.getconns().getversion() == self._version
+
+    def getuniform(self):
+        """
+Gets the coupling for each kind of bond and the magnetic constant, if each is
+the same everywhere and the graph is intact, or None otherwise.
+"""
+        if not self.isintact():
+            return None
+        coupling = self._coupling.reshape(
+            self._coupling.shape + (1,) * (1 + len(self._shape) - self._coupling.ndim)
+        )
+        coupling = np.broadcast_to(coupling, (len(self._kinds),) + coupling.shape[1:])
+        coupling = coupling.reshape(len(self._kinds), -1)
+        magnet = np.asarray(self.getmagnet(), dtype=np.float64).reshape(-1)
+        if np.any(coupling != coupling[:, :1]) or np.any(magnet != magnet[0]):
+            return None
+        return tuple(float(coup) for coup in coupling[:, 0]), float(magnet[0])
+
+
+def bonds(shape, kinds, basis: int = 1, periodic=True):
+    """
+Finds the bonds of a lattice of cells with the given shape, each holding basis
+sites. kinds lists the bonds from each cell, as (site, site, offset), where the
+offset is added to the position of the cell to find the cell of the second
+site. periodic is a single value or one for each axis. Sites are numbered by
+cell, in row major order, then by site in the cell. Returns the first site, the
+second site, and the kind of each bond, and the cell each bond starts in, as a
+flat index. Bonds that would leave an open edge are left out.
+"""
+    shape = tuple(int(size) for size in shape)
+    periodic = np.broadcast_to(np.asarray(periodic, dtype=bool), (len(shape),))
+    cells = np.indices(shape).reshape(len(shape), -1)
+    firsts, seconds, which, where = [], [], [], []
+    for kind, (site1, site2, offset) in enumerate(kinds):
+        other = cells + np.asarray(offset).reshape(-1, 1)
+        keep = np.ones(cells.shape[1], dtype=bool)
+        for axis, size in enumerate(shape):
+            if periodic[axis]:
+                other[axis] %= size
+            else:
+                keep &= (other[axis] >= 0) & (other[axis] < size)
+        start = np.flatnonzero(keep)
+        end = np.ravel_multi_index(other[:, keep], shape)
+        firsts.append(start * basis + site1)
+        seconds.append(end * basis + site2)
+        which.append(np.full(len(start), kind))
+        where.append(start)
+    return (
+        np.concatenate(firsts),
+        np.concatenate(seconds),
+        np.concatenate(which),
+        np.concatenate(where),
+    )
+
+
+def build(
+    shape,
+    kinds,
+    basis: int = 1,
+    coupling=1,
+    magnet=0,
+    periodic=True,
+    compiled: bool = False,
+):
+    """
+Builds a LatticeHamiltonian on a lattice, with the bonds from bonds. coupling is
+a single value, one value for each kind of bond, or an array with a value for
+each kind of bond and each cell, indexed by the cell the bond starts in. magnet
+is a single value or one for each site. If compiled is True, this returns the
+compressed sparse rows from GraphHamiltonian.compile instead.
+"""
+    firsts, seconds, which, where = bonds(shape, kinds, basis, periodic)
+    ncells = int(np.prod(shape, dtype=np.int64))
+    coupling = np.asarray(coupling, dtype=np.float64)
+    if coupling.ndim == 0:
+        lengths = np.full(len(firsts), float(coupling))
+    elif coupling.ndim == 1:
+        if len(coupling) != len(kinds):
+            raise ValueError("There must be one coupling for each kind of bond.")
+        lengths = coupling[which]
+    else:
+        if coupling.shape != (len(kinds),) + tuple(shape):
+            raise ValueError("There must be a coupling for each kind of bond and cell.")
+        lengths = coupling.reshape(len(kinds), ncells)[which, where]
+    nsites = ncells * basis
+    if np.ndim(magnet) > 0:
+        magnet = np.asarray(magnet, dtype=np.float64).reshape(-1)
+        if len(magnet) != nsites:
+            raise ValueError("There must be one magnet constant for each site.")
+    # A site bonded to itself across a periodic axis of size 1 gets the whole
+    # bond, which undirected loops would halve.
+    conns = graph.ArrayGraph(nsites, firsts, seconds, lengths, firsts == seconds)
+    ham = LatticeHamiltonian(conns, magnet, shape, kinds, basis, coupling, periodic)
+    if compiled:
+        return ham.compile(nsites)
+    return ham
+
+
+def chain(length: int, coupling=1, magnet=0, periodic=True, compiled=False):
+    """
+Builds a chain of spins. With periodic boundaries, this has the same energies
+as a PeriodicHamiltonian, and with open ones, an NPHamiltonian.
+"""
+    return build((length,), CHAIN, 1, coupling, magnet, periodic, compiled)
+
+
+def square(rows: int, cols: int, coupling=1, magnet=0, periodic=True, compiled=False):
+    """
+Builds a square lattice. The bonds are along the rows, then down the columns.
+"""
+    return build((rows, cols), SQUARE, 1, coupling, magnet, periodic, compiled)
+
+
+def triangular(
+    rows: int, cols: int, coupling=1, magnet=0, periodic=True, compiled=False
+):
+    """
+Builds a triangular lattice, as a square lattice with one diagonal bond in each
+cell, so each site has six neighbors.
+"""
+    return build((rows, cols), TRIANGULAR, 1, coupling, magnet, periodic, compiled)
+
+
+def honeycomb(
+    rows: int, cols: int, coupling=1, magnet=0, periodic=True, compiled=False
+):
+    """
+Builds a honeycomb lattice of rows by cols cells with two sites each, as a
+brick wall, so each site has three neighbors.
+"""
+    return build((rows, cols), HONEYCOMB, 2, coupling, magnet, periodic, compiled)
+
+
+def cubic(
+    layers: int,
+    rows: int,
+    cols: int,
+    coupling=1,
+    magnet=0,
+    periodic=True,
+    compiled=False,
+):
+    """
+Builds a simple cubic lattice.
+"""
+    return build((layers, rows, cols), CUBIC, 1, coupling, magnet, periodic, compiled)
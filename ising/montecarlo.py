@@ -8,13 +8,16 @@ try:
     from . import hamiltonian
     from . import spins
     from . import thermo
+    from . import lattice
 except ImportError:
     import hamiltonian
     import spins
     import thermo
+    import lattice
 
 import math
 import random
+import numpy as np
 
 
 class RandomIterator:
@@ -86,6 +89,24 @@ Calculates the partition function.
 """
         raise NotImplementedError
 
+    def _sample(self, hamilt, length, temp, boltzmann):
+        """
+Picks the random configurations, and finds their Boltzmann weights all at once.
+Configurations longer than 64 spins do not fit in the arrays, so their energies
+are found one at a time. The weights are divided by the largest, which cancels
+in the averages.
+"""
+        confs = list(RandomIterator(self._montecarlo, 2 ** length))
+        if length <= 64:
+            energies = hamilt.energy_batch(np.array(confs, dtype=np.uint64), length)
+        else:
+            energies = np.array(
+                [hamilt.energy(spins.SpinInteger(conf, length)) for conf in confs],
+                dtype=np.float64,
+            )
+        expos = -energies / (boltzmann * temp)
+        return confs, np.exp(expos - expos.max())
+
     def average(
         self,
         func,
@@ -99,15 +120,11 @@ Calculates the partition function.
         """
 Calculates the average value of a function weighted with the Boltzmann distribution.
 """
+        confs, weights = self._sample(hamilt, length, temp, boltzmann)
         total = 0
-        den = 0
-        for i in RandomIterator(self._montecarlo, 2 ** length):
-            spin = spins.SpinInteger(i, length)
-            total += func(spin, *args, **kwargs) * math.exp(
-                -hamilt.energy(spin) / (boltzmann * temp)
-            )
-            den += math.exp(-hamilt.energy(spin) / (boltzmann * temp))
-        return total / den
+        for conf, weight in zip(confs, weights):
+            total += func(spins.SpinInteger(conf, length), *args, **kwargs) * weight
+        return total / weights.sum()
 
     def variance(
         self,
@@ -122,18 +139,14 @@ Calculates the average value of a function weighted with the Boltzmann distribut
         """
 Calculates the variance of a function weighted with the Boltzmann distribution.
 """
+        confs, weights = self._sample(hamilt, length, temp, boltzmann)
         total1 = 0
         total2 = 0
-        den = 0
-        for i in RandomIterator(self._montecarlo, 2 ** length):
-            spin = spins.SpinInteger(i, length)
-            total1 += func(spin, *args, **kwargs) * math.exp(
-                -hamilt.energy(spin) / (boltzmann * temp)
-            )
-            total2 += func(spin, *args, **kwargs) ** 2 * math.exp(
-                -hamilt.energy(spin) / (boltzmann * temp)
-            )
-            den += math.exp(-hamilt.energy(spin) / (boltzmann * temp))
+        for conf, weight in zip(confs, weights):
+            val = func(spins.SpinInteger(conf, length), *args, **kwargs)
+            total1 += val * weight
+            total2 += val ** 2 * weight
+        den = weights.sum()
         return total2 / den - (total1 / den) ** 2
 
 
@@ -183,6 +196,32 @@ Calculates the partition function.
 """
         raise NotImplementedError
 
+    def _walk(self, hamilt, length, temp, boltzmann):
+        """
+Walks the Markov chains. Yields each configuration that is visited or proposed,
+with its Boltzmann weight. Proposals flip a spin in place and find the change in
+energy from its neighbors, so the configuration that is yielded changes once the
+next one is asked for.
+"""
+        if length < self.getpoints():
+            points = length
+        else:
+            points = self.getpoints()
+        for i in RandomIterator(points, 2 ** length):
+            spin = spins.SpinInteger(i, length)
+            energy = hamilt.energy(spin) / (boltzmann * temp)
+            yield spin, math.exp(-energy)
+            for _ in range(self._depth):
+                for j in range(length):
+                    diff = hamilt.delta_energy(spin, j) / (boltzmann * temp)
+                    spin.flipbit(j)
+                    yield spin, math.exp(-energy - diff)
+                    # Always go downhill, and sometimes uphill.
+                    if diff <= 0 or random.random() < math.exp(-diff):
+                        energy += diff
+                        break
+                    spin.flipbit(j)
+
     def average(
         self,
         func,
@@ -196,33 +235,11 @@ Calculates the partition function.
         """
 Calculates the average value of a function weighted with the Boltzmann distribution.
 """
-        if length < self.getpoints():
-            points = length
-        else:
-            points = self.getpoints()
         total = 0
         den = 0
-        for i in RandomIterator(points, 2 ** length):
-            spin = spins.SpinInteger(i, length)
-            energy = hamilt.energy(spin) / (boltzmann * temp)
-            total += func(spin, *args, **kwargs) * math.exp(-energy)
-            den += math.exp(-energy)
-            for _ in range(self._depth):
-                for j in range(length):
-                    spin2 = spin.copy()
-                    spin2.flipbit(j)
-                    ener2 = hamilt.energy(spin) / (boltzmann * temp)
-                    diff = energy - ener2
-                    total += func(spin2, *args, **kwargs) * math.exp(-ener2)
-                    den += math.exp(-ener2)
-                    if energy < ener2:
-                        energy = ener2
-                        spin = spin2
-                        break
-                    if random.random() < math.exp(diff):
-                        energy = ener2
-                        spin = spin2
-                        break
+        for spin, weight in self._walk(hamilt, length, temp, boltzmann):
+            total += func(spin, *args, **kwargs) * weight
+            den += weight
         return total / den
 
     def variance(
@@ -238,34 +255,324 @@ Calculates the average value of a function weighted with the Boltzmann distribut
         """
 Calculates the variance of a function weighted with the Boltzmann distribution.
 """
-        if length < self.getpoints():
-            points = length
-        else:
-            points = self.getpoints()
         total1 = 0
         total2 = 0
         den = 0
-        for i in RandomIterator(points, 2 ** length):
-            spin = spins.SpinInteger(i, length)
-            energy = hamilt.energy(spin) / (boltzmann * temp)
-            total1 += func(spin, *args, **kwargs) * math.exp(-energy)
-            total2 += func(spin, *args, **kwargs) ** 2 * math.exp(-energy)
-            den += math.exp(-energy)
-            for _ in range(self._depth):
-                for j in range(length):
-                    spin2 = spin.copy()
-                    spin2.flipbit(j)
-                    ener2 = hamilt.energy(spin) / (boltzmann * temp)
-                    diff = energy - ener2
-                    total1 += func(spin2, *args, **kwargs) * math.exp(-ener2)
-                    total2 += func(spin2, *args, **kwargs) ** 2 * math.exp(-ener2)
-                    den += math.exp(-ener2)
-                    if energy < ener2:
-                        energy = ener2
-                        spin = spin2
-                        break
-                    if random.random() < math.exp(diff):
-                        energy = ener2
-                        spin = spin2
-                        break
+        for spin, weight in self._walk(hamilt, length, temp, boltzmann):
+            val = func(spin, *args, **kwargs)
+            total1 += val * weight
+            total2 += val ** 2 * weight
+            den += weight
         return total2 / den - (total1 / den) ** 2
+
+
+def _half_sweep(mine, other, shift, table, rng, bufs):
+    """
+Proposes flipping every site of one color of a checkerboard at once. mine and
+other hold the sites of each color by row, as 0 for down and 1 for up, with the
+sites of mine in even rows offset by shift from the sites of other next to
+them. Each site looks up the chance of being flipped from table, by its own
+spin and the number of its neighbors along and across the rows that are up.
+"""
+    vert, side, index, thresh, accept = bufs
+    vert[1:] = other[:-1]
+    vert[0] = other[-1]
+    vert[:-1] += other[1:]
+    vert[-1] += other[0]
+    # The other neighbor along each row alternates sides between the rows.
+    for start, step in ((0, shift), (1, -shift)):
+        into, out = side[start::2], other[start::2]
+        if step > 0:
+            into[:, 1:] = out[:, :-1]
+            into[:, 0] = out[:, -1]
+        else:
+            into[:, :-1] = out[:, 1:]
+            into[:, -1] = out[:, 0]
+    side += other
+    np.multiply(mine, 9, out=index)
+    side *= 3
+    index += side
+    index += vert
+    np.take(table, index, out=thresh)
+    # Raw 64 bit draws split into two 32 bit ones.
+    draws = rng.bit_generator.random_raw(mine.size // 2).view(np.uint32)
+    np.less(draws.reshape(mine.shape), thresh, out=accept)
+    mine ^= accept
+
+
+class CheckerboardStrategy(thermo.ThermoStrategy, thermo.PlotValsStrategy):
+    """
+Metropolis sampling of lattice.square lattices that are periodic in both
+directions, with an even number of rows and of columns and uniform couplings
+and fields. No two neighbors share a color on a checkerboard, so each sweep
+updates every site of one color at once with array operations, then every site
+of the other. Other Hamiltonians go to MetropolisStrategy.
+"""
+
+    def __init__(self):
+        super().__init__()
+        self._sweeps = 1000
+        self._burnin = 100
+        self._thinning = 1
+        self._rng = np.random.Generator(np.random.SFC64())
+
+    def getsweeps(self):
+        """
+Gets the number of sweeps after the burn in.
+"""
+        return self._sweeps
+
+    def setsweeps(self, sweeps):
+        """
+Sets the number of sweeps after the burn in.
+"""
+        self._sweeps = sweeps
+
+    def getburnin(self):
+        """
+Gets the number of sweeps that are thrown away at the start of each chain.
+"""
+        return self._burnin
+
+    def setburnin(self, burnin):
+        """
+Sets the number of sweeps that are thrown away at the start of each chain.
+"""
+        self._burnin = burnin
+
+    def getthinning(self):
+        """
+Gets the number of sweeps between the samples that are kept.
+"""
+        return self._thinning
+
+    def setthinning(self, thinning):
+        """
+Sets the number of sweeps between the samples that are kept.
+"""
+        if thinning < 1:
+            raise ValueError("The thinning must be at least 1.")
+        self._thinning = thinning
+
+    def setseed(self, seed):
+        """
+Seeds the random numbers, to repeat a run.
+"""
+        self._rng = np.random.Generator(np.random.SFC64(seed))
+
+    def partition(
+        self,
+        hamilt: hamiltonian.Hamiltonian,
+        length: int,
+        temp: float,
+        boltzmann: float,
+    ):
+        """
+Calculates the partition function.
+"""
+        raise NotImplementedError
+
+    @staticmethod
+    def _board(hamilt, length):
+        """
+Finds the rows, columns, couplings along and across the rows, and magnetic
+constant of the lattice, or returns None if it can not be colored as a
+checkerboard.
+"""
+        if not isinstance(hamilt, lattice.LatticeHamiltonian):
+            return None
+        if (
+            hamilt.getkinds() != lattice.SQUARE
+            or hamilt.getbasis() != 1
+            or not all(hamilt.getperiodic())
+        ):
+            return None
+        rows, cols = hamilt.getshape()
+        uniform = hamilt.getuniform()
+        if rows % 2 or cols % 2 or rows * cols != length or uniform is None:
+            return None
+        return rows, cols, uniform[0], uniform[1]
+
+    @staticmethod
+    def _table(board, temp, boltzmann):
+        """
+Finds the chance of flipping a site, scaled to 32 bit integers, for each spin
+and number of neighbors along and across the rows that are up.
+"""
+        _, _, (along, across), magnet = board
+        spin, rest = np.divmod(np.arange(18), 9)
+        side, vert = np.divmod(rest, 3)
+        diff = (
+            2
+            * (2 * spin - 1)
+            * (along * (2 * side - 2) + across * (2 * vert - 2) - magnet)
+        )
+        chance = np.exp(np.minimum(0, -diff / (boltzmann * temp)))
+        # A sure flip misses one draw in 2 ** 32.
+        return np.minimum(np.round(chance * 2.0 ** 32), 2 ** 32 - 1).astype(np.uint32)
+
+    def _chain(self, board, temp, boltzmann, state):
+        """
+Walks a Markov chain from the state, a pair of arrays holding the sites of each
+color, which is changed in place. Yields the state after each sample is taken.
+"""
+        table = self._table(board, temp, boltzmann)
+        black, white = state
+        bufs = (
+            np.empty_like(black),
+            np.empty_like(black),
+            np.empty_like(black),
+            np.empty(black.shape, dtype=np.uint32),
+            np.empty(black.shape, dtype=bool),
+        )
+        for sweep in range(-self._burnin, self._sweeps):
+            _half_sweep(black, white, 1, table, self._rng, bufs)
+            _half_sweep(white, black, -1, table, self._rng, bufs)
+            if sweep >= 0 and (sweep + 1) % self._thinning == 0:
+                yield state
+
+    @staticmethod
+    def _start(board):
+        """
+Makes a state with every spin up.
+"""
+        rows, cols = board[:2]
+        return (
+            np.ones((rows, cols // 2), dtype=np.uint8),
+            np.ones((rows, cols // 2), dtype=np.uint8),
+        )
+
+    @staticmethod
+    def _measure(board, state):
+        """
+Finds the energy and the magnetization of a state. Every bond joins a black
+site to a white one.
+"""
+        rows, cols, (along, across), magnet = board
+        black, white = state
+        side = np.empty_like(white)
+        side[0::2] = np.roll(white[0::2], 1, axis=1)
+        side[1::2] = np.roll(white[1::2], -1, axis=1)
+        walls_along = np.count_nonzero(black ^ white) + np.count_nonzero(black ^ side)
+        walls_across = np.count_nonzero(
+            black ^ np.roll(white, 1, axis=0)
+        ) + np.count_nonzero(black ^ np.roll(white, -1, axis=0))
+        sites = rows * cols
+        mag = 2 * (np.count_nonzero(black) + np.count_nonzero(white)) - sites
+        return (
+            -along * (sites - 2 * walls_along)
+            - across * (sites - 2 * walls_across)
+            + magnet * mag,
+            mag,
+        )
+
+    @staticmethod
+    def _spin(state):
+        """
+Makes a SpinInteger from a state.
+"""
+        black, white = state
+        grid = np.empty((black.shape[0], 2 * black.shape[1]), dtype=np.uint8)
+        grid[0::2, 0::2] = black[0::2]
+        grid[0::2, 1::2] = white[0::2]
+        grid[1::2, 1::2] = black[1::2]
+        grid[1::2, 0::2] = white[1::2]
+        # Site 0 is the highest bit.
+        pad = -grid.size % 8
+        conf = int.from_bytes(np.packbits(grid).tobytes(), "big") >> pad
+        return spins.SpinInteger(conf, grid.size)
+
+    def _values(self, func, hamilt, board, temp, boltzmann, *args, **kwargs):
+        """
+Samples a function along a chain. The energy and the powers of the
+magnetization are found from the arrays, and anything else from a
+SpinInteger.
+"""
+        powers = {
+            thermo.magnetization: 1,
+            spins.SpinConfig.magnetization: 1,
+            thermo.magnetization2: 2,
+            thermo.magnetization4: 4,
+        }
+        vals = []
+        for state in self._chain(board, temp, boltzmann, self._start(board)):
+            if args or kwargs:
+                vals.append(func(self._spin(state), *args, **kwargs))
+            elif func == hamilt.energy:
+                vals.append(self._measure(board, state)[0])
+            elif func in powers:
+                vals.append(self._measure(board, state)[1] ** powers[func])
+            elif func == thermo.abs_magnetization:
+                vals.append(abs(self._measure(board, state)[1]))
+            else:
+                vals.append(func(self._spin(state)))
+        return np.array(vals, dtype=np.float64)
+
+    def average(
+        self,
+        func,
+        hamilt: hamiltonian.Hamiltonian,
+        length: int,
+        temp: float,
+        boltzmann: float,
+        *args,
+        **kwargs
+    ):
+        """
+Calculates the average value of a function weighted with the Boltzmann distribution.
+"""
+        board = self._board(hamilt, length)
+        if board is None:
+            return MetropolisStrategy.getsingleton().average(
+                func, hamilt, length, temp, boltzmann, *args, **kwargs
+            )
+        vals = self._values(func, hamilt, board, temp, boltzmann, *args, **kwargs)
+        return vals.mean()
+
+    def variance(
+        self,
+        func,
+        hamilt: hamiltonian.Hamiltonian,
+        length: int,
+        temp: float,
+        boltzmann: float,
+        *args,
+        **kwargs
+    ):
+        """
+Calculates the variance of a function weighted with the Boltzmann distribution.
+"""
+        board = self._board(hamilt, length)
+        if board is None:
+            return MetropolisStrategy.getsingleton().variance(
+                func, hamilt, length, temp, boltzmann, *args, **kwargs
+            )
+        vals = self._values(func, hamilt, board, temp, boltzmann, *args, **kwargs)
+        return vals.var()
+
+    def calc_plot_vals(self, hamilt: hamiltonian.Hamiltonian, length, temps, boltzmann):
+        """
+Returns the energies, heat capacities, and magnetic susceptibilities at several
+temperatures. Each chain starts where the one before it stopped.
+"""
+        board = self._board(hamilt, length)
+        if board is None:
+            return (
+                [self.energy(hamilt, length, t, boltzmann) for t in temps],
+                [self.heatcap(hamilt, length, t, boltzmann) for t in temps],
+                [self.magneticsus(hamilt, length, t, boltzmann) for t in temps],
+            )
+        state = self._start(board)
+        ens, heats, sus = [], [], []
+        for temp in temps:
+            vals = np.array(
+                [
+                    self._measure(board, sample)
+                    for sample in self._chain(board, temp, boltzmann, state)
+                ],
+                dtype=np.float64,
+            ).reshape(-1, 2)
+            ens.append(vals[:, 0].mean())
+            heats.append(vals[:, 0].var() / (boltzmann * temp ** 2))
+            sus.append(vals[:, 1].var() / (boltzmann * temp))
+        return ens, heats, sus
@@ -0,0 +1,493 @@
+#!/usr/bin/python3
+
+"""
+ising.numpycalc
+
+Exact enumeration with NumPy. The energies and magnetizations of every
+configuration are found with bit operations on arrays of configuration
+integers, a chunk at a time, and the thermodynamic sums are array reductions
+over every temperature at once. This does not need the C extension.
+"""
+
+try:
+    from . import hamiltonian
+    from . import thermo
+    from . import spins
+    from . import despats
+except ImportError:
+    import hamiltonian
+    import thermo
+    import spins
+    import despats
+
+import os
+import glob
+import hashlib
+import numpy as np
+
+# Bit counts of each byte, for versions of NumPy without bitwise_count.
+_BYTE_COUNTS = np.array([bin(i).count("1") for i in range(256)], dtype=np.int64)
+
+# The most Boltzmann weights to hold at once, over every temperature.
+_MAX_WEIGHTS = 1 << 22
+
+
+def popcount(vals):
+    """
+Counts the set bits of each element of an array of unsigned 64 bit integers.
+"""
+    vals = np.ascontiguousarray(vals, dtype=np.uint64)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(vals).astype(np.int64)
+    return _BYTE_COUNTS[vals.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def _mask(bits: int):
+    """
+Returns an integer with the lowest bits set.
+"""
+    return np.uint64((1 << bits) - 1)
+
+
+def _ring_walls(confs, length: int):
+    """
+Counts the domain walls of each configuration of a ring.
+"""
+    if length < 2:
+        return np.zeros(len(confs), dtype=np.int64)
+    rot = ((confs >> np.uint64(1)) | (confs << np.uint64(length - 1))) & _mask(length)
+    return popcount(confs ^ rot)
+
+
+def _chain_walls(confs, length: int):
+    """
+Counts the domain walls of each configuration of an open chain.
+"""
+    if length < 2:
+        return np.zeros(len(confs), dtype=np.int64)
+    return popcount((confs ^ (confs >> np.uint64(1))) & _mask(length - 1))
+
+
+def _spin(confs, length: int, index: int):
+    """
+Finds spin index of each configuration, as +1 or -1. Spin 0 is the highest bit,
+as in spins.SpinInteger.
+"""
+    bits = (confs >> np.uint64(length - index - 1)) & np.uint64(1)
+    return 2 * bits.astype(np.int64) - 1
+
+
+class NumpyFullCalcStrategy(thermo.ThermoStrategy, thermo.PlotValsStrategy):
+    """
+Calculates values using every configuration, with NumPy. The energies of
+PeriodicHamiltonians, NPHamiltonians, and GraphHamiltonians are found with bit
+operations on whole chunks of configurations, and other Hamiltonians give theirs
+through energy_batch. Observables other than those in thermo are called on each
+configuration, as in FullCalcStrategy. The Boltzmann weights of each chunk are
+shifted by its lowest energy, and the chunks are merged in log space, so nothing
+overflows at low temperatures.
+"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunk = 1 << 16
+        self._tables = False
+
+    def getchunk(self):
+        """
+Gets the number of configurations handled at once.
+"""
+        return self._chunk
+
+    def setchunk(self, chunk: int):
+        """
+Sets the number of configurations handled at once.
+"""
+        if chunk < 1:
+            raise ValueError("The chunk size needs to be positive.")
+        self._chunk = chunk
+        return chunk
+
+    def gettables(self):
+        """
+Gets whether the energies and magnetizations are read from EnergyTableCache.
+"""
+        return self._tables
+
+    def settables(self, tables: bool):
+        """
+Sets whether the energies and magnetizations are read from EnergyTableCache.
+"""
+        self._tables = tables
+        return tables
+
+    @staticmethod
+    def _energies(hamilt, length, confs, mags):
+        """
+Finds the energy of each configuration in a chunk.
+"""
+        if isinstance(hamilt, hamiltonian.PeriodicHamiltonian):
+            couple = length - 2 * _ring_walls(confs, length)
+            return -hamilt.getcoupling() * couple + hamilt.getmagnet() * mags
+        if isinstance(hamilt, hamiltonian.NPHamiltonian):
+            couple = max(length - 1, 0) - 2 * _chain_walls(confs, length)
+            return -hamilt.getcoupling() * couple + hamilt.getmagnet() * mags
+        if isinstance(hamilt, hamiltonian.GraphHamiltonian):
+            indptr, indices, coefs, fields, offset = hamilt.compile(length)
+            energies = np.full(len(confs), offset)
+            for first in range(length):
+                spin = _spin(confs, length, first)
+                energies += fields[first] * spin
+                # Each coupling is in the rows of both spins. Only use one.
+                for k in range(indptr[first], indptr[first + 1]):
+                    if indices[k] > first:
+                        energies += coefs[k] * spin * _spin(confs, length, indices[k])
+            return energies
+        return hamilt.energy_batch(confs, length)
+
+    @staticmethod
+    def _values(func, hamilt, length, confs, energies, mags, args, kwargs):
+        """
+Finds the value of an observable for each configuration in a chunk.
+"""
+        if not args and not kwargs:
+            if func == hamilt.energy:
+                return energies
+            try:
+                if func in _ARRAY_OBSERVABLES:
+                    return _ARRAY_OBSERVABLES[func](confs, length, mags)
+            except TypeError:
+                pass
+            if hasattr(func, "batch"):
+                return np.asarray(func.batch(confs, length), dtype=float)
+        return np.fromiter(
+            (
+                func(spins.SpinInteger(int(c), length), *args, **kwargs)
+                for c in confs
+            ),
+            dtype=float,
+            count=len(confs),
+        )
+
+    def moments(self, funcs, hamilt, length: int, temps, boltzmann, *args, **kwargs):
+        """
+Finds the log of the partition function, and the averages and variances of
+several observables, at several temperatures. Returns an array of the logs of
+the partition function, and arrays of the averages and variances with one row
+for each observable and one column for each temperature.
+"""
+        betas = 1 / (boltzmann * np.asarray(temps, dtype=float).reshape(-1))
+        log_part = np.full(len(betas), -np.inf)
+        means = np.zeros((len(funcs), len(betas)))
+        varis = np.zeros((len(funcs), len(betas)))
+        table = (
+            EnergyTableCache.getsingleton().gettable(hamilt, length)
+            if self._tables
+            else None
+        )
+        chunk = max(1, min(self._chunk, _MAX_WEIGHTS // max(1, len(betas))))
+        total = 1 << length
+        for start in range(0, total, chunk):
+            confs = np.arange(start, min(start + chunk, total), dtype=np.uint64)
+            if table is None:
+                mags = 2 * popcount(confs) - length
+                energies = self._energies(hamilt, length, confs, mags)
+            else:
+                energies = np.asarray(table[0][start : start + len(confs)])
+                mags = table[1][start : start + len(confs)].astype(np.int64)
+            expos = -np.outer(betas, energies)
+            shift = expos.max(axis=1)
+            weights = np.exp(expos - shift[:, None])
+            sums = weights.sum(axis=1)
+            chunk_log = shift + np.log(sums)
+            new_log = np.logaddexp(log_part, chunk_log)
+            old = np.exp(log_part - new_log)
+            new = np.exp(chunk_log - new_log)
+            for i, func in enumerate(funcs):
+                vals = self._values(
+                    func, hamilt, length, confs, energies, mags, args, kwargs
+                )
+                mean = weights @ vals / sums
+                # Take the moment about the chunk mean so that it does not cancel.
+                var = (weights * (vals[None, :] - mean[:, None]) ** 2).sum(
+                    axis=1
+                ) / sums
+                diff = means[i] - mean
+                varis[i] = old * varis[i] + new * var + old * new * diff ** 2
+                means[i] = old * means[i] + new * mean
+            log_part = new_log
+        return log_part, means, varis
+
+    def log_partition(
+        self,
+        hamilt: hamiltonian.Hamiltonian,
+        length: int,
+        temp: float,
+        boltzmann: float,
+    ):
+        """
+Returns the natural log of the partition function.
+"""
+        return float(self.moments([], hamilt, length, temp, boltzmann)[0][0])
+
+    def partition(
+        self,
+        hamilt: hamiltonian.Hamiltonian,
+        length: int,
+        temp: float,
+        boltzmann: float,
+    ):
+        """
+Returns the value of the partition function.
+"""
+        return float(np.exp(self.log_partition(hamilt, length, temp, boltzmann)))
+
+    def average(
+        self,
+        func,
+        hamilt: hamiltonian.Hamiltonian,
+        length: int,
+        temp: float,
+        boltzmann: float,
+        *args,
+        **kwargs,
+    ):
+        """
+Find the value of an intrinsic property normalized by the partition function.
+"""
+        return float(
+            self.moments([func], hamilt, length, temp, boltzmann, *args, **kwargs)[1][
+                0, 0
+            ]
+        )
+
+    def variance(
+        self,
+        func,
+        hamilt: hamiltonian.Hamiltonian,
+        length: int,
+        temp: float,
+        boltzmann: float,
+        *args,
+        **kwargs,
+    ):
+        """
+Find the variance of an intrinsic property normalized by the partition function.
+"""
+        return float(
+            self.moments([func], hamilt, length, temp, boltzmann, *args, **kwargs)[2][
+                0, 0
+            ]
+        )
+
+    def calc_plot_vals(self, hamilt: hamiltonian.Hamiltonian, length, temps, boltzmann):
+        """
+Returns the energies, heat capacities, and magnetic susceptibilities at several
+temperatures, from one pass over the configurations.
+"""
+        temps = np.asarray(temps, dtype=float)
+        _, means, varis = self.moments(
+            [hamilt.energy, thermo.magnetization], hamilt, length, temps, boltzmann
+        )
+        return (
+            list(means[0]),
+            list(varis[0] / (boltzmann * temps ** 2)),
+            list(varis[1] / (boltzmann * temps)),
+        )
+
+
+def fingerprint(hamilt: hamiltonian.Hamiltonian):
+    """
+Finds a string that identifies the energies a Hamiltonian gives. Returns None
+for Hamiltonians that can not be identified from their parameters.
+"""
+    if isinstance(
+        hamilt, (hamiltonian.PeriodicHamiltonian, hamiltonian.NPHamiltonian)
+    ):
+        params = (type(hamilt).__name__, hamilt.getcoupling(), hamilt.getmagnet())
+    elif isinstance(hamilt, hamiltonian.GraphHamiltonian):
+        field = hamilt.getmagnet()
+        if hasattr(field, "__iter__"):
+            field = tuple(field)
+        if hasattr(hamilt.getconns(), "getpairarrays"):
+            pairs = tuple(
+                hashlib.sha256(np.ascontiguousarray(arr).tobytes()).hexdigest()
+                for arr in hamilt.getconns().getpairarrays()
+            )
+        else:
+            pairs = tuple(sorted(hamilt.getpairs(), key=repr))
+        params = (type(hamilt).__name__, pairs, field)
+    else:
+        return None
+    return hashlib.sha256(repr(params).encode()).hexdigest()[:32]
+
+
+class EnergyTableCache(despats.Singleton):
+    """
+Holds the energy and magnetization of every configuration on disk, as .npy
+files that are opened as memory maps. The tables are kept for each Hamiltonian
+fingerprint and length, so they can be shared between runs. When the tables
+take more than the budget, the ones used least recently are removed.
+"""
+
+    def __init__(self):
+        self._dir = os.environ.get(
+            "ISING_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "ising")
+        )
+        self._budget = 1 << 30
+
+    def getdir(self):
+        """
+Gets the directory that holds the tables.
+"""
+        return self._dir
+
+    def setdir(self, path):
+        """
+Sets the directory that holds the tables.
+"""
+        self._dir = path
+        return path
+
+    def getbudget(self):
+        """
+Gets the most bytes the tables may take.
+"""
+        return self._budget
+
+    def setbudget(self, budget: int):
+        """
+Sets the most bytes the tables may take, and removes tables to fit.
+"""
+        self._budget = budget
+        self._evict(0)
+        return budget
+
+    def _paths(self, key: str, length: int):
+        """
+Returns the paths of the energy and magnetization tables.
+"""
+        stem = os.path.join(self._dir, f"{key}-{length}")
+        return stem + ".energy.npy", stem + ".magnet.npy"
+
+    def _stems(self):
+        """
+Returns the tables in the directory, with the time each was last used and the
+bytes it takes, least recently used first.
+"""
+        stems = []
+        for path in glob.glob(os.path.join(self._dir, "*.energy.npy")):
+            stem = path[: -len(".energy.npy")]
+            try:
+                stat = os.stat(path)
+                size = stat.st_size + os.stat(stem + ".magnet.npy").st_size
+            except FileNotFoundError:
+                continue
+            stems.append((stat.st_mtime, size, stem))
+        return sorted(stems)
+
+    def _evict(self, needed: int):
+        """
+Removes the least recently used tables until there is room for a number of
+bytes.
+"""
+        stems = self._stems()
+        used = sum(stem[1] for stem in stems)
+        for _, size, stem in stems:
+            if used + needed <= self._budget:
+                break
+            # A table is gone once its energies are. Files that are still
+            # mapped can not be removed on Windows, so those tables stay.
+            try:
+                os.remove(stem + ".energy.npy")
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue
+            try:
+                os.remove(stem + ".magnet.npy")
+            except OSError:
+                pass
+            used -= size
+
+    def gettable(self, hamilt: hamiltonian.Hamiltonian, length: int):
+        """
+Gets read only memory maps of the energies and magnetizations of every
+configuration, indexed by the configuration integers. The tables are made if
+they are not stored. Returns None if the Hamiltonian has no fingerprint, or if
+the tables would not fit in the budget.
+"""
+        key = fingerprint(hamilt)
+        if key is None:
+            return None
+        energy_path, magnet_path = self._paths(key, length)
+        if not os.path.exists(energy_path) or not os.path.exists(magnet_path):
+            total = 1 << length
+            if 9 * total > self._budget:
+                return None
+            self._evict(9 * total)
+            os.makedirs(self._dir, exist_ok=True)
+            self._write(hamilt, length, energy_path, magnet_path)
+        else:
+            # Mark the table as used.
+            os.utime(energy_path)
+        return (
+            np.load(energy_path, mmap_mode="r"),
+            np.load(magnet_path, mmap_mode="r"),
+        )
+
+    @staticmethod
+    def _write(hamilt, length, energy_path, magnet_path):
+        """
+Fills the tables a chunk at a time. They are written under temporary names and
+then moved, so other processes never see part of a table. The magnetizations
+are moved first, since a table is only used once its energies exist.
+"""
+        total = 1 << length
+        chunk = NumpyFullCalcStrategy.getsingleton().getchunk()
+        suffix = f".{os.getpid()}.tmp"
+        energies = np.lib.format.open_memmap(
+            energy_path + suffix, mode="w+", dtype=np.float64, shape=(total,)
+        )
+        mags = np.lib.format.open_memmap(
+            magnet_path + suffix, mode="w+", dtype=np.int8, shape=(total,)
+        )
+        for start in range(0, total, chunk):
+            confs = np.arange(start, min(start + chunk, total), dtype=np.uint64)
+            mag = 2 * popcount(confs) - length
+            mags[start : start + len(confs)] = mag
+            energies[start : start + len(confs)] = (
+                NumpyFullCalcStrategy._energies(  # pylint: disable=protected-access
+                    hamilt, length, confs, mag
+                )
+            )
+        energies.flush()
+        mags.flush()
+        del energies, mags
+        os.replace(magnet_path + suffix, magnet_path)
+        os.replace(energy_path + suffix, energy_path)
+
+    def clear(self):
+        """
+Removes all of the stored tables.
+"""
+        budget = self._budget
+        self._budget = 0
+        self._evict(0)
+        self._budget = budget
+
+
+# The observables that NumpyFullCalcStrategy finds from the configuration
+# integers and magnetizations, rather than calling them on each configuration.
+_ARRAY_OBSERVABLES = {
+    thermo.magnetization: lambda confs, length, mags: mags,
+    spins.SpinConfig.magnetization: lambda confs, length, mags: mags,
+    thermo.abs_magnetization: lambda confs, length, mags: np.abs(mags),
+    thermo.magnetization2: lambda confs, length, mags: mags ** 2,
+    thermo.magnetization4: lambda confs, length, mags: mags.astype(float) ** 4,
+    thermo.correlation: lambda confs, length, mags: (
+        length - 2 * _ring_walls(confs, length)
+    )
+    / length,
+    thermo.domain_walls: lambda confs, length, mags: _ring_walls(confs, length),
+}
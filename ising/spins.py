@@ -101,7 +101,7 @@ an integer.
         """
 Flips the spin at a given position.
 """
-        self[index] = 1 - self[index]
+        self.__numeral ^= 1 << (self.__len - index % self.__len - 1)
 
     def __iter__(self):
         return _SpinIntegerIterator(self)
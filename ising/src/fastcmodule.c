@@ -11,215 +11,1229 @@
 #include <stdio.h>
 #include <errno.h>
 #include <stdint.h>
+#include <string.h>
+
+// Make sure a number of positions can be handled, and raise if not.
+static int check_positions(int positions, int most) {
+  if(positions < 1 || positions > most) {
+    PyErr_Format(PyExc_ValueError,
+		 "The number of positions must be between 1 and %d, not %d.",
+		 most, positions);
+    return (0);
+  }
+  return (1);
+}
+
+// A Python handle on a thread pool.
+typedef struct {
+  PyObject_HEAD
+  thread_pool_t *pool;
+  // The number of calls running on the pool without the GIL.
+  int users;
+} PoolObject;
+
+static int Pool_init(PoolObject *self, PyObject *args, PyObject *kwds) {
+  static char *kwlist[] = {"threads", NULL};
+  int threads;
+
+  if(!PyArg_ParseTupleAndKeywords(args, kwds, "i", kwlist, &threads)) {
+    return (-1);
+  }
+  if(threads < 1) {
+    PyErr_SetString(PyExc_ValueError, "Need at least one thread.");
+    return (-1);
+  }
+  if(self->users > 0) {
+    PyErr_SetString(PyExc_RuntimeError,
+		    "The pool can not be restarted while it is running.");
+    return (-1);
+  }
+  pool_destroy(self->pool);
+  self->pool = pool_create(threads);
+  if(self->pool == NULL) {
+    PyErr_NoMemory();
+    return (-1);
+  }
+  return (0);
+}
+
+static void Pool_dealloc(PoolObject *self) {
+  pool_destroy(self->pool);
+  Py_TYPE(self)->tp_free((PyObject *) self);
+}
+
+static PyObject *Pool_close(PoolObject *self, PyObject *unused) {
+  if(self->users > 0) {
+    PyErr_SetString(PyExc_RuntimeError,
+		    "The pool can not be closed while it is running.");
+    return (NULL);
+  }
+  pool_destroy(self->pool);
+  self->pool = NULL;
+  Py_RETURN_NONE;
+}
+
+static PyObject *Pool_getthreads(PoolObject *self, void *closure) {
+  return (PyLong_FromLong((self->pool == NULL)? 0: pool_threads(self->pool)));
+}
+
+static PyMethodDef Pool_methods[] = {
+  {"close", (PyCFunction) Pool_close, METH_NOARGS, "Stop the threads. The "
+   "pool can not be used after this.\n"},
+  {NULL, NULL, 0, NULL}
+};
+
+static PyGetSetDef Pool_getset[] = {
+  {"threads", (getter) Pool_getthreads, NULL, "The number of threads, "
+   "counting the calling thread, or 0 if the pool is closed.", NULL},
+  {NULL, NULL, NULL, NULL, NULL}
+};
+
+static PyTypeObject PoolType = {
+  PyVarObject_HEAD_INIT(NULL, 0)
+  .tp_name = "ising.fastc.Pool",
+  .tp_doc = "A pool of threads that persists between calls. It can be passed "
+  "to any function that takes a number of threads.\n"
+  ":param int threads: The number of threads, counting the calling thread.\n",
+  .tp_basicsize = sizeof(PoolObject),
+  .tp_itemsize = 0,
+  .tp_flags = Py_TPFLAGS_DEFAULT,
+  .tp_new = PyType_GenericNew,
+  .tp_init = (initproc) Pool_init,
+  .tp_dealloc = (destructor) Pool_dealloc,
+  .tp_methods = Pool_methods,
+  .tp_getset = Pool_getset,
+};
+
+/*
+ * Get a thread pool from either a Pool or a number of threads. If a new pool
+ * had to be made for a number, made is set. Either way, the pool has to be
+ * given back with pool_release.
+ */
+static int pool_from_obj(PyObject *obj, thread_pool_t **pool, int *made) {
+  long threads;
+
+  *made = 0;
+  if(PyObject_TypeCheck(obj, &PoolType)) {
+    *pool = ((PoolObject *) obj)->pool;
+    if(*pool == NULL) {
+      PyErr_SetString(PyExc_ValueError, "The pool has been closed.");
+      return (0);
+    }
+    ((PoolObject *) obj)->users++;
+    return (1);
+  }
+  threads = PyLong_AsLong(obj);
+  if(threads == -1 && PyErr_Occurred() != NULL) {
+    return (0);
+  }
+  if(threads < 1 || threads > INT32_MAX) {
+    PyErr_SetString(PyExc_ValueError, "Need at least one thread.");
+    return (0);
+  }
+  *pool = pool_create((int) threads);
+  if(*pool == NULL) {
+    PyErr_NoMemory();
+    return (0);
+  }
+  *made = 1;
+  return (1);
+}
+
+// Give back a pool from pool_from_obj. The GIL has to be held.
+static void pool_release(PyObject *obj, thread_pool_t *pool, int made) {
+  if(made) {
+    pool_destroy(pool);
+  } else {
+    ((PoolObject *) obj)->users--;
+  }
+}
 
 PyObject *fastc_energy(PyObject *self, PyObject *args) {
-  int sp, pos;
+  unsigned long long sp;
+  int pos;
   double coupling, magnet, result;
 
-  int ret = PyArg_ParseTuple(args, "iidd", &sp, &pos, &coupling, &magnet);
+  int ret = PyArg_ParseTuple(args, "Kidd", &sp, &pos, &coupling, &magnet);
 
   if(!ret) {
     perror("PyArg_ParseTuple did not return 0 in fastc_energy!");
     return (NULL);
   }
-  result = energy((uint32_t) sp, pos, coupling, magnet);
+  if(!check_positions(pos, 64)) {
+    return (NULL);
+  }
+  result = energy((uint64_t) sp, pos, coupling, magnet);
   return (PyFloat_FromDouble(result));
 }
 
 PyObject *fastc_magnet(PyObject *self, PyObject *args) {
-  int sp, pos, result;
+  unsigned long long sp;
+  int pos, result;
 
-  int ret = PyArg_ParseTuple(args, "ii", &sp, &pos);
+  int ret = PyArg_ParseTuple(args, "Ki", &sp, &pos);
 
   if(!ret) {
     perror("PyArg_ParseTuple did not return 0 in fastc_magnet!");
     return (NULL);
   }
-  result = magnet((uint32_t) sp, pos);
+  if(!check_positions(pos, 64)) {
+    return (NULL);
+  }
+  result = magnet((uint64_t) sp, pos);
   return (PyLong_FromLong(result));
 }
 
 PyObject *fastc_p_partition(PyObject *self, PyObject *args) {
-  int length, threads;
+  int length, made;
   double temp, boltzmann, coupling, magnet;
+  thread_pool_t *pool;
+  PyObject *threads;
   PyErr_Clear();
 
-  int ret = PyArg_ParseTuple(args, "iddddi", &length, &coupling, &magnet,
+  int ret = PyArg_ParseTuple(args, "iddddO", &length, &coupling, &magnet,
 			     &temp, &boltzmann, &threads);
   if(!ret) {
     perror("PyArg_ParseTuple did not return 0 in fastc_p_partition!");
     return (NULL);
   }
-  double ret2 = p_partition(length, coupling, magnet,
-			    temp, boltzmann, threads);
-  printf("partition: %f\n", ret2);
-  fflush(stdout);
+  if(!check_positions(length, MAX_POSITIONS)) {
+    return (NULL);
+  }
+  if(!pool_from_obj(threads, &pool, &made)) {
+    return (NULL);
+  }
+  double ret2;
+  Py_BEGIN_ALLOW_THREADS
+  ret2 = p_partition(length, coupling, magnet, temp, boltzmann, pool);
+  Py_END_ALLOW_THREADS
+  pool_release(threads, pool, made);
   return (PyFloat_FromDouble(ret2));
 }
 
-PyObject *fastc_p_average(PyObject *self, PyObject *args) {
-  int length;
-  double temp, boltzmann, coupling, magnet;
-  PyObject *func, *exc, *out;
-  PyErr_Clear();
-  errno = 0;
+// Docstring in FastcMethods
+PyObject *fastc_p_log_partition(PyObject *self, PyObject *args) {
+  int length, made;
+  double temp, boltzmann, coupling, magnet, out;
+  thread_pool_t *pool;
+  PyObject *threads;
 
-  int ret = PyArg_ParseTuple(args, "Oidddd", &func, &length, &coupling, &magnet,
-			     &temp, &boltzmann);
-  exc = PyErr_Occurred();
-  if(!ret || exc != NULL || errno != 0) {
-    PyErr_Print();
-    perror("PyArg_ParseTuple did not return 0 in fastc_p_average!");
+  if(!PyArg_ParseTuple(args, "iddddO", &length, &coupling, &magnet,
+		       &temp, &boltzmann, &threads)) {
     return (NULL);
   }
-  double ret2 = p_average(func, length, coupling, magnet, temp, boltzmann);
-  if(isnan(ret2)) {
-    PyErr_Print();
-    perror("Result was NaN!");
+  if(!check_positions(length, MAX_POSITIONS)) {
     return (NULL);
   }
-  out = PyFloat_FromDouble(ret2);
-  exc = PyErr_Occurred();
-  if(out == NULL || exc != NULL) {
-    PyErr_Print();
-    perror("Could not create float object!");
+  if(!pool_from_obj(threads, &pool, &made)) {
     return (NULL);
   }
-  return (out);
+  Py_BEGIN_ALLOW_THREADS
+  out = p_log_partition(length, coupling, magnet, temp, boltzmann, pool);
+  Py_END_ALLOW_THREADS
+  pool_release(threads, pool, made);
+  return (PyFloat_FromDouble(out));
 }
 
-PyObject *fastc_p_variance(PyObject *self, PyObject *args) {
-  int length;
-  double temp, boltzmann, coupling, magnet;
-  PyObject *func, *out, *exc;
+// Parse the arguments of p_average and p_variance.
+static int parse_observe(PyObject *args, PyObject *kwds, PyObject **func,
+			 int *length, double *coupling, double *magnet,
+			 double *temp, double *boltzmann, int *batch) {
+  static char *kwlist[] = {"func", "length", "coupling", "magnet", "temp",
+			   "boltzmann", "batch", NULL};
+  *batch = 0;
+  if(!PyArg_ParseTupleAndKeywords(args, kwds, "Oidddd|i", kwlist, func,
+				  length, coupling, magnet, temp, boltzmann,
+				  batch)) {
+    return (0);
+  }
+  if(*batch < 0) {
+    PyErr_SetString(PyExc_ValueError, "The batch size can not be negative.");
+    return (0);
+  }
+  return (check_positions(*length, MAX_POSITIONS));
+}
 
-  PyErr_Clear();
-  int ret = PyArg_ParseTuple(args, "Oidddd", &func, &length, &coupling, &magnet,
-			     &temp, &boltzmann);
-  if(!ret) {
-    perror("PyArg_ParseTuple did not return 0 in fastc_p_variance!");
+// Docstring in FastcMethods
+PyObject *fastc_p_average(PyObject *self, PyObject *args, PyObject *kwds) {
+  int length, batch;
+  double temp, boltzmann, coupling, magnet, out;
+  PyObject *func;
+
+  if(!parse_observe(args, kwds, &func, &length, &coupling, &magnet, &temp,
+		    &boltzmann, &batch)) {
     return (NULL);
   }
+  out = p_average(func, length, coupling, magnet, temp, boltzmann, batch);
+  if(PyErr_Occurred()) {
+    return (NULL);
+  }
+  return (PyFloat_FromDouble(out));
+}
 
-  double ret2 = p_variance(func, length, coupling, magnet, temp, boltzmann);
-  if(isnan(ret2)) {
-    PyErr_Print();
-    perror("Result was NaN!");
+// Docstring in FastcMethods
+PyObject *fastc_p_variance(PyObject *self, PyObject *args, PyObject *kwds) {
+  int length, batch;
+  double temp, boltzmann, coupling, magnet, out;
+  PyObject *func;
+
+  if(!parse_observe(args, kwds, &func, &length, &coupling, &magnet, &temp,
+		    &boltzmann, &batch)) {
     return (NULL);
   }
-  out = PyFloat_FromDouble(ret2);
-  exc = PyErr_Occurred();
-  if(out == NULL || exc != NULL) {
-    PyErr_Print();
-    perror("Could not create float object!");
+  out = p_variance(func, length, coupling, magnet, temp, boltzmann, batch);
+  if(PyErr_Occurred()) {
+    return (NULL);
+  }
+  return (PyFloat_FromDouble(out));
+}
+
+// Convert a sequence of (couple, mag, count) tuples into a C array.
+static dos_level_t *levels_from_seq(PyObject *seq, int *len) {
+  PyObject *fast = PySequence_Fast(seq, "Levels must be a sequence.");
+  dos_level_t *levels;
+
+  if(fast == NULL) {
+    return (NULL);
+  }
+  *len = (int) PySequence_Fast_GET_SIZE(fast);
+  levels = calloc(*len + 1, sizeof(dos_level_t));
+  for(int i = 0; i < *len; i++) {
+    PyObject *count;
+    if(!PyArg_ParseTuple(PySequence_Fast_GET_ITEM(fast, i), "iiO",
+			 &(levels[i].couple), &(levels[i].mag), &count)) {
+      free(levels);
+      Py_DECREF(fast);
+      return (NULL);
+    }
+    levels[i].count = PyFloat_AsDouble(count);
+    if(PyErr_Occurred() != NULL) {
+      free(levels);
+      Py_DECREF(fast);
+      return (NULL);
+    }
+  }
+  Py_DECREF(fast);
+  return (levels);
+}
+
+// Convert a sequence of floats into a C array.
+static double *doubles_from_seq(PyObject *seq, int *len) {
+  PyObject *fast = PySequence_Fast(seq, "Expected a sequence of floats.");
+  double *out;
+
+  if(fast == NULL) {
+    return (NULL);
+  }
+  *len = (int) PySequence_Fast_GET_SIZE(fast);
+  out = calloc(*len + 1, sizeof(double));
+  for(int i = 0; i < *len; i++) {
+    out[i] = PyFloat_AsDouble(PySequence_Fast_GET_ITEM(fast, i));
+  }
+  Py_DECREF(fast);
+  if(PyErr_Occurred() != NULL) {
+    free(out);
     return (NULL);
   }
   return (out);
 }
 
+// Convert a C array into a list of floats.
+static PyObject *list_from_doubles(const double *arr, int len) {
+  PyObject *out = PyList_New(len);
+
+  if(out == NULL) {
+    return (NULL);
+  }
+  for(int i = 0; i < len; i++) {
+    PyObject *item = PyFloat_FromDouble(arr[i]);
+    if(item == NULL) {
+      Py_DECREF(out);
+      return (NULL);
+    }
+    PyList_SET_ITEM(out, i, item);
+  }
+  return (out);
+}
+
+// Convert a histogram from p_dos into a list of (couple, mag, count) tuples.
+static PyObject *list_from_counts(const uint64_t *counts, int positions) {
+  PyObject *out = PyList_New(0);
+
+  for(int eq = 0; eq <= positions && out != NULL; eq++) {
+    for(int up = 0; up <= positions; up++) {
+      uint64_t count = counts[DOS_INDEX(eq, up, positions)];
+      PyObject *level;
+      if(count == 0) {
+	continue;
+      }
+      level = Py_BuildValue("(iiK)", 2 * eq - positions, 2 * up - positions,
+			    (unsigned long long) count);
+      if(level == NULL || PyList_Append(out, level)) {
+	Py_XDECREF(level);
+	Py_CLEAR(out);
+	break;
+      }
+      Py_DECREF(level);
+    }
+  }
+  return (out);
+}
+
+// The most outputs of a plotting call.
+#define PLOT_OUTS 4
+
+/*
+ * The temperatures and outputs of a plotting call. The temperatures come from
+ * a buffer of doubles, which is used in place, or from a sequence, which is
+ * copied. The outputs are written into the caller's buffers if given. If not,
+ * they are new lists for a sequence, or new memoryviews for a buffer.
+ */
+typedef struct {
+  int len, count;
+  double *temps, *outs[PLOT_OUTS];
+  Py_buffer temps_view, out_views[PLOT_OUTS];
+  PyObject *out_objs[PLOT_OUTS];
+  int have_temps_view, have_out_views;
+} plot_io_t;
+
+// Whether a buffer is one contiguous dimension of native doubles.
+static int is_double_buffer(const Py_buffer *view) {
+  return (view->ndim == 1 && view->itemsize == sizeof(double) &&
+	  (view->format == NULL || !strcmp(view->format, "d") ||
+	   !strcmp(view->format, "@d") || !strcmp(view->format, "=d")));
+}
+
+// Get a buffer of doubles, raising if the object does not give one.
+static int get_double_buffer(PyObject *obj, Py_buffer *view, int flags) {
+  if(PyObject_GetBuffer(obj, view, flags | PyBUF_C_CONTIGUOUS | PyBUF_FORMAT)) {
+    return (0);
+  }
+  if(!is_double_buffer(view)) {
+    PyBuffer_Release(view);
+    PyErr_SetString(PyExc_TypeError,
+		    "Buffers must be one dimensional and hold doubles.");
+    return (0);
+  }
+  return (1);
+}
+
+// Free everything in a plot_io_t.
+static void plot_io_free(plot_io_t *io) {
+  if(io->have_temps_view) {
+    PyBuffer_Release(&(io->temps_view));
+  } else {
+    free(io->temps);
+  }
+  for(int k = 0; k < io->count; k++) {
+    if(io->have_out_views > k) {
+      PyBuffer_Release(&(io->out_views[k]));
+    } else if(io->out_objs[k] == NULL) {
+      free(io->outs[k]);
+    }
+    Py_XDECREF(io->out_objs[k]);
+  }
+}
+
+/*
+ * Set up the temperatures and count outputs. out is NULL or None for new
+ * outputs.
+ */
+static int plot_io_open(plot_io_t *io, PyObject *temps, PyObject *out,
+			int count) {
+  memset(io, 0, sizeof(plot_io_t));
+  io->count = count;
+  // Other buffers, such as strided or float32 arrays, are copied as sequences.
+  if(PyObject_CheckBuffer(temps) &&
+     get_double_buffer(temps, &(io->temps_view), PyBUF_SIMPLE)) {
+    io->have_temps_view = 1;
+    io->temps = (double *) io->temps_view.buf;
+    io->len = (int) io->temps_view.shape[0];
+  } else {
+    PyErr_Clear();
+    io->temps = doubles_from_seq(temps, &(io->len));
+    if(io->temps == NULL) {
+      return (0);
+    }
+  }
+
+  if(out != NULL && out != Py_None) {
+    if(!PyTuple_Check(out) || PyTuple_GET_SIZE(out) != count) {
+      PyErr_Format(PyExc_TypeError, "out must be a tuple of %d buffers.",
+		   count);
+      plot_io_free(io);
+      return (0);
+    }
+    for(int k = 0; k < count; k++) {
+      if(!get_double_buffer(PyTuple_GET_ITEM(out, k), &(io->out_views[k]),
+			    PyBUF_WRITABLE)) {
+	plot_io_free(io);
+	return (0);
+      }
+      io->have_out_views++;
+      if(io->out_views[k].shape[0] != io->len) {
+	PyErr_SetString(PyExc_ValueError,
+			"The outputs must be as long as the temperatures.");
+	plot_io_free(io);
+	return (0);
+      }
+      io->outs[k] = (double *) io->out_views[k].buf;
+      io->out_objs[k] = PyTuple_GET_ITEM(out, k);
+      Py_INCREF(io->out_objs[k]);
+    }
+    return (1);
+  }
+
+  for(int k = 0; k < count; k++) {
+    if(io->have_temps_view) {
+      // Write straight into the memory that gets returned.
+      io->out_objs[k] = PyByteArray_FromStringAndSize(NULL, (Py_ssize_t) io->len
+						      * sizeof(double));
+      if(io->out_objs[k] == NULL) {
+	plot_io_free(io);
+	return (0);
+      }
+      io->outs[k] = (double *) PyByteArray_AS_STRING(io->out_objs[k]);
+    } else {
+      io->outs[k] = calloc(io->len + 1, sizeof(double));
+      if(io->outs[k] == NULL) {
+	plot_io_free(io);
+	PyErr_NoMemory();
+	return (0);
+      }
+    }
+  }
+  return (1);
+}
+
+// Build the return value, and free everything.
+static PyObject *plot_io_close(plot_io_t *io) {
+  PyObject *out = PyTuple_New(io->count);
+
+  for(int k = 0; k < io->count && out != NULL; k++) {
+    PyObject *val = NULL;
+    if(io->have_out_views) {
+      val = io->out_objs[k];
+      Py_INCREF(val);
+    } else if(io->have_temps_view) {
+      PyObject *bytes = PyMemoryView_FromObject(io->out_objs[k]);
+      if(bytes != NULL) {
+	val = PyObject_CallMethod(bytes, "cast", "s", "d");
+	Py_DECREF(bytes);
+      }
+    } else {
+      val = list_from_doubles(io->outs[k], io->len);
+    }
+    if(val == NULL) {
+      Py_CLEAR(out);
+    } else {
+      PyTuple_SET_ITEM(out, k, val);
+    }
+  }
+  plot_io_free(io);
+  return (out);
+}
+
+// Whether a buffer is one contiguous dimension of 64-bit integers. Signed
+// integers are allowed, since NumPy makes them by default.
+static int is_config_buffer(const Py_buffer *view) {
+  const char *format = (view->format == NULL)? "B": view->format;
+
+  if(*format == '@' || *format == '=' || (PY_LITTLE_ENDIAN && *format == '<')) {
+    format++;
+  }
+  return (view->ndim == 1 && view->itemsize == sizeof(uint64_t) &&
+	  format[0] != 0 && strchr("QqLl", format[0]) != NULL && format[1] == 0);
+}
+
+// The configurations and output of energy_batch and magnet_batch.
+typedef struct batch_io_t {
+  Py_ssize_t len;
+  uint64_t *confs;
+  double *out;
+  Py_buffer confs_view, out_view;
+  PyObject *out_obj;
+  int have_confs_view, have_out_view;
+} batch_io_t;
+
+// Free everything in a batch_io_t.
+static void batch_io_free(batch_io_t *io) {
+  if(io->have_confs_view) {
+    PyBuffer_Release(&(io->confs_view));
+  } else {
+    free(io->confs);
+  }
+  if(io->have_out_view) {
+    PyBuffer_Release(&(io->out_view));
+  } else if(io->out_obj == NULL) {
+    free(io->out);
+  }
+  Py_XDECREF(io->out_obj);
+}
+
+// Set up the configurations and output, like plot_io_open.
+static int batch_io_open(batch_io_t *io, PyObject *confs, PyObject *out) {
+  memset(io, 0, sizeof(batch_io_t));
+  if(PyObject_CheckBuffer(confs) &&
+     !PyObject_GetBuffer(confs, &(io->confs_view),
+			 PyBUF_C_CONTIGUOUS | PyBUF_FORMAT)) {
+    if(!is_config_buffer(&(io->confs_view))) {
+      PyBuffer_Release(&(io->confs_view));
+      PyErr_SetString(PyExc_TypeError,
+		      "Configurations must be one dimensional and hold 64-bit "
+		      "integers.");
+      return (0);
+    }
+    io->have_confs_view = 1;
+    io->confs = (uint64_t *) io->confs_view.buf;
+    io->len = io->confs_view.shape[0];
+  } else {
+    PyObject *fast;
+    PyErr_Clear();
+    fast = PySequence_Fast(confs, "Expected a sequence of configurations.");
+    if(fast == NULL) {
+      return (0);
+    }
+    io->len = PySequence_Fast_GET_SIZE(fast);
+    io->confs = calloc(io->len + 1, sizeof(uint64_t));
+    if(io->confs == NULL) {
+      Py_DECREF(fast);
+      PyErr_NoMemory();
+      return (0);
+    }
+    for(Py_ssize_t i = 0; i < io->len; i++) {
+      io->confs[i] = (uint64_t)
+	PyLong_AsUnsignedLongLong(PySequence_Fast_GET_ITEM(fast, i));
+    }
+    Py_DECREF(fast);
+    if(PyErr_Occurred() != NULL) {
+      batch_io_free(io);
+      return (0);
+    }
+  }
+
+  if(out != NULL && out != Py_None) {
+    if(!get_double_buffer(out, &(io->out_view), PyBUF_WRITABLE)) {
+      batch_io_free(io);
+      return (0);
+    }
+    io->have_out_view = 1;
+    if(io->out_view.shape[0] != io->len) {
+      PyErr_SetString(PyExc_ValueError,
+		      "The output must be as long as the configurations.");
+      batch_io_free(io);
+      return (0);
+    }
+    io->out = (double *) io->out_view.buf;
+    io->out_obj = out;
+    Py_INCREF(out);
+  } else if(io->have_confs_view) {
+    io->out_obj = PyByteArray_FromStringAndSize(NULL, io->len * sizeof(double));
+    if(io->out_obj == NULL) {
+      batch_io_free(io);
+      return (0);
+    }
+    io->out = (double *) PyByteArray_AS_STRING(io->out_obj);
+  } else {
+    io->out = calloc(io->len + 1, sizeof(double));
+    if(io->out == NULL) {
+      batch_io_free(io);
+      PyErr_NoMemory();
+      return (0);
+    }
+  }
+  return (1);
+}
+
+// Build the return value, and free everything.
+static PyObject *batch_io_close(batch_io_t *io) {
+  PyObject *ret = NULL;
+
+  if(io->have_out_view) {
+    ret = io->out_obj;
+    Py_INCREF(ret);
+  } else if(io->have_confs_view) {
+    PyObject *bytes = PyMemoryView_FromObject(io->out_obj);
+    if(bytes != NULL) {
+      ret = PyObject_CallMethod(bytes, "cast", "s", "d");
+      Py_DECREF(bytes);
+    }
+  } else {
+    ret = list_from_doubles(io->out, (int) io->len);
+  }
+  batch_io_free(io);
+  return (ret);
+}
+
 // Docstring in FastcMethods
-PyObject *fastc_p_plots(PyObject *self, PyObject *args) {
-  int positions, len, i, threads;
-  double coupling, magnet, boltzmann;
-  double *temps, *energies, *heats, *magsus;
-  PyObject *temps_obj, *hold, *ens_list,
-    *heats_list, *magsus_list;
+PyObject *fastc_energy_batch(PyObject *self, PyObject *args, PyObject *kwds) {
+  static char *kwlist[] = {"configs", "positions", "coupling", "magnet", "out",
+			   NULL};
+  PyObject *confs, *out = NULL;
+  int pos;
+  double coupling, magnet;
+  batch_io_t io;
 
-  PyErr_Clear();
-  // Parse the arguments.
-  int ret = PyArg_ParseTuple(args, "iddOdi", &positions,
-		       &coupling, &magnet, &temps_obj, &boltzmann,
-			     &threads);
-  if(!ret) {
-    perror("Did not return 0.");
+  if(!PyArg_ParseTupleAndKeywords(args, kwds, "Oidd|O", kwlist, &confs, &pos,
+				  &coupling, &magnet, &out)) {
     return (NULL);
   }
-  // Load the temperatures into a C array.
-  temps = calloc(PyList_Size(temps_obj), sizeof(double));
-  len = PyList_Size(temps_obj);
-  for(i = 0; i < len; i++) {
-    hold = PyList_GetItem(temps_obj, i);
-    temps[i] = PyFloat_AsDouble(hold);
+  if(!check_positions(pos, 64) || !batch_io_open(&io, confs, out)) {
+    return (NULL);
   }
+  Py_BEGIN_ALLOW_THREADS;
+  energy_batch(io.confs, (size_t) io.len, pos, coupling, magnet, io.out);
+  Py_END_ALLOW_THREADS;
+  return (batch_io_close(&io));
+}
 
-  // Prep the output arrays.
-  energies = calloc(len, sizeof(double));
-  heats = calloc(len, sizeof(double));
-  magsus = calloc(len, sizeof(double));
+// Docstring in FastcMethods
+PyObject *fastc_magnet_batch(PyObject *self, PyObject *args, PyObject *kwds) {
+  static char *kwlist[] = {"configs", "positions", "out", NULL};
+  PyObject *confs, *out = NULL;
+  int pos;
+  batch_io_t io;
+
+  if(!PyArg_ParseTupleAndKeywords(args, kwds, "Oi|O", kwlist, &confs, &pos,
+				  &out)) {
+    return (NULL);
+  }
+  if(!check_positions(pos, 64) || !batch_io_open(&io, confs, out)) {
+    return (NULL);
+  }
+  Py_BEGIN_ALLOW_THREADS;
+  magnet_batch(io.confs, (size_t) io.len, pos, io.out);
+  Py_END_ALLOW_THREADS;
+  return (batch_io_close(&io));
+}
+
+// Docstring in FastcMethods
+PyObject *fastc_p_plots(PyObject *self, PyObject *args, PyObject *kwds) {
+  static char *kwlist[] = {"positions", "coupling", "magnet", "temps",
+			   "boltzmann", "threads", "block", "out", NULL};
+  int positions, block = 0, made, ret;
+  double coupling, magnet, boltzmann;
+  thread_pool_t *pool;
+  plot_io_t io;
+  PyObject *temps_obj, *threads, *out_obj = NULL;
+
+  if(!PyArg_ParseTupleAndKeywords(args, kwds, "iddOdO|iO", kwlist, &positions,
+				  &coupling, &magnet, &temps_obj, &boltzmann,
+				  &threads, &block, &out_obj)) {
+    return (NULL);
+  }
+  if(!check_positions(positions, MAX_POSITIONS)) {
+    return (NULL);
+  }
+  if(block < 0) {
+    PyErr_SetString(PyExc_ValueError, "The block size can not be negative.");
+    return (NULL);
+  }
+  if(!plot_io_open(&io, temps_obj, out_obj, 3)) {
+    return (NULL);
+  }
+  if(!pool_from_obj(threads, &pool, &made)) {
+    plot_io_free(&io);
+    return (NULL);
+  }
 
   // Calculate the values.
-  ret = p_plots(positions, coupling, magnet, boltzmann,
-		       temps, len, energies, heats, magsus, threads);
+  Py_BEGIN_ALLOW_THREADS
+  ret = p_plots_block(positions, coupling, magnet, boltzmann, io.temps,
+		      io.len, io.outs[0], io.outs[1], io.outs[2], pool, block);
+  Py_END_ALLOW_THREADS
+  pool_release(threads, pool, made);
   if(ret) {
-    free(energies);
-    free(heats);
-    free(magsus);
-    free(temps);
-    perror("Thread did not return 0.");
-    return (NULL);
-  }
-
-  ens_list = PyList_New(len);
-  heats_list = PyList_New(len);
-  magsus_list = PyList_New(len);
-  // If any are not able to be allocated, die.
-  if(ens_list == NULL) {
-    perror("Could not allocate first list.");
-  }
-  if(heats_list == NULL) {
-    perror("Could not allocate second list.");
-  }
-  if(magsus_list == NULL) {
-    perror("Could not allocate third list.");
-  }
-  if(ens_list == NULL || heats_list == NULL || magsus_list == NULL) {
-    fprintf(stderr, "%d items\n", len);
-    free(energies);
-    free(heats);
-    free(magsus);
-    free(temps);
-    return (NULL);
-  }
-
-  char buff[1025] = {0};
-  // Put the data from the C arrays into Python arrays.
-  for(i = 0; i < len; i++) {
-    int ret1 = PyList_SetItem(ens_list, i, PyFloat_FromDouble(energies[i])),
-      ret2 = PyList_SetItem(heats_list, i, PyFloat_FromDouble(heats[i])),
-      ret3 = PyList_SetItem(magsus_list, i, PyFloat_FromDouble(magsus[i]));
-    if(ret1 || ret2 || ret3) {
-      free(energies);
-      free(heats);
-      free(magsus);
-      sprintf(buff, "%d %d %d\nCould not set item %d.", ret1, ret2, ret3, i);
-      perror(buff);
+    // The only failures are allocations.
+    plot_io_free(&io);
+    return (PyErr_NoMemory());
+  }
+  return (plot_io_close(&io));
+}
+
+// Docstring in FastcMethods
+PyObject *fastc_p_dos(PyObject *self, PyObject *args, PyObject *kwds) {
+  static char *kwlist[] = {"positions", "threads", "symmetric", NULL};
+  int positions, size, ret, made, symmetric = 0;
+  uint64_t *counts;
+  thread_pool_t *pool;
+  PyObject *out, *threads;
+
+  if(!PyArg_ParseTupleAndKeywords(args, kwds, "iO|p", kwlist, &positions,
+				  &threads, &symmetric)) {
+    return (NULL);
+  }
+  if(!check_positions(positions, MAX_POSITIONS)) {
+    return (NULL);
+  }
+  if(!pool_from_obj(threads, &pool, &made)) {
+    return (NULL);
+  }
+  size = (positions + 1) * (positions + 1);
+  counts = calloc(size, sizeof(uint64_t));
+  if(counts == NULL) {
+    pool_release(threads, pool, made);
+    return (PyErr_NoMemory());
+  }
+  Py_BEGIN_ALLOW_THREADS
+  if(symmetric) {
+    ret = p_dos_necklace(positions, counts, pool);
+  } else {
+    ret = p_dos(positions, counts, pool);
+  }
+  Py_END_ALLOW_THREADS
+  pool_release(threads, pool, made);
+  if(ret) {
+    free(counts);
+    PyErr_SetString(PyExc_RuntimeError, "Could not build the density of states.");
+    return (NULL);
+  }
+
+  out = list_from_counts(counts, positions);
+  free(counts);
+  return (out);
+}
+
+// Docstring in FastcMethods
+PyObject *fastc_p_dos_range(PyObject *self, PyObject *args) {
+  int positions, width, ret, made;
+  unsigned long long start, end;
+  dos_prefix_t prefix;
+  uint64_t *counts;
+  thread_pool_t *pool;
+  PyObject *prefix_obj, *out, *threads;
+
+  if(!PyArg_ParseTuple(args, "iiOKKO", &positions, &width, &prefix_obj,
+		       &start, &end, &threads)) {
+    return (NULL);
+  }
+  if(!check_positions(width, MAX_POSITIONS)) {
+    return (NULL);
+  }
+  if(prefix_obj == Py_None && positions != width) {
+    PyErr_SetString(PyExc_ValueError,
+		    "The width must be the number of positions without a prefix.");
+    return (NULL);
+  }
+  if(prefix_obj != Py_None) {
+    if(positions <= width) {
+      PyErr_SetString(PyExc_ValueError,
+		      "The width must be less than the number of positions.");
       return (NULL);
     }
+    if(!check_positions(positions, MAX_CHAIN)) {
+      return (NULL);
+    }
+    if(!PyArg_ParseTuple(prefix_obj, "iiii", &(prefix.eq), &(prefix.up),
+			 &(prefix.first), &(prefix.last))) {
+      return (NULL);
+    }
+    // The counts are indexed by these, so they must fit the fixed sites.
+    if(prefix.eq < 0 || prefix.eq > positions - width - 1 || prefix.up < 0 ||
+       prefix.up > positions - width || (prefix.first != 0 && prefix.first != 1)
+       || (prefix.last != 0 && prefix.last != 1)) {
+      PyErr_SetString(PyExc_ValueError,
+		      "The prefix does not describe the fixed sites.");
+      return (NULL);
+    }
+  }
+  if(start > end || end > (UINT64_C(1) << width)) {
+    PyErr_SetString(PyExc_ValueError,
+		    "The range must be within the configurations of the width.");
+    return (NULL);
+  }
+  counts = calloc((size_t) (positions + 1) * (positions + 1), sizeof(uint64_t));
+  if(counts == NULL) {
+    return (PyErr_NoMemory());
+  }
+  if(!pool_from_obj(threads, &pool, &made)) {
+    free(counts);
+    return (NULL);
+  }
+  Py_BEGIN_ALLOW_THREADS
+  ret = p_dos_range(positions, width, (prefix_obj == Py_None)? NULL: &prefix,
+		    start, end, counts, pool);
+  Py_END_ALLOW_THREADS
+  pool_release(threads, pool, made);
+  if(ret) {
+    free(counts);
+    PyErr_SetString(PyExc_RuntimeError, "Could not build the density of states.");
+    return (NULL);
+  }
+
+  out = list_from_counts(counts, positions);
+  free(counts);
+  return (out);
+}
+
+// Docstring in FastcMethods
+PyObject *fastc_p_dos_plots(PyObject *self, PyObject *args, PyObject *kwds) {
+  static char *kwlist[] = {"levels", "coupling", "magnet", "temps",
+			   "boltzmann", "out", NULL};
+  int len_levels;
+  double coupling, magnet, boltzmann;
+  dos_level_t *levels;
+  plot_io_t io;
+  PyObject *levels_obj, *temps_obj, *out_obj = NULL;
+
+  if(!PyArg_ParseTupleAndKeywords(args, kwds, "OddOd|O", kwlist, &levels_obj,
+				  &coupling, &magnet, &temps_obj, &boltzmann,
+				  &out_obj)) {
+    return (NULL);
+  }
+  levels = levels_from_seq(levels_obj, &len_levels);
+  if(levels == NULL) {
+    return (NULL);
+  }
+  if(!plot_io_open(&io, temps_obj, out_obj, 3)) {
+    free(levels);
+    return (NULL);
+  }
+
+  Py_BEGIN_ALLOW_THREADS
+  dos_plots(levels, len_levels, coupling, magnet, boltzmann, io.temps, io.len,
+	    io.outs[0], io.outs[1], io.outs[2]);
+  Py_END_ALLOW_THREADS
+  free(levels);
+  return (plot_io_close(&io));
+}
+
+/*
+ * Doubles read from a buffer, in place, or copied from a sequence, like the
+ * temperatures of a plotting call.
+ */
+typedef struct {
+  int len, have_view;
+  double *vals;
+  Py_buffer view;
+} doubles_t;
+
+static int doubles_open(doubles_t *arr, PyObject *obj) {
+  memset(arr, 0, sizeof(doubles_t));
+  if(PyObject_CheckBuffer(obj) &&
+     get_double_buffer(obj, &(arr->view), PyBUF_SIMPLE)) {
+    arr->have_view = 1;
+    arr->vals = (double *) arr->view.buf;
+    if(arr->view.shape[0] > INT32_MAX) {
+      PyBuffer_Release(&(arr->view));
+      PyErr_SetString(PyExc_ValueError, "The buffer is too long.");
+      return (0);
+    }
+    arr->len = (int) arr->view.shape[0];
+    return (1);
+  }
+  PyErr_Clear();
+  arr->vals = doubles_from_seq(obj, &(arr->len));
+  return (arr->vals != NULL);
+}
+
+static void doubles_free(doubles_t *arr) {
+  if(arr->have_view) {
+    PyBuffer_Release(&(arr->view));
+  } else {
+    free(arr->vals);
+  }
+}
+
+// Docstring in FastcMethods
+PyObject *fastc_g_plots(PyObject *self, PyObject *args, PyObject *kwds) {
+  static char *kwlist[] = {"couplings", "fields", "offset", "temps",
+			   "boltzmann", "threads", "out", NULL};
+  int made, ret;
+  double offset, boltzmann;
+  graph_ham_t ham;
+  doubles_t couplings, fields;
+  thread_pool_t *pool;
+  plot_io_t io;
+  PyObject *couplings_obj, *fields_obj, *temps_obj, *threads,
+    *out_obj = NULL;
+
+  if(!PyArg_ParseTupleAndKeywords(args, kwds, "OOdOdO|O", kwlist,
+				  &couplings_obj, &fields_obj, &offset,
+				  &temps_obj, &boltzmann, &threads, &out_obj)) {
+    return (NULL);
+  }
+  if(!doubles_open(&fields, fields_obj)) {
+    return (NULL);
+  }
+  if(!check_positions(fields.len, MAX_POSITIONS)) {
+    doubles_free(&fields);
+    return (NULL);
+  }
+  if(!doubles_open(&couplings, couplings_obj)) {
+    doubles_free(&fields);
+    return (NULL);
+  }
+  if(couplings.len != fields.len * fields.len) {
+    PyErr_SetString(PyExc_ValueError,
+		    "The couplings must be a flat square matrix, with a row "
+		    "for each field.");
+    doubles_free(&couplings);
+    doubles_free(&fields);
+    return (NULL);
+  }
+  ham.len = fields.len;
+  ham.couplings = couplings.vals;
+  ham.fields = fields.vals;
+  ham.offset = offset;
+  ham.masks = calloc(ham.len, sizeof(uint64_t));
+  if(ham.masks == NULL) {
+    doubles_free(&couplings);
+    doubles_free(&fields);
+    return (PyErr_NoMemory());
+  }
+  graph_ham_masks(&ham);
+  if(!plot_io_open(&io, temps_obj, out_obj, 4)) {
+    free(ham.masks);
+    doubles_free(&couplings);
+    doubles_free(&fields);
+    return (NULL);
+  }
+  if(!pool_from_obj(threads, &pool, &made)) {
+    plot_io_free(&io);
+    free(ham.masks);
+    doubles_free(&couplings);
+    doubles_free(&fields);
+    return (NULL);
+  }
+
+  Py_BEGIN_ALLOW_THREADS
+  ret = g_plots(&ham, boltzmann, io.temps, io.len, io.outs[0], io.outs[1],
+		io.outs[2], io.outs[3], pool);
+  Py_END_ALLOW_THREADS
+  pool_release(threads, pool, made);
+  free(ham.masks);
+  doubles_free(&couplings);
+  doubles_free(&fields);
+  if(ret) {
+    plot_io_free(&io);
+    PyErr_SetString(PyExc_RuntimeError, "Could not compute the values.");
+    return (NULL);
+  }
+  return (plot_io_close(&io));
+}
+
+// Docstring in FastcMethods
+PyObject *fastc_p_dos_partition(PyObject *self, PyObject *args) {
+  int len_levels;
+  double coupling, magnet, temp, boltzmann, part;
+  dos_level_t *levels;
+  PyObject *levels_obj;
+
+  if(!PyArg_ParseTuple(args, "Odddd", &levels_obj, &coupling, &magnet,
+		       &temp, &boltzmann)) {
+    return (NULL);
+  }
+  levels = levels_from_seq(levels_obj, &len_levels);
+  if(levels == NULL) {
+    return (NULL);
+  }
+  Py_BEGIN_ALLOW_THREADS
+  part = dos_partition(levels, len_levels, coupling, magnet, temp, boltzmann);
+  Py_END_ALLOW_THREADS
+  free(levels);
+  return (PyFloat_FromDouble(part));
+}
+
+// Docstring in FastcMethods
+PyObject *fastc_p_dos_log_partition(PyObject *self, PyObject *args) {
+  int len_levels;
+  double coupling, magnet, temp, boltzmann, part;
+  dos_level_t *levels;
+  PyObject *levels_obj;
+
+  if(!PyArg_ParseTuple(args, "Odddd", &levels_obj, &coupling, &magnet,
+		       &temp, &boltzmann)) {
+    return (NULL);
+  }
+  levels = levels_from_seq(levels_obj, &len_levels);
+  if(levels == NULL) {
+    return (NULL);
+  }
+  Py_BEGIN_ALLOW_THREADS
+  part = dos_log_partition(levels, len_levels, coupling, magnet, temp,
+			   boltzmann);
+  Py_END_ALLOW_THREADS
+  free(levels);
+  return (PyFloat_FromDouble(part));
+}
+
+// The names of the observables, in the order of observable_t.
+static const char *observable_names[OBS_COUNT] = {
+  "energy", "magnet", "abs_magnet", "magnet2", "magnet4", "correlation",
+  "walls"
+};
+
+// Docstring in FastcMethods
+PyObject *fastc_p_dos_observe(PyObject *self, PyObject *args) {
+  int len_levels, length, observable = -1, ret;
+  double coupling, magnet, temp, boltzmann, mean, var;
+  const char *name;
+  dos_level_t *levels;
+  PyObject *levels_obj;
+
+  if(!PyArg_ParseTuple(args, "Oisdddd", &levels_obj, &length, &name,
+		       &coupling, &magnet, &temp, &boltzmann)) {
+    return (NULL);
+  }
+  for(int k = 0; k < OBS_COUNT; k++) {
+    if(!strcmp(name, observable_names[k])) {
+      observable = k;
+    }
   }
-  // Free up resources. I hope there are no leaks.
-  free(energies);
-  free(heats);
-  free(magsus);
-  free(temps);
-  
-  return (PyTuple_Pack(3, ens_list, heats_list, magsus_list));
+  if(observable < 0) {
+    PyErr_Format(PyExc_ValueError, "Unknown observable %s.", name);
+    return (NULL);
+  }
+  if(length <= 0) {
+    PyErr_SetString(PyExc_ValueError, "The length must be positive.");
+    return (NULL);
+  }
+  levels = levels_from_seq(levels_obj, &len_levels);
+  if(levels == NULL) {
+    return (NULL);
+  }
+  Py_BEGIN_ALLOW_THREADS
+  ret = dos_observe(levels, len_levels, length, (observable_t) observable,
+		    coupling, magnet, temp, boltzmann, &mean, &var);
+  Py_END_ALLOW_THREADS
+  free(levels);
+  if(ret) {
+    PyErr_SetString(PyExc_RuntimeError, "Could not compute the observable.");
+    return (NULL);
+  }
+  return (Py_BuildValue("(dd)", mean, var));
 }
 
 // Makes things work.
 static PyMethodDef FastcMethods[] = {
-  {"p_plots", fastc_p_plots, METH_VARARGS, "Pass the Ising plotting function"
-   " to C.\n"
+  {"p_plots", (PyCFunction) fastc_p_plots, METH_VARARGS | METH_KEYWORDS,
+   "Pass the Ising plotting function to C.\n"
    ":param int positions: The number of spin positions.\n"
    ":param float coupling: Spin coupling constant.\n"
    ":param float magnet: Spin magnetization constant.\n"
-   ":param temps: Temperatures to use.\n"
-   ":type temps: list(float)\n"
+   ":param temps: Temperatures to use. A contiguous buffer of doubles, such "
+   "as a float64 array, is read in place.\n"
+   ":type temps: list(float) or buffer\n"
    ":param float boltzmann: The Boltzmann constant.\n"
-   ":param int threads: Number of threads to use.\n"
-   ":return: Three lists of energies, heats, and magnetic susceptibilities.\n"},
+   ":param threads: Number of threads to use, or a Pool.\n"
+   ":param int block: Optional. If given, each thread finds the values for "
+   "this many temperatures at once, so each configuration's energy is found "
+   "once per block. 8 to 16 works well.\n"
+   ":param out: Optional. A tuple of three writable buffers of doubles, as "
+   "long as temps, to write the values into.\n"
+   ":return: The energies, heats, and magnetic susceptibilities. These are the "
+   "out buffers if given, memoryviews of doubles if temps is a buffer, and "
+   "lists otherwise.\n"},
   {"p_partition", fastc_p_partition, METH_VARARGS, ""},
-  {"p_average", fastc_p_average, METH_VARARGS, ""},
-  {"p_variance", fastc_p_variance, METH_VARARGS, ""},
+  {"p_log_partition", fastc_p_log_partition, METH_VARARGS, "Compute the "
+   "natural log of the partition function of a periodic chain. The sum is "
+   "done in the log domain, so it is finite at any temperature.\n"
+   ":param int positions: The number of spin positions.\n"
+   ":param float coupling: Spin coupling constant.\n"
+   ":param float magnet: Spin magnetization constant.\n"
+   ":param float temp: The temperature.\n"
+   ":param float boltzmann: The Boltzmann constant.\n"
+   ":param threads: Number of threads to use, or a Pool.\n"},
+  {"p_dos", (PyCFunction) fastc_p_dos, METH_VARARGS | METH_KEYWORDS,
+   "Find the density of states of a periodic chain by enumerating every "
+   "configuration once.\n"
+   ":param int positions: The number of spin positions.\n"
+   ":param threads: Number of threads to use, or a Pool.\n"
+   ":param bool symmetric: Optional. If true, only visit one configuration "
+   "for each set of rotations and spin flips, and count the rest from it. "
+   "This is about 2 * positions times less work, and gives the same counts.\n"
+   ":return: A list of (couple, mag, count) tuples, where couple is the sum "
+   "of the nearest neighbor spin products, mag is the magnetization, and "
+   "count is the number of configurations at that level.\n"},
+  {"p_dos_range", fastc_p_dos_range, METH_VARARGS, "Find part of the "
+   "density of states of a periodic chain. The low width sites run over the "
+   "configurations start to end, and the other sites are fixed. Histograms "
+   "from separate ranges can be summed.\n"
+   ":param int positions: The number of spin positions, at most 127.\n"
+   ":param int width: The number of low positions to enumerate, at most 63.\n"
+   ":param prefix: None if width is positions. Otherwise, a tuple of the "
+   "number of equal neighbor pairs among the fixed sites, the number of fixed "
+   "up spins, the top bit of the chain, next to bit 0, and the lowest fixed "
+   "bit, at bit width.\n"
+   ":param int start: The first configuration of the low sites.\n"
+   ":param int end: One past the last configuration of the low sites.\n"
+   ":param threads: Number of threads to use, or a Pool.\n"
+   ":return: A list of (couple, mag, count) tuples, like p_dos.\n"
+   ":raises ValueError: If the prefix does not fit the fixed sites.\n"},
+  {"p_dos_plots", (PyCFunction) fastc_p_dos_plots,
+   METH_VARARGS | METH_KEYWORDS, "Compute the plotting "
+   "values from a density of states.\n"
+   ":param levels: The levels returned by p_dos.\n"
+   ":param float coupling: Spin coupling constant.\n"
+   ":param float magnet: Spin magnetization constant.\n"
+   ":param temps: Temperatures to use. A contiguous buffer of doubles, such "
+   "as a float64 array, is read in place.\n"
+   ":type temps: list(float) or buffer\n"
+   ":param float boltzmann: The Boltzmann constant.\n"
+   ":param out: Optional. A tuple of three writable buffers of doubles, as "
+   "long as temps, to write the values into.\n"
+   ":return: The energies, heats, and magnetic susceptibilities, returned as "
+   "for p_plots.\n"},
+  {"g_plots", (PyCFunction) fastc_g_plots, METH_VARARGS | METH_KEYWORDS,
+   "Compute the plotting values of a Hamiltonian on a graph, by walking "
+   "every configuration in Gray code order.\n"
+   ":param couplings: The couplings between each pair of spins, as a flat "
+   "symmetric matrix with a zero diagonal. The energy is half the sum of the "
+   "couplings times both spins.\n"
+   ":param fields: The field on each spin. There can be at most 63 spins.\n"
+   ":param float offset: The energy that does not depend on the spins.\n"
+   ":param temps: Temperatures to use. A contiguous buffer of doubles, such "
+   "as a float64 array, is read in place.\n"
+   ":type temps: list(float) or buffer\n"
+   ":param float boltzmann: The Boltzmann constant.\n"
+   ":param threads: Number of threads to use, or a Pool.\n"
+   ":param out: Optional. A tuple of four writable buffers of doubles, as "
+   "long as temps, to write the values into.\n"
+   ":return: The natural logs of the partition function, the energies, the "
+   "heats, and the magnetic susceptibilities, returned as for p_plots.\n"},
+  {"p_dos_partition", fastc_p_dos_partition, METH_VARARGS, "Compute the "
+   "partition function from a density of states.\n"
+   ":param levels: The levels returned by p_dos.\n"
+   ":param float coupling: Spin coupling constant.\n"
+   ":param float magnet: Spin magnetization constant.\n"
+   ":param float temp: The temperature.\n"
+   ":param float boltzmann: The Boltzmann constant.\n"},
+  {"p_dos_log_partition", fastc_p_dos_log_partition, METH_VARARGS,
+   "Compute the natural log of the partition function from a density of "
+   "states.\n"
+   ":param levels: The levels returned by p_dos.\n"
+   ":param float coupling: Spin coupling constant.\n"
+   ":param float magnet: Spin magnetization constant.\n"
+   ":param float temp: The temperature.\n"
+   ":param float boltzmann: The Boltzmann constant.\n"},
+  {"p_dos_observe", fastc_p_dos_observe, METH_VARARGS, "Compute the "
+   "average and variance of a built in observable from a density of states.\n"
+   ":param levels: The levels returned by p_dos.\n"
+   ":param int length: The number of spin positions.\n"
+   ":param str observable: One of the names in OBSERVABLES.\n"
+   ":param float coupling: Spin coupling constant.\n"
+   ":param float magnet: Spin magnetization constant.\n"
+   ":param float temp: The temperature.\n"
+   ":param float boltzmann: The Boltzmann constant.\n"
+   ":return: The average and the variance.\n"},
+  {"p_average", (PyCFunction) fastc_p_average, METH_VARARGS | METH_KEYWORDS,
+   "Compute the thermal average of an observable over a periodic chain.\n"
+   ":param func: The observable. It takes a configuration as an integer.\n"
+   ":param int length: The number of spin positions.\n"
+   ":param float coupling: Spin coupling constant.\n"
+   ":param float magnet: Spin magnetization constant.\n"
+   ":param float temp: The temperature.\n"
+   ":param float boltzmann: The Boltzmann constant.\n"
+   ":param int batch: Optional. If positive, func takes a memoryview of up to "
+   "this many unsigned 64-bit configurations and returns a value for each, "
+   "as a buffer of doubles or a sequence. The memoryview is reused once func "
+   "returns.\n"
+   ":return: The average.\n"},
+  {"p_variance", (PyCFunction) fastc_p_variance, METH_VARARGS | METH_KEYWORDS,
+   "Compute the thermal variance of an observable over a periodic chain. The "
+   "arguments are the same as for p_average.\n"
+   ":return: The variance.\n"},
   {"energy", fastc_energy, METH_VARARGS, "Find the energy of a configuration "
    "as C would find it.\n"
    ":param int sp: The spin configuration.\n"
@@ -229,6 +1243,22 @@ static PyMethodDef FastcMethods[] = {
   {"magnet", fastc_magnet, METH_VARARGS, "Find the magnetization of a configuration.\n"
    ":param int sp: The spin configuration.\n"
    ":param int length: The number of positions.\n"},
+  {"energy_batch", (PyCFunction) fastc_energy_batch, METH_VARARGS | METH_KEYWORDS,
+   "Find the energies of many periodic configurations at once.\n"
+   ":param configs: A buffer of 64-bit integers, such as a NumPy array, or a "
+   "sequence of integers.\n"
+   ":param int positions: The number of positions.\n"
+   ":param double coupling: The spin coupling constant.\n"
+   ":param double magnet: The magnetization constant.\n"
+   ":param out: Optional. A writable buffer of doubles as long as configs.\n"
+   ":return: out if it is given. Otherwise, a memoryview of doubles if configs "
+   "is a buffer, or a list.\n"},
+  {"magnet_batch", (PyCFunction) fastc_magnet_batch, METH_VARARGS | METH_KEYWORDS,
+   "Find the magnetizations of many configurations at once, as doubles.\n"
+   ":param configs: A buffer of 64-bit integers, or a sequence of integers.\n"
+   ":param int positions: The number of positions.\n"
+   ":param out: Optional. A writable buffer of doubles as long as configs.\n"
+   ":return: The same as for energy_batch.\n"},
   {NULL, NULL, 0, NULL}
 };
 
@@ -243,5 +1273,29 @@ static struct PyModuleDef fastcmodule = {
 
 // Makes things work.
 PyMODINIT_FUNC PyInit_fastc(void) {
-  return PyModule_Create(&fastcmodule);
+  PyObject *module, *names;
+
+  if(PyType_Ready(&PoolType) < 0) {
+    return (NULL);
+  }
+  module = PyModule_Create(&fastcmodule);
+  if(module == NULL) {
+    return (NULL);
+  }
+  Py_INCREF(&PoolType);
+  if(PyModule_AddObject(module, "Pool", (PyObject *) &PoolType) < 0) {
+    Py_DECREF(&PoolType);
+    Py_DECREF(module);
+    return (NULL);
+  }
+  names = PyTuple_New(OBS_COUNT);
+  for(int k = 0; names != NULL && k < OBS_COUNT; k++) {
+    PyTuple_SET_ITEM(names, k, PyUnicode_FromString(observable_names[k]));
+  }
+  if(names == NULL || PyModule_AddObject(module, "OBSERVABLES", names) < 0) {
+    Py_XDECREF(names);
+    Py_DECREF(module);
+    return (NULL);
+  }
+  return (module);
 }
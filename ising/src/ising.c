@@ -15,26 +15,341 @@
 #include "ising.h"
 #include <stdio.h>
 #include <stdint.h>
+#include <string.h>
 #ifndef NO_PYTHON
 #  include <Python.h>
 #endif
 
+/*
+ * A pool of worker threads that sleep between jobs. The thread that runs a job
+ * does the first task itself, so a pool of n threads has n - 1 workers.
+ */
+#ifdef _WIN32
+typedef SRWLOCK pool_lock_t;
+typedef CONDITION_VARIABLE pool_cond_t;
+typedef HANDLE pool_thread_t;
+#  define POOL_LOCK_INIT(L) InitializeSRWLock(L)
+#  define POOL_LOCK_FREE(L)
+#  define POOL_LOCK(L) AcquireSRWLockExclusive(L)
+#  define POOL_UNLOCK(L) ReleaseSRWLockExclusive(L)
+#  define POOL_COND_INIT(C) InitializeConditionVariable(C)
+#  define POOL_COND_FREE(C)
+#  define POOL_WAIT(C, L) SleepConditionVariableSRW(C, L, INFINITE, 0)
+#  define POOL_WAKE(C) WakeAllConditionVariable(C)
+#else
+typedef pthread_mutex_t pool_lock_t;
+typedef pthread_cond_t pool_cond_t;
+typedef pthread_t pool_thread_t;
+#  define POOL_LOCK_INIT(L) pthread_mutex_init(L, NULL)
+#  define POOL_LOCK_FREE(L) pthread_mutex_destroy(L)
+#  define POOL_LOCK(L) pthread_mutex_lock(L)
+#  define POOL_UNLOCK(L) pthread_mutex_unlock(L)
+#  define POOL_COND_INIT(C) pthread_cond_init(C, NULL)
+#  define POOL_COND_FREE(C) pthread_cond_destroy(C)
+#  define POOL_WAIT(C, L) pthread_cond_wait(C, L)
+#  define POOL_WAKE(C) pthread_cond_broadcast(C)
+#endif
+
+typedef struct {
+  thread_pool_t *pool;
+  int index;
+} pool_worker_t;
+
+struct thread_pool {
+  int threads, shutdown, pending;
+  uint64_t generation;
+  pool_func_t func;
+  char *args;
+  size_t size;
+  // lock protects the job, and run keeps two jobs from sharing the pool.
+  pool_lock_t lock, run;
+  pool_cond_t start, done;
+  pool_worker_t *workers;
+  pool_thread_t *handles;
+};
+
+// Wait for jobs, and do this worker's part of each.
+#ifdef _WIN32
+static DWORD WINAPI pool_work(void *arg) {
+#else
+static void *pool_work(void *arg) {
+#endif
+  pool_worker_t *worker = (pool_worker_t *) arg;
+  thread_pool_t *pool = worker->pool;
+  uint64_t seen = 0;
+
+  while(1) {
+    pool_func_t func;
+    void *args;
+    POOL_LOCK(&(pool->lock));
+    while(pool->generation == seen && !pool->shutdown) {
+      POOL_WAIT(&(pool->start), &(pool->lock));
+    }
+    if(pool->shutdown) {
+      POOL_UNLOCK(&(pool->lock));
+      break;
+    }
+    seen = pool->generation;
+    func = pool->func;
+    args = pool->args + worker->index * pool->size;
+    POOL_UNLOCK(&(pool->lock));
+
+    func(args);
+
+    POOL_LOCK(&(pool->lock));
+    if(--(pool->pending) == 0) {
+      POOL_WAKE(&(pool->done));
+    }
+    POOL_UNLOCK(&(pool->lock));
+  }
+  return (0);
+}
+
+// Documentation in ising.h
+thread_pool_t *pool_create(int threads) {
+  thread_pool_t *pool;
+
+  if(threads < 1) {
+    return (NULL);
+  }
+  pool = calloc(1, sizeof(thread_pool_t));
+  if(pool == NULL) {
+    return (NULL);
+  }
+  pool->workers = calloc(threads, sizeof(pool_worker_t));
+  pool->handles = calloc(threads, sizeof(pool_thread_t));
+  if(pool->workers == NULL || pool->handles == NULL) {
+    free(pool->workers);
+    free(pool->handles);
+    free(pool);
+    return (NULL);
+  }
+  POOL_LOCK_INIT(&(pool->lock));
+  POOL_LOCK_INIT(&(pool->run));
+  POOL_COND_INIT(&(pool->start));
+  POOL_COND_INIT(&(pool->done));
+  pool->threads = 1;
+  for(int i = 1; i < threads; i++) {
+    pool->workers[i].pool = pool;
+    pool->workers[i].index = i;
+#ifdef _WIN32
+    pool->handles[i] = CreateThread(NULL, 0, pool_work, &(pool->workers[i]),
+				    0, NULL);
+    if(pool->handles[i] == NULL) {
+      break;
+    }
+#else
+    if(pthread_create(&(pool->handles[i]), NULL, pool_work,
+		      &(pool->workers[i]))) {
+      break;
+    }
+#endif
+    // If a thread can't be made, make do with the ones that could.
+    pool->threads = i + 1;
+  }
+  return (pool);
+}
+
+// Documentation in ising.h
+void pool_destroy(thread_pool_t *pool) {
+  if(pool == NULL) {
+    return;
+  }
+  POOL_LOCK(&(pool->lock));
+  pool->shutdown = 1;
+  POOL_WAKE(&(pool->start));
+  POOL_UNLOCK(&(pool->lock));
+  for(int i = 1; i < pool->threads; i++) {
+#ifdef _WIN32
+    WaitForSingleObject(pool->handles[i], INFINITE);
+    CloseHandle(pool->handles[i]);
+#else
+    pthread_join(pool->handles[i], NULL);
+#endif
+  }
+  POOL_LOCK_FREE(&(pool->lock));
+  POOL_LOCK_FREE(&(pool->run));
+  POOL_COND_FREE(&(pool->start));
+  POOL_COND_FREE(&(pool->done));
+  free(pool->workers);
+  free(pool->handles);
+  free(pool);
+}
+
+// Documentation in ising.h
+int pool_threads(const thread_pool_t *pool) {
+  return ((pool == NULL)? 1: pool->threads);
+}
+
+// Documentation in ising.h
+int pool_run(thread_pool_t *pool, pool_func_t func, void *args, size_t size) {
+  if(pool == NULL || pool->threads == 1) {
+    func(args);
+    return (0);
+  }
+  POOL_LOCK(&(pool->run));
+  POOL_LOCK(&(pool->lock));
+  pool->func = func;
+  pool->args = (char *) args;
+  pool->size = size;
+  pool->pending = pool->threads - 1;
+  pool->generation++;
+  POOL_WAKE(&(pool->start));
+  POOL_UNLOCK(&(pool->lock));
+
+  // Don't leave this thread all alone. It needs work too.
+  func(args);
+
+  POOL_LOCK(&(pool->lock));
+  while(pool->pending > 0) {
+    POOL_WAIT(&(pool->done), &(pool->lock));
+  }
+  POOL_UNLOCK(&(pool->lock));
+  POOL_UNLOCK(&(pool->run));
+  return (0);
+}
+
+/*
+ * Running sums of Boltzmann weights in the log domain. The weights are scaled so
+ * that the largest one seen so far is one, and the first and second moments of
+ * two values are taken about the values at that weight. This keeps everything
+ * finite at low temperatures, and keeps the variances from cancelling.
+ */
+typedef struct {
+  double shift, part;
+  double ref[2], sum1[2], sum2[2];
+} log_sum_t;
+
+static inline void log_sum_init(log_sum_t *acc) {
+  acc->shift = -INFINITY;
+  acc->part = 0;
+  for(int k = 0; k < 2; k++) {
+    acc->ref[k] = 0;
+    acc->sum1[k] = 0;
+    acc->sum2[k] = 0;
+  }
+}
+
+// Move the sums to a larger shift and new reference values.
+static inline void log_sum_rebase(log_sum_t *acc, double shift,
+				  const double *ref) {
+  double scale = (acc->part == 0)? 0: exp(acc->shift - shift);
+  acc->part *= scale;
+  for(int k = 0; k < 2; k++) {
+    double diff = acc->ref[k] - ref[k];
+    acc->sum1[k] *= scale;
+    acc->sum2[k] = acc->sum2[k] * scale + 2 * diff * acc->sum1[k] +
+      diff * diff * acc->part;
+    acc->sum1[k] += diff * acc->part;
+    acc->ref[k] = ref[k];
+  }
+  acc->shift = shift;
+}
+
+// Add count configurations with the log weight expo and values x and y.
+static inline void log_sum_add(log_sum_t *acc, double expo, double count,
+			       double x, double y) {
+  double weight, dx, dy;
+  if(expo > acc->shift) {
+    double ref[2] = {x, y};
+    log_sum_rebase(acc, expo, ref);
+  }
+  weight = count * exp(expo - acc->shift);
+  dx = x - acc->ref[0];
+  dy = y - acc->ref[1];
+  acc->part += weight;
+  acc->sum1[0] += weight * dx;
+  acc->sum2[0] += weight * dx * dx;
+  acc->sum1[1] += weight * dy;
+  acc->sum2[1] += weight * dy * dy;
+}
+
+/*
+ * Add a configuration and its spin flip, which has the same energy and the
+ * opposite magnetization, with one exponential.
+ */
+static inline void log_sum_add_flip(log_sum_t *acc, double expo, double x,
+				    double y) {
+  double weight, dx, dy, dflip;
+  if(expo > acc->shift) {
+    double ref[2] = {x, y};
+    log_sum_rebase(acc, expo, ref);
+  }
+  weight = exp(expo - acc->shift);
+  dx = x - acc->ref[0];
+  dy = y - acc->ref[1];
+  dflip = -y - acc->ref[1];
+  acc->part += 2 * weight;
+  acc->sum1[0] += 2 * weight * dx;
+  acc->sum2[0] += 2 * weight * dx * dx;
+  acc->sum1[1] += weight * (dy + dflip);
+  acc->sum2[1] += weight * (dy * dy + dflip * dflip);
+}
+
+// Add the sums from src into acc.
+static inline void log_sum_merge(log_sum_t *acc, const log_sum_t *src) {
+  log_sum_t hold = *src;
+  if(hold.part == 0) {
+    return;
+  }
+  if(hold.shift > acc->shift) {
+    log_sum_rebase(acc, hold.shift, hold.ref);
+  } else {
+    log_sum_rebase(&hold, acc->shift, acc->ref);
+  }
+  acc->part += hold.part;
+  for(int k = 0; k < 2; k++) {
+    acc->sum1[k] += hold.sum1[k];
+    acc->sum2[k] += hold.sum2[k];
+  }
+}
+
+static inline double log_sum_log(const log_sum_t *acc) {
+  return (acc->shift + log(acc->part));
+}
+
+static inline double log_sum_mean(const log_sum_t *acc, int k) {
+  return (acc->ref[k] + acc->sum1[k] / acc->part);
+}
+
+static inline double log_sum_var(const log_sum_t *acc, int k) {
+  double mean = acc->sum1[k] / acc->part;
+  return (acc->sum2[k] / acc->part - mean * mean);
+}
+
 // Structures the data to pass to each thread.
 typedef struct {
   int index, threads;
-  int positions, len;
+  int positions, len, block;
   double coupling, magnet, boltzmann;
   double const *temps;
   double *out_ens, *out_heat, *out_magsus;
+  // Set by a thread that could not allocate its buffers.
+  int error;
 } pass_args_t;
 
 typedef struct {
   int index, threads;
-  int positions, len;
+  int positions;
+  uint64_t len;
   double coupling, magnet, boltzmann, temp;
-  double *sum;
+  log_sum_t *sum;
 } pass_args_small_t;
 
+typedef struct {
+  int positions, width;
+  const dos_prefix_t *prefix;
+  uint64_t start, end;
+  uint64_t *counts;
+} pass_args_dos_t;
+
+typedef struct {
+  int index, threads, len, flip;
+  const graph_ham_t *ham;
+  double const *beta;
+  log_sum_t *sums;
+} pass_args_graph_t;
+
 #ifndef NO_PYTHON
 typedef struct {
   int index, threads, positions, len;
@@ -51,8 +366,9 @@ typedef struct {
 } pass_args_var_t;
 #endif
 
-// Precomputed bit counts.
-static char bit_counts[] = { 0, 1, 1, 2, 1, 2, 2, 3, 1, 2, 2, 3, 2, 3, 3, 4,
+#if !defined(__GNUC__) && !defined(__clang__)
+// Precomputed bit counts, for compilers without a popcount builtin.
+static const char bit_counts[] = { 0, 1, 1, 2, 1, 2, 2, 3, 1, 2, 2, 3, 2, 3, 3, 4,
 			    1, 2, 2, 3, 2, 3, 3, 4, 2, 3, 3, 4, 3, 4, 4, 5,
 			    1, 2, 2, 3, 2, 3, 3, 4, 2, 3, 3, 4, 3, 4, 4, 5,
 			    2, 3, 3, 4, 3, 4, 4, 5, 3, 4, 4, 5, 4, 5, 5, 6,
@@ -68,95 +384,325 @@ static char bit_counts[] = { 0, 1, 1, 2, 1, 2, 2, 3, 1, 2, 2, 3, 2, 3, 3, 4,
 			    3, 4, 4, 5, 4, 5, 5, 6, 4, 5, 5, 6, 5, 6, 6, 7,
 			    3, 4, 4, 5, 4, 5, 5, 6, 4, 5, 5, 6, 5, 6, 6, 7,
 			    4, 5, 5, 6, 5, 6, 6, 7, 5, 6, 6, 7, 6, 7, 7, 8 };
+#endif
 
-// Splits a 32 bit value into 8 bit chunks.
+// Count the number of active bits. Use the hardware instruction if we can.
+static inline int bitcount(uint64_t in) {
+#if defined(__GNUC__) || defined(__clang__)
+  return (__builtin_popcountll(in));
+#else
+  int out = 0;
+  for(int i = 0; i < 64; i += 8) {
+    out += bit_counts[(in >> i) & 0xff];
+  }
+  return (out);
+#endif
+}
+
+// The lowest L bits set.
+#define MASK(L) (((L) >= 64)? ~UINT64_C(0): (UINT64_C(1) << (L)) - 1)
+
+// Do this operation quickly. See ising.spins.SpinConfig.magnetization for source
+#define MAGNETIZATION(I, L) ((bitcount((uint64_t) (I)) * 2) - (L))
+
+// Do this in bit operations instead of multiplications.
+#define P_SPINCOUPLE(I, L) \
+  ((bitcount((((((uint64_t) (I)) << ((L) - 1)) | (((uint64_t) (I)) >> 1)) ^ \
+	       ~((uint64_t) (I))) & MASK(L)) * 2) - (L))
+
+// The index of the lowest set bit. in must not be zero.
+static inline int lowbit(uint64_t in) {
+#if defined(__GNUC__) || defined(__clang__)
+  return (__builtin_ctzll(in));
+#else
+  int out = 0;
+  while(!(in & 1)) {
+    in >>= 1;
+    out++;
+  }
+  return (out);
+#endif
+}
+
+// The index of the highest set bit. in must not be zero.
+static inline int highbit(uint64_t in) {
+#if defined(__GNUC__) || defined(__clang__)
+  return (63 - __builtin_clzll(in));
+#else
+  int out = 0;
+  while(in >>= 1) {
+    out++;
+  }
+  return (out);
+#endif
+}
+
+// A spin as +1 or -1.
+#define SPIN(I, B) ((int) ((((uint64_t) (I)) >> (B)) & 1) * 2 - 1)
+
+/*
+ * Whether the exact kernels walk the configurations in Gray code order. Each
+ * step then flips one spin, so the coupling sum is updated from that spin's
+ * neighbours. When popcount is one instruction, finding the values of each
+ * configuration directly is faster than that, so the walk just counts up.
+ * Build with -DGRAY_WALK=0 or 1 to choose.
+ */
+#ifndef GRAY_WALK
+#  if defined(__POPCNT__) || defined(__aarch64__)
+#    define GRAY_WALK 0
+#  else
+#    define GRAY_WALK 1
+#  endif
+#endif
+
+/*
+ * Walks the configurations start <= i < end of the low width sites of a chain.
+ * In Gray code order, the range is split into aligned blocks of a power of two,
+ * and each block is walked so that consecutive configurations differ by one
+ * spin. For a ring of width sites, site 0 and site width - 1 are neighbours.
+ * Otherwise, they are next to the fixed sites described by a dos_prefix_t, and
+ * eq and up count the fixed sites too. eq is the number of equal neighbouring
+ * pairs, as in DOS_INDEX, so the coupling sum is 2 * eq - positions.
+ */
 typedef struct {
-  uint8_t a: 8, b:8, c:8, d:8;
-} bitvec_32_t;
+  uint64_t conf, step, steps, next, end;
+  int width, ring, bonds, first, last, base_eq, base_up;
+  int eq, up;
+} walk_t;
 
-// Convert between the two.
-typedef union {
-  uint32_t in;
-  bitvec_32_t vec;
-} conv_t;
+// Find the values of the current configuration from scratch.
+static inline void walk_values(walk_t *walk) {
+  uint64_t conf = walk->conf;
+  int width = walk->width;
+  walk->up = walk->base_up + bitcount(conf);
+  if(walk->ring) {
+    walk->eq = bitcount((((conf << (width - 1)) | (conf >> 1)) ^ ~conf) &
+			MASK(width));
+  } else {
+    walk->eq = walk->base_eq + width - 1 -
+      bitcount((conf ^ (conf >> 1)) & MASK(width - 1)) +
+      (walk->last == (int) ((conf >> (width - 1)) & 1)) +
+      (walk->first == (int) (conf & 1));
+  }
+}
 
-// Count the number of active bits.
-static inline int bitcount(uint32_t in) {
-  conv_t conv;
-  conv.in = in;
-  bitvec_32_t vec = conv.vec;
-  return (bit_counts[vec.a] + bit_counts[vec.b] + bit_counts[vec.c] +
-	  bit_counts[vec.d]);
+// Start the Gray code block of the walk at conf.
+static inline void walk_block(walk_t *walk, uint64_t conf) {
+  int bits = highbit(walk->end - conf);
+  if(conf != 0 && lowbit(conf) < bits) {
+    bits = lowbit(conf);
+  }
+  walk->conf = conf;
+  walk->step = 0;
+  walk->steps = UINT64_C(1) << bits;
+  walk->next = conf + walk->steps;
+  walk_values(walk);
 }
 
-// Do this operation quickly. See ising.spins.SpinConfig.magnetization for source
-#define MAGNETIZATION(I, L) ((bitcount((uint32_t) I) * 2) - L)
+/*
+ * Start a walk. prefix is NULL for a ring of width sites. Returns zero if the
+ * range is empty.
+ */
+static inline int walk_init(walk_t *walk, int width,
+			    const dos_prefix_t *prefix, uint64_t start,
+			    uint64_t end) {
+  walk->width = width;
+  walk->end = end;
+  walk->ring = (prefix == NULL);
+  // A ring of one site is always coupled to itself.
+  walk->bonds = !(walk->ring && width == 1);
+  if(walk->ring) {
+    walk->first = walk->last = walk->base_eq = walk->base_up = 0;
+  } else {
+    walk->first = prefix->first;
+    walk->last = prefix->last;
+    walk->base_eq = prefix->eq;
+    walk->base_up = prefix->up;
+  }
+  walk->eq = walk->up = 0;
+  if(start >= end) {
+    return (0);
+  }
+  walk_block(walk, start);
+  return (1);
+}
 
-// Do this in bit operations instead of multiplications.
-#define P_SPINCOUPLE(I, L) ((bitcount((uint32_t) (((I << (L - 1)) | I >> 1) ^ ~I) & ~((0xffffffff) << L)) * 2) - L)
+// Flip one spin, and update the coupling sum from its neighbours.
+static inline void walk_flip(walk_t *walk, int bit) {
+  uint64_t conf = walk->conf;
+  // Put the neighbour of site 0 below it, and the neighbour of the top above.
+  uint64_t low = (conf << 1) | (walk->ring? (conf >> (walk->width - 1)) & 1:
+				(uint64_t) walk->first),
+    high = conf | ((walk->ring? conf & 1: (uint64_t) walk->last) <<
+		   walk->width);
+  int spin = SPIN(conf, bit), near = SPIN(low, bit) + SPIN(high, bit + 1);
+  walk->eq -= spin * near * walk->bonds;
+  walk->up -= spin;
+  walk->conf = conf ^ (UINT64_C(1) << bit);
+}
 
-double energy(uint32_t sp, int pos, double coupling, double magnet) {
-  double mag = MAGNETIZATION(sp, pos);
-  double coup = P_SPINCOUPLE(sp, pos);
+// Move to the next configuration. Returns zero once the walk is done.
+static inline int walk_next(walk_t *walk) {
+#if GRAY_WALK
+  if(++(walk->step) < walk->steps) {
+    walk_flip(walk, lowbit(walk->step));
+    return (1);
+  }
+  if(walk->next >= walk->end || walk->next == 0) {
+    return (0);
+  }
+  walk_block(walk, walk->next);
+  return (1);
+#else
+  // The values one past the end are found too, but never used.
+  walk->conf++;
+  walk_values(walk);
+  return (walk->conf < walk->end);
+#endif
+}
+
+double energy(uint64_t sp, int pos, double coupling, double magnet) {
+  double mag = MAGNETIZATION(sp & MASK(pos), pos);
+  double coup = P_SPINCOUPLE(sp & MASK(pos), pos);
   return (-coupling * coup + magnet * mag);
 }
 
-int magnet(uint32_t sp, int pos) {
-  int on = bitcount(sp & (0xffffffff >> (32 - pos))),
-    off = bitcount(~sp & (0xffffffff >> (32 - pos)));
+int magnet(uint64_t sp, int pos) {
+  int on = bitcount(sp & MASK(pos)),
+    off = bitcount(~sp & MASK(pos));
   return (on - off);
 }
 
+void energy_batch(uint64_t const *confs, size_t len, int pos, double coupling,
+		  double magnet, double *out) {
+  for(size_t i = 0; i < len; i++) {
+    out[i] = energy(confs[i], pos, coupling, magnet);
+  }
+}
+
+void magnet_batch(uint64_t const *confs, size_t len, int pos, double *out) {
+  for(size_t i = 0; i < len; i++) {
+    out[i] = MAGNETIZATION(confs[i] & MASK(pos), pos);
+  }
+}
+
 // Compute the energies, heat capacities, and magnetic susceptibilities.
-#ifdef _WIN32
-static DWORD p_compute_vals(void *arg) {
-#else
-static void *p_compute_vals(void *arg) {
-#endif
+static void p_compute_vals(void *arg) {
   pass_args_t *pass = (pass_args_t *) arg;
 
   for(int i = pass->index; i < pass->len; i += pass->threads) {
-    double part = 0, energy = 0, heat = 0, magsus = 0, magav = 0,
-      expo = 0, en = 0, mag = 0;
-    for(int j = 0; j < (1 << pass->positions); j++) {
-      mag = MAGNETIZATION(j, pass->positions);
-      en = -pass->coupling * P_SPINCOUPLE(j, pass->positions) +
+    double beta = 1 / (pass->temps[i] * pass->boltzmann);
+    log_sum_t acc;
+    walk_t walk;
+    log_sum_init(&acc);
+    for(int more = walk_init(&walk, pass->positions, NULL, 0,
+			     UINT64_C(1) << pass->positions);
+	more; more = walk_next(&walk)) {
+      double mag = 2 * walk.up - pass->positions,
+	en = -pass->coupling * (2 * walk.eq - pass->positions) +
 	pass->magnet * mag;
-      expo = exp(-en / (pass->temps[i] * pass->boltzmann));
-      part += expo;
-      energy += expo * en;
-      heat += en * en * expo;
-      magsus += mag * mag * expo;
-      magav += mag * expo;
-    }
-    pass->out_ens[i] = energy / part;
-    pass->out_heat[i] = (heat / part - (energy / part) * (energy / part)) /
+      log_sum_add(&acc, -en * beta, 1, en, mag);
+    }
+    pass->out_ens[i] = log_sum_mean(&acc, 0);
+    pass->out_heat[i] = log_sum_var(&acc, 0) /
       (pass->temps[i] * pass->temps[i] *  pass->boltzmann);
-    pass->out_magsus[i] = (magsus / part - magav * magav / (part * part)) /
+    pass->out_magsus[i] = log_sum_var(&acc, 1) /
       (pass->temps[i] * pass->boltzmann);
   }
-  return (0);
+}
+
+/*
+ * Compute the same values for blocks of temperatures. Each configuration is
+ * found once per block, and the weights at every temperature are relative to
+ * the lowest energy seen so far, so the loop over the block has no branches.
+ */
+static void p_compute_block(void *arg) {
+  pass_args_t *pass = (pass_args_t *) arg;
+  int block = pass->block, pos = pass->positions;
+  double *beta = calloc(6 * (size_t) block, sizeof(double)),
+    *part = beta + block, *en1 = part + block, *en2 = en1 + block,
+    *mag1 = en2 + block, *mag2 = mag1 + block;
+
+  if(beta == NULL) {
+    pass->error = 1;
+    return;
+  }
+  for(int start = pass->index * block; start < pass->len;
+      start += pass->threads * block) {
+    int len = (pass->len - start < block)? pass->len - start: block;
+    double emin = INFINITY, mag_ref = 0;
+    walk_t walk;
+    for(int t = 0; t < len; t++) {
+      beta[t] = 1 / (pass->temps[start + t] * pass->boltzmann);
+      part[t] = en1[t] = en2[t] = mag1[t] = mag2[t] = 0;
+    }
+    for(int more = walk_init(&walk, pos, NULL, 0, UINT64_C(1) << pos);
+	more; more = walk_next(&walk)) {
+      double mag = 2 * walk.up - pos,
+	en = -pass->coupling * (2 * walk.eq - pos) + pass->magnet * mag,
+	de, dm;
+      if(en < emin) {
+	// Rescale to the new lowest energy, and take the moments about it.
+	double diff_e = emin - en, diff_m = mag_ref - mag;
+	for(int t = 0; t < len && emin != INFINITY; t++) {
+	  double scale = exp(-diff_e * beta[t]);
+	  part[t] *= scale;
+	  en1[t] *= scale;
+	  mag1[t] *= scale;
+	  en2[t] = en2[t] * scale + 2 * diff_e * en1[t] +
+	    diff_e * diff_e * part[t];
+	  mag2[t] = mag2[t] * scale + 2 * diff_m * mag1[t] +
+	    diff_m * diff_m * part[t];
+	  en1[t] += diff_e * part[t];
+	  mag1[t] += diff_m * part[t];
+	}
+	emin = en;
+	mag_ref = mag;
+      }
+      de = en - emin;
+      dm = mag - mag_ref;
+      for(int t = 0; t < len; t++) {
+	double weight = exp(-de * beta[t]);
+	part[t] += weight;
+	en1[t] += weight * de;
+	en2[t] += weight * de * de;
+	mag1[t] += weight * dm;
+	mag2[t] += weight * dm * dm;
+      }
+    }
+    for(int t = 0; t < len; t++) {
+      double mean_e = en1[t] / part[t], mean_m = mag1[t] / part[t],
+	temp = pass->temps[start + t];
+      pass->out_ens[start + t] = emin + mean_e;
+      pass->out_heat[start + t] = (en2[t] / part[t] - mean_e * mean_e) /
+	(temp * temp * pass->boltzmann);
+      pass->out_magsus[start + t] = (mag2[t] / part[t] - mean_m * mean_m) /
+	(temp * pass->boltzmann);
+    }
+  }
+  free(beta);
 }
 
 // Documentation in ising.h
 int p_plots(int positions, double coupling, double magnet,
 		      double boltzmann, double const *temps, int len_temps,
 		   double *out_ens, double *out_heat, double *mag_sus,
-		   int threads) {
+		   thread_pool_t *pool) {
+  return (p_plots_block(positions, coupling, magnet, boltzmann, temps,
+			len_temps, out_ens, out_heat, mag_sus, pool, 0));
+}
 
-  // This thread is also going to be used, which is why it's threads - 1.
-#ifdef _WIN32
-  HANDLE *thread = calloc(threads - 1, sizeof(HANDLE));
-  DWORD *ids = calloc(threads - 1, sizeof(DWORD));
-#else
-  pthread_t *thread = calloc(threads - 1, sizeof(pthread_t));
-  pthread_attr_t *attr = calloc(threads - 1, sizeof(pthread_attr_t));
-#endif
-  
+// Documentation in ising.h
+int p_plots_block(int positions, double coupling, double magnet,
+		  double boltzmann, double const *temps, int len_temps,
+		  double *out_ens, double *out_heat, double *mag_sus,
+		  thread_pool_t *pool, int block) {
+  int threads = pool_threads(pool);
   pass_args_t *pass_args = calloc(threads, sizeof(pass_args_t));
-  void *rets;
 
-  // Set up and run the threads.
+  if(pass_args == NULL) {
+    return (-1);
+  }
   for(int i = 0; i < threads; i++) {
     pass_args[i].index = i;
     pass_args[i].threads = threads;
@@ -169,166 +715,695 @@ int p_plots(int positions, double coupling, double magnet,
     pass_args[i].out_ens = out_ens;
     pass_args[i].out_heat = out_heat;
     pass_args[i].out_magsus = mag_sus;
-    if(i != threads - 1) {
-#ifdef _WIN32
-      thread[i] = CreateThread(NULL, 0, p_compute_vals, &(pass_args[i]), 0,
-			    &(ids[i]));
-#else
-      pthread_attr_init(&(attr[i]));
-      pthread_create(&(thread[i]), &(attr[i]), p_compute_vals, &(pass_args[i]));
-#endif
-    }
+    pass_args[i].block = block;
   }
-
-  // Don't leave this thread all alone. It needs work too.
-  p_compute_vals(&(pass_args[threads - 1]));
-
-#ifdef _WIN32
-  WaitForMultipleObjects(threads - 1, thread, TRUE, INFINITE);
-#else
-  for(int i = 0; i < threads - 1; i++) {
-    pthread_join(thread[i], &rets);
+  pool_run(pool, (block > 0)? p_compute_block: p_compute_vals, pass_args,
+	   sizeof(pass_args_t));
+  for(int i = 0; i < threads; i++) {
+    if(pass_args[i].error) {
+      free(pass_args);
+      return (-1);
+    }
   }
-#endif
-    
-  // I hope there are no leaks.
-#ifdef _WIN32
-  free(thread);
   free(pass_args);
-  free(ids);
-#else
-  free(pass_args);
-  free(thread);
-  free(attr);
-#endif
-
   return (0);
 }
 
-#ifdef _WIN32
-static DWORD p_compute_partition(void *arg) {
-#else
-static void *p_compute_partition(void *arg) {
-#endif
+static void p_compute_partition(void *arg) {
 
   pass_args_small_t *pass = (pass_args_small_t *) arg;
+  // Each thread walks a contiguous range.
+  uint64_t chunk = pass->len / pass->threads + 1,
+    start = pass->index * chunk, end = start + chunk;
+  walk_t walk;
 
-  for(int i = pass->index; i < pass->len; i += pass->threads) {
-    double mag = MAGNETIZATION(i, pass->positions);
-    double energy = -pass->coupling * P_SPINCOUPLE(i, pass->positions) +
+  if(end > pass->len) {
+    end = pass->len;
+  }
+  for(int more = walk_init(&walk, pass->positions, NULL, start, end);
+      more; more = walk_next(&walk)) {
+    double mag = 2 * walk.up - pass->positions;
+    double energy = -pass->coupling * (2 * walk.eq - pass->positions) +
       pass->magnet * mag;
-    *(pass->sum) += exp(-energy / (pass->boltzmann * pass->temp));
+    log_sum_add(pass->sum, -energy / (pass->boltzmann * pass->temp), 1,
+		energy, mag);
   }
-  return (0);
 }
  
+// Documentation in ising.h
 double p_partition(int positions, double coupling, double magnet, double temp,
-		   double boltzmann, int threads) {
-#ifdef _WIN32
-  HANDLE *thread = calloc(threads - 1, sizeof(HANDLE));
-  DWORD *ids = calloc(threads - 1, sizeof(DWORD));
-#else
-  pthread_t *thread = calloc(threads - 1, sizeof(pthread_t));
-  pthread_attr_t *attr = calloc(threads - 1, sizeof(pthread_attr_t));
-#endif
-  double *sum = calloc(threads, sizeof(double));
-  double out;
+		   double boltzmann, thread_pool_t *pool) {
+  return (exp(p_log_partition(positions, coupling, magnet, temp, boltzmann,
+			      pool)));
+}
+
+// Documentation in ising.h
+double p_log_partition(int positions, double coupling, double magnet,
+		       double temp, double boltzmann, thread_pool_t *pool) {
+  int threads = pool_threads(pool);
+  log_sum_t *sum = calloc(threads, sizeof(log_sum_t));
   pass_args_small_t *pass_args = calloc(threads, sizeof(pass_args_small_t));
-  void *rets;
+  double out = NAN;
+
+  if(sum != NULL && pass_args != NULL) {
+    for(int i = 0; i < threads; i++) {
+      pass_args[i].index = i;
+      pass_args[i].threads = threads;
+      pass_args[i].positions = positions;
+      pass_args[i].len = UINT64_C(1) << positions;
+      pass_args[i].coupling = coupling;
+      pass_args[i].magnet = magnet;
+      pass_args[i].boltzmann = boltzmann;
+      pass_args[i].temp = temp;
+      pass_args[i].sum = &sum[i];
+      log_sum_init(&sum[i]);
+    }
+    pool_run(pool, p_compute_partition, pass_args, sizeof(pass_args_small_t));
+    for(int i = 1; i < threads; i++) {
+      log_sum_merge(&sum[0], &sum[i]);
+    }
+    out = log_sum_log(&sum[0]);
+  }
+  free(pass_args);
+  free(sum);
+  return (out);
+}
+
+// Histogram a contiguous range of configurations.
+static void p_compute_dos(void *arg) {
+  pass_args_dos_t *pass = (pass_args_dos_t *) arg;
+  int pos = pass->positions;
+  uint64_t *counts = pass->counts;
+  walk_t walk;
+
+  // Split the loops so that each one knows which kind of walk it has.
+  if(pass->prefix == NULL) {
+    for(int more = walk_init(&walk, pos, NULL, pass->start, pass->end);
+	more; more = walk_next(&walk)) {
+      counts[DOS_INDEX(walk.eq, walk.up, pos)]++;
+    }
+    return;
+  }
+  // The low sites form an open chain, which is closed by the fixed sites.
+  for(int more = walk_init(&walk, pass->width, pass->prefix, pass->start,
+			   pass->end);
+      more; more = walk_next(&walk)) {
+    counts[DOS_INDEX(walk.eq, walk.up, pos)]++;
+  }
+}
+
+// Documentation in ising.h
+int p_dos(int positions, uint64_t *counts, thread_pool_t *pool) {
+  for(int j = 0; j < (positions + 1) * (positions + 1); j++) {
+    counts[j] = 0;
+  }
+  return (p_dos_range(positions, positions, NULL, 0,
+		      UINT64_C(1) << positions, counts, pool));
+}
+
+// Documentation in ising.h
+int p_dos_range(int positions, int width, const dos_prefix_t *prefix,
+		uint64_t start, uint64_t end, uint64_t *counts,
+		thread_pool_t *pool) {
+  int threads = pool_threads(pool);
+  size_t size = (size_t) (positions + 1) * (positions + 1);
+  uint64_t states = (end > start)? end - start: 0,
+    chunk = states / threads + 1;
+  // Each thread gets its own histogram so that there is no contention.
+  uint64_t *local = calloc(size * threads, sizeof(uint64_t));
+  pass_args_dos_t *pass_args = calloc(threads, sizeof(pass_args_dos_t));
+
+  if(local == NULL || pass_args == NULL) {
+    free(local);
+    free(pass_args);
+    return (-1);
+  }
+  for(int i = 0; i < threads; i++) {
+    pass_args[i].positions = positions;
+    pass_args[i].width = width;
+    pass_args[i].prefix = prefix;
+    pass_args[i].start = start + ((i * chunk > states)? states: i * chunk);
+    pass_args[i].end = start + (((i + 1) * chunk > states)? states:
+				(i + 1) * chunk);
+    pass_args[i].counts = local + (size_t) i * size;
+  }
+  pool_run(pool, p_compute_dos, pass_args, sizeof(pass_args_dos_t));
+
+  // Merge the histograms into the output.
+  for(size_t j = 0; j < size; j++) {
+    for(int i = 0; i < threads; i++) {
+      counts[j] += local[(size_t) i * size + j];
+    }
+  }
+  free(pass_args);
+  free(local);
+  return (0);
+}
+
+/*
+ * A node of the tree of prenecklaces from the recursive FKM algorithm. conf
+ * holds the first t - 1 sites, with site 1 as the highest bit, and p is the
+ * length of the longest Lyndon prefix. The necklaces below a node are
+ * independent of the rest of the tree, so the nodes at some depth are split
+ * between the threads.
+ */
+typedef struct {
+  uint64_t conf;
+  int t, p;
+} necklace_node_t;
+
+typedef struct {
+  int index, threads, positions, len;
+  const necklace_node_t *nodes;
+  uint64_t *counts;
+} pass_args_necklace_t;
+
+/*
+ * Count the necklaces below a node. A necklace of period p stands for p
+ * rotations. Its complement has the same coupling and the opposite
+ * magnetization, so only necklaces with at most half of their spins up are
+ * visited, and the rest are counted from their complements.
+ */
+static inline void necklace_leaf(int positions, uint64_t *counts,
+				 uint64_t conf, int p) {
+  int up = bitcount(conf), eq;
+  if(2 * up > positions || positions % p != 0) {
+    return;
+  }
+  eq = bitcount((((conf << (positions - 1)) | (conf >> 1)) ^ ~conf) &
+		MASK(positions));
+  counts[DOS_INDEX(eq, up, positions)] += p;
+  if(2 * up < positions) {
+    counts[DOS_INDEX(eq, positions - up, positions)] += p;
+  }
+}
+
+static void necklace_walk(int positions, uint64_t *counts, uint64_t conf,
+			  int t, int p) {
+  if(2 * bitcount(conf) > positions) {
+    return;
+  }
+  if(t > positions) {
+    necklace_leaf(positions, counts, conf, p);
+    return;
+  }
+  // The last site ends the necklace, so skip the call.
+  if(t == positions) {
+    if((conf >> (p - 1)) & 1) {
+      necklace_leaf(positions, counts, (conf << 1) | 1, p);
+    } else {
+      necklace_leaf(positions, counts, conf << 1, p);
+      necklace_leaf(positions, counts, (conf << 1) | 1, t);
+    }
+    return;
+  }
+  // Copy the site p back, or raise it to one and start a new Lyndon prefix.
+  if((conf >> (p - 1)) & 1) {
+    necklace_walk(positions, counts, (conf << 1) | 1, t + 1, p);
+  } else {
+    necklace_walk(positions, counts, conf << 1, t + 1, p);
+    necklace_walk(positions, counts, (conf << 1) | 1, t + 1, t);
+  }
+}
+
+// Collect the nodes of the prenecklace tree at a depth.
+static int necklace_nodes(int positions, int depth, uint64_t conf, int t,
+			  int p, necklace_node_t *nodes, int len) {
+  if(t > depth || t > positions) {
+    nodes[len].conf = conf;
+    nodes[len].t = t;
+    nodes[len].p = p;
+    return (len + 1);
+  }
+  if((conf >> (p - 1)) & 1) {
+    return (necklace_nodes(positions, depth, (conf << 1) | 1, t + 1, p, nodes,
+			   len));
+  }
+  len = necklace_nodes(positions, depth, conf << 1, t + 1, p, nodes, len);
+  return (necklace_nodes(positions, depth, (conf << 1) | 1, t + 1, t, nodes,
+			 len));
+}
+
+static void p_compute_necklace(void *arg) {
+  pass_args_necklace_t *pass = (pass_args_necklace_t *) arg;
+  for(int i = pass->index; i < pass->len; i += pass->threads) {
+    necklace_walk(pass->positions, pass->counts, pass->nodes[i].conf,
+		  pass->nodes[i].t, pass->nodes[i].p);
+  }
+}
+
+// Documentation in ising.h
+int p_dos_necklace(int positions, uint64_t *counts, thread_pool_t *pool) {
+  int threads = pool_threads(pool), depth = 1, len;
+  size_t size = (size_t) (positions + 1) * (positions + 1);
+  uint64_t *local;
+  necklace_node_t *nodes;
+  pass_args_necklace_t *pass_args;
 
-  // Set up and run the threads.
+  // Make a few nodes per thread, so the uneven subtrees balance out.
+  while(depth < positions && (1 << depth) < 8 * threads && depth < 16) {
+    depth++;
+  }
+  local = calloc(size * threads, sizeof(uint64_t));
+  nodes = calloc((size_t) 1 << depth, sizeof(necklace_node_t));
+  pass_args = calloc(threads, sizeof(pass_args_necklace_t));
+  if(local == NULL || nodes == NULL || pass_args == NULL) {
+    free(local);
+    free(nodes);
+    free(pass_args);
+    return (-1);
+  }
+  len = necklace_nodes(positions, depth, 0, 1, 1, nodes, 0);
   for(int i = 0; i < threads; i++) {
     pass_args[i].index = i;
     pass_args[i].threads = threads;
     pass_args[i].positions = positions;
-    pass_args[i].len = 1 << positions;
-    pass_args[i].coupling = coupling;
-    pass_args[i].magnet = magnet;
-    pass_args[i].boltzmann = boltzmann;
-    pass_args[i].temp = temp;
-    pass_args[i].sum = &sum[i];
-    if(i != threads - 1) {
-#ifdef _WIN32
-      thread[i] = CreateThread(NULL, 0, p_compute_partition, &(pass_args[i]), 0,
-			    &(ids[i]));
-#else
-      pthread_attr_init(&(attr[i]));
-      pthread_create(&(thread[i]), &(attr[i]), p_compute_partition, &(pass_args[i]));
-#endif
+    pass_args[i].len = len;
+    pass_args[i].nodes = nodes;
+    pass_args[i].counts = local + (size_t) i * size;
+  }
+  pool_run(pool, p_compute_necklace, pass_args, sizeof(pass_args_necklace_t));
+
+  for(size_t j = 0; j < size; j++) {
+    counts[j] = 0;
+    for(int i = 0; i < threads; i++) {
+      counts[j] += local[(size_t) i * size + j];
     }
   }
+  free(pass_args);
+  free(nodes);
+  free(local);
+  return (0);
+}
 
-  // Don't leave this thread all alone. It needs work too.
-  p_compute_partition(&(pass_args[threads - 1]));
+// Documentation in ising.h
+int dos_plots(const dos_level_t *levels, int len_levels, double coupling,
+	      double magnet, double boltzmann, double const *temps,
+	      int len_temps, double *out_ens, double *out_heat,
+	      double *out_magsus) {
+  for(int i = 0; i < len_temps; i++) {
+    double beta = 1 / (temps[i] * boltzmann);
+    log_sum_t acc;
+    log_sum_init(&acc);
+    for(int j = 0; j < len_levels; j++) {
+      double mag = levels[j].mag,
+	en = -coupling * levels[j].couple + magnet * mag;
+      log_sum_add(&acc, -en * beta, levels[j].count, en, mag);
+    }
+    out_ens[i] = log_sum_mean(&acc, 0);
+    out_heat[i] = log_sum_var(&acc, 0) / (temps[i] * temps[i] * boltzmann);
+    out_magsus[i] = log_sum_var(&acc, 1) / (temps[i] * boltzmann);
+  }
+  return (0);
+}
 
-#ifdef _WIN32
-  WaitForMultipleObjects(threads - 1, thread, TRUE, INFINITE);
-#else
-  for(int i = 0; i < threads - 1; i++) {
-    pthread_join(thread[i], &rets);
+// Documentation in ising.h
+double dos_log_partition(const dos_level_t *levels, int len_levels,
+			 double coupling, double magnet, double temp,
+			 double boltzmann) {
+  log_sum_t acc;
+  log_sum_init(&acc);
+  for(int j = 0; j < len_levels; j++) {
+    double en = -coupling * levels[j].couple + magnet * levels[j].mag;
+    log_sum_add(&acc, -en / (temp * boltzmann), levels[j].count, en, 0);
   }
-#endif
-    
-  // I hope there are no leaks.
-#ifdef _WIN32
-  free(thread);
-  free(pass_args);
-  free(ids);
-#else
-  free(pass_args);
-  free(thread);
-  free(attr);
-#endif
-  out = 0;
-  for(int i = 0; i < threads; i++) {
-    out += sum[i];
+  return (log_sum_log(&acc));
+}
+
+// The value of an observable for a level of the density of states.
+static inline double observe_level(const dos_level_t *level, int positions,
+				   observable_t observable, double energy) {
+  double mag = level->mag;
+  switch(observable) {
+  case OBS_ENERGY:
+    return (energy);
+  case OBS_MAGNET:
+    return (mag);
+  case OBS_ABS_MAGNET:
+    return (fabs(mag));
+  case OBS_MAGNET2:
+    return (mag * mag);
+  case OBS_MAGNET4:
+    return (mag * mag * mag * mag);
+  case OBS_CORRELATION:
+    return ((double) level->couple / positions);
+  case OBS_WALLS:
+    return ((positions - level->couple) / 2.0);
+  default:
+    return (NAN);
   }
-  free(sum);
+}
+
+// Documentation in ising.h
+int dos_observe(const dos_level_t *levels, int len_levels, int positions,
+		observable_t observable, double coupling, double magnet,
+		double temp, double boltzmann, double *out_mean,
+		double *out_var) {
+  log_sum_t acc;
+  if(observable < 0 || observable >= OBS_COUNT || positions <= 0) {
+    return (-1);
+  }
+  log_sum_init(&acc);
+  for(int j = 0; j < len_levels; j++) {
+    double en = -coupling * levels[j].couple + magnet * levels[j].mag;
+    log_sum_add(&acc, -en / (temp * boltzmann), levels[j].count,
+		observe_level(levels + j, positions, observable, en), 0);
+  }
+  *out_mean = log_sum_mean(&acc, 0);
+  *out_var = log_sum_var(&acc, 0);
+  return (0);
+}
+
+// Documentation in ising.h
+double dos_partition(const dos_level_t *levels, int len_levels,
+		     double coupling, double magnet, double temp,
+		     double boltzmann) {
+  return (exp(dos_log_partition(levels, len_levels, coupling, magnet, temp,
+				boltzmann)));
+}
+
+// Documentation in ising.h
+void graph_ham_masks(graph_ham_t *ham) {
+  for(int i = 0; i < ham->len; i++) {
+    ham->masks[i] = 0;
+    for(int j = 0; j < ham->len; j++) {
+      if(i != j && ham->couplings[(size_t) i * ham->len + j] != 0) {
+	ham->masks[i] |= UINT64_C(1) << j;
+      }
+    }
+  }
+}
+
+// Documentation in ising.h
+double graph_energy(const graph_ham_t *ham, uint64_t conf) {
+  double out = ham->offset;
 
+  for(int i = 0; i < ham->len; i++) {
+    const double *row = ham->couplings + (size_t) i * ham->len;
+    double local = 0;
+    for(uint64_t near = ham->masks[i]; near != 0; near &= near - 1) {
+      int j = lowbit(near);
+      local += row[j] * SPIN(conf, j);
+    }
+    out += SPIN(conf, i) * (ham->fields[i] + local / 2);
+  }
   return (out);
 }
 
+// Walk a contiguous range of configurations of a graph Hamiltonian.
+static void g_compute_vals(void *arg) {
+  pass_args_graph_t *pass = (pass_args_graph_t *) arg;
+  const graph_ham_t *ham = pass->ham;
+  int len = ham->len;
+  // With the top spin held down, each configuration stands for its flip too.
+  uint64_t total = UINT64_C(1) << (len - pass->flip),
+    chunk = total / pass->threads + 1, start = pass->index * chunk,
+    end = start + chunk;
+
+  if(end > total) {
+    end = total;
+  }
+  while(start < end) {
+    // Take the largest aligned block that fits, so a Gray code covers it.
+    int bits = highbit(end - start);
+    uint64_t conf = start, steps;
+    double en;
+    int up;
+    if(start != 0 && lowbit(start) < bits) {
+      bits = lowbit(start);
+    }
+    if(bits > GRAPH_BLOCK_BITS) {
+      bits = GRAPH_BLOCK_BITS;
+    }
+    steps = UINT64_C(1) << bits;
+    en = graph_energy(ham, conf);
+    up = bitcount(conf);
+    for(uint64_t step = 1;; step++) {
+      double mag = 2 * up - len, local;
+      const double *row;
+      int bit, spin;
+      if(pass->flip) {
+	for(int t = 0; t < pass->len; t++) {
+	  log_sum_add_flip(&(pass->sums[t]), -en * pass->beta[t], en, mag);
+	}
+      } else {
+	for(int t = 0; t < pass->len; t++) {
+	  log_sum_add(&(pass->sums[t]), -en * pass->beta[t], 1, en, mag);
+	}
+      }
+      if(step >= steps) {
+	break;
+      }
+      // Flip one spin, and update the energy from its neighbours.
+      bit = lowbit(step);
+      spin = SPIN(conf, bit);
+      row = ham->couplings + (size_t) bit * len;
+      local = ham->fields[bit];
+      for(uint64_t near = ham->masks[bit]; near != 0; near &= near - 1) {
+	int j = lowbit(near);
+	local += row[j] * SPIN(conf, j);
+      }
+      en -= 2 * spin * local;
+      up -= spin;
+      conf ^= UINT64_C(1) << bit;
+    }
+    start += steps;
+  }
+}
+
+// Documentation in ising.h
+int g_plots(const graph_ham_t *ham, double boltzmann, double const *temps,
+	    int len_temps, double *out_log_part, double *out_ens,
+	    double *out_heat, double *out_magsus, thread_pool_t *pool) {
+  int threads = pool_threads(pool), ret = -1;
+  pass_args_graph_t *pass_args = calloc(threads, sizeof(pass_args_graph_t));
+  log_sum_t *sums = calloc((size_t) threads * len_temps + 1, sizeof(log_sum_t));
+  double *beta = calloc(len_temps + 1, sizeof(double));
+  int flip = 1;
+
+  // Without fields, flipping every spin keeps the energy.
+  for(int i = 0; i < ham->len; i++) {
+    flip &= (ham->fields[i] == 0);
+  }
+  if(pass_args != NULL && sums != NULL && beta != NULL) {
+    for(int t = 0; t < len_temps; t++) {
+      beta[t] = 1 / (temps[t] * boltzmann);
+    }
+    for(int i = 0; i < threads * len_temps; i++) {
+      log_sum_init(&sums[i]);
+    }
+    for(int i = 0; i < threads; i++) {
+      pass_args[i].index = i;
+      pass_args[i].threads = threads;
+      pass_args[i].len = len_temps;
+      pass_args[i].flip = flip;
+      pass_args[i].ham = ham;
+      pass_args[i].beta = beta;
+      pass_args[i].sums = sums + (size_t) i * len_temps;
+    }
+    pool_run(pool, g_compute_vals, pass_args, sizeof(pass_args_graph_t));
+    for(int t = 0; t < len_temps; t++) {
+      log_sum_t *acc = &sums[t];
+      for(int i = 1; i < threads; i++) {
+	log_sum_merge(acc, &sums[(size_t) i * len_temps + t]);
+      }
+      if(out_log_part != NULL) {
+	out_log_part[t] = log_sum_log(acc);
+      }
+      if(out_ens != NULL) {
+	out_ens[t] = log_sum_mean(acc, 0);
+      }
+      if(out_heat != NULL) {
+	out_heat[t] = log_sum_var(acc, 0) / (temps[t] * temps[t] * boltzmann);
+      }
+      if(out_magsus != NULL) {
+	out_magsus[t] = log_sum_var(acc, 1) / (temps[t] * boltzmann);
+      }
+    }
+    ret = 0;
+  }
+  free(beta);
+  free(sums);
+  free(pass_args);
+  return (ret);
+}
+
 #ifndef NO_PYTHON
 
-double p_average(PyObject *func, int positions, double coupling, double magnet,
-		 double temp, double boltzmann) {
-  double num = 0, den = 0;
-  PyObject *exc, *obj;
-  PyErr_Clear();
-  for(int i = 0; i < 1 << positions; i++) {
+/*
+ * Calls an observable on each configuration, and adds the values to acc.
+ * Returns 0, or -1 with a Python exception set.
+ */
+static int p_observe_each(PyObject *func, int positions, double coupling,
+			  double magnet, double temp, double boltzmann,
+			  log_sum_t *acc) {
+  for(uint64_t i = 0; i < UINT64_C(1) << positions; i++) {
     double mag = MAGNETIZATION(i, positions);
     double energy = -coupling * P_SPINCOUPLE(i, positions) + magnet * mag;
-    double expo = exp(-energy / (temp * boltzmann));
-    obj = PyObject_CallFunction(func, "i", i);
+    double f;
+    PyObject *obj = PyObject_CallFunction(func, "K", (unsigned long long) i);
     if(obj == NULL) {
-      perror("Error when calling function!");
-      return (NAN);
+      return (-1);
     }
-    num += PyFloat_AsDouble(obj) * expo;
-    exc = PyErr_Occurred();
-    if(exc != NULL) {
-      perror("Error with creation of float!");
-      return (NAN);
+    f = PyFloat_AsDouble(obj);
+    Py_DECREF(obj);
+    if(f == -1.0 && PyErr_Occurred()) {
+      return (-1);
     }
-    den += expo;
+    log_sum_add(acc, -energy / (temp * boltzmann), 1, f, 0);
   }
-  return (num / den);
+  return (0);
 }
 
-double p_variance(PyObject *func, int positions, double coupling, double magnet,
-		  double temp, double boltzmann) {
-  double num1 = 0, num2 = 0, den = 0;
-  for(int i = 0; i < 1 << positions; i++) {
-    double mag = MAGNETIZATION(i, positions);
-    double energy = -coupling * P_SPINCOUPLE(i, positions) + magnet * mag;
-    double expo = exp(-energy / (temp * boltzmann));
-    double f = PyFloat_AsDouble(PyObject_CallFunction(func, "i", i));
+/*
+ * Reads the values an observable returned for a batch. They can be a buffer of
+ * doubles, such as a float64 array, or any sequence of floats.
+ */
+static int p_read_batch(PyObject *obj, double *vals, Py_ssize_t len) {
+  Py_buffer view;
+  PyObject *seq;
+
+  if(PyObject_CheckBuffer(obj) &&
+     PyObject_GetBuffer(obj, &view, PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) == 0) {
+    int ok = (view.ndim == 1 && view.itemsize == sizeof(double) &&
+	      view.shape[0] == len && view.format != NULL &&
+	      (view.format[0] == 'd' ||
+	       ((view.format[0] == '@' || view.format[0] == '=') &&
+		view.format[1] == 'd')));
+    if(ok) {
+      memcpy(vals, view.buf, len * sizeof(double));
+    }
+    PyBuffer_Release(&view);
+    if(ok) {
+      return (0);
+    }
+  }
+  PyErr_Clear();
+  seq = PySequence_Fast(obj, "A batched observable must return a sequence.");
+  if(seq == NULL) {
+    return (-1);
+  }
+  if(PySequence_Fast_GET_SIZE(seq) != len) {
+    Py_DECREF(seq);
+    PyErr_SetString(PyExc_ValueError,
+		    "A batched observable must return one value per "
+		    "configuration.");
+    return (-1);
+  }
+  for(Py_ssize_t k = 0; k < len; k++) {
+    vals[k] = PyFloat_AsDouble(PySequence_Fast_GET_ITEM(seq, k));
+    if(vals[k] == -1.0 && PyErr_Occurred()) {
+      Py_DECREF(seq);
+      return (-1);
+    }
+  }
+  Py_DECREF(seq);
+  return (0);
+}
 
-    num1 += f * expo;
-    num2 += f * f * expo;
-    den += expo;
+/*
+ * Calls an observable on batches of up to batch configurations, and adds the
+ * values to acc. The observable gets a memoryview of unsigned 64-bit
+ * configurations, which is reused after it returns.
+ * Returns 0, or -1 with a Python exception set.
+ */
+static int p_observe_batch(PyObject *func, int positions, double coupling,
+			   double magnet, double temp, double boltzmann,
+			   int batch, log_sum_t *acc) {
+  uint64_t total = UINT64_C(1) << positions;
+  PyObject *bytes, *raw, *view;
+  double *energies, *vals;
+  uint64_t *confs;
+  int ret = 0;
+
+  if((uint64_t) batch > total) {
+    batch = (int) total;
+  }
+  bytes = PyByteArray_FromStringAndSize(NULL, (Py_ssize_t) batch
+					* sizeof(uint64_t));
+  if(bytes == NULL) {
+    return (-1);
+  }
+  raw = PyMemoryView_FromObject(bytes);
+  view = (raw == NULL)? NULL: PyObject_CallMethod(raw, "cast", "s", "Q");
+  Py_XDECREF(raw);
+  energies = malloc(2 * batch * sizeof(double));
+  if(view == NULL || energies == NULL) {
+    Py_DECREF(bytes);
+    Py_XDECREF(view);
+    free(energies);
+    if(!PyErr_Occurred()) {
+      PyErr_NoMemory();
+    }
+    return (-1);
+  }
+  vals = energies + batch;
+  confs = (uint64_t *) PyByteArray_AS_STRING(bytes);
+
+  for(uint64_t start = 0; start < total && ret == 0; start += batch) {
+    Py_ssize_t len = (total - start < (uint64_t) batch)?
+      (Py_ssize_t) (total - start): batch;
+    PyObject *arg, *obj;
+    for(Py_ssize_t k = 0; k < len; k++) {
+      uint64_t i = start + k;
+      confs[k] = i;
+      energies[k] = -coupling * P_SPINCOUPLE(i, positions) +
+	magnet * MAGNETIZATION(i, positions);
+    }
+    arg = (len == batch)? (Py_INCREF(view), view):
+      PySequence_GetSlice(view, 0, len);
+    if(arg == NULL) {
+      ret = -1;
+      break;
+    }
+    obj = PyObject_CallFunctionObjArgs(func, arg, NULL);
+    Py_DECREF(arg);
+    if(obj == NULL) {
+      ret = -1;
+      break;
+    }
+    ret = p_read_batch(obj, vals, len);
+    Py_DECREF(obj);
+    for(Py_ssize_t k = 0; k < len && ret == 0; k++) {
+      log_sum_add(acc, -energies[k] / (temp * boltzmann), 1, vals[k], 0);
+    }
+  }
+  Py_DECREF(view);
+  Py_DECREF(bytes);
+  free(energies);
+  return (ret);
+}
+
+// Documentation in ising.h
+double p_average(PyObject *func, int positions, double coupling, double magnet,
+		 double temp, double boltzmann, int batch) {
+  log_sum_t acc;
+  int ret;
+  log_sum_init(&acc);
+  if(batch > 0) {
+    ret = p_observe_batch(func, positions, coupling, magnet, temp, boltzmann,
+			  batch, &acc);
+  } else {
+    ret = p_observe_each(func, positions, coupling, magnet, temp, boltzmann,
+			 &acc);
+  }
+  return ((ret == 0)? log_sum_mean(&acc, 0): NAN);
+}
+
+// Documentation in ising.h
+double p_variance(PyObject *func, int positions, double coupling, double magnet,
+		  double temp, double boltzmann, int batch) {
+  log_sum_t acc;
+  int ret;
+  log_sum_init(&acc);
+  if(batch > 0) {
+    ret = p_observe_batch(func, positions, coupling, magnet, temp, boltzmann,
+			  batch, &acc);
+  } else {
+    ret = p_observe_each(func, positions, coupling, magnet, temp, boltzmann,
+			 &acc);
   }
-  return (num2 / den - num1 * num1 / den / den);
+  return ((ret == 0)? log_sum_var(&acc, 0): NAN);
 }
 
 #endif
@@ -12,39 +12,243 @@
 #include <Python.h>
 #endif
 #include <stdint.h>
+#include <stddef.h>
 
+/*
+ * A pool of threads that persists between calls. Every parallel kernel takes
+ * one. A NULL pool runs everything on the calling thread.
+ */
+typedef struct thread_pool thread_pool_t;
+
+// The work for one thread. It gets its own element of the argument array.
+typedef void (*pool_func_t)(void *args);
+
+// Start a pool with the given number of threads, counting the calling thread.
+extern thread_pool_t *pool_create(int threads);
+
+// Stop the threads in a pool and free it.
+extern void pool_destroy(thread_pool_t *pool);
+
+// The number of threads in a pool, which is the number of tasks per job.
+extern int pool_threads(const thread_pool_t *pool);
+
+/*
+ * Run func on each of pool_threads(pool) elements of args, each size bytes
+ * long, and wait for all of them to finish. Only one job runs on a pool at a
+ * time.
+ */
+extern int pool_run(thread_pool_t *pool, pool_func_t func, void *args,
+		    size_t size);
+
+/*
+ * A Hamiltonian on a graph of len spins, where bit i of a configuration is
+ * spin i. The energy is half the sum of couplings[i * len + j] s_i s_j over
+ * every i and j, plus the sum of fields[i] s_i, plus offset. couplings is
+ * symmetric with a zero diagonal, and bit j of masks[i] is set when spins i and
+ * j are coupled, so only the neighbours of a spin are visited. Fill masks with
+ * graph_ham_masks.
+ */
 typedef struct {
-  double *taylor_matrix;
   int len;
+  uint64_t *masks;
+  double const *couplings, *fields;
+  double offset;
 } graph_ham_t;
 
+/*
+ * One level of the density of states of a periodic chain. couple is the sum of
+ * the nearest neighbor spin products, mag is the magnetization, and count is
+ * the number of configurations that share them.
+ */
+typedef struct {
+  int couple, mag;
+  double count;
+} dos_level_t;
+
+/*
+ * Index into the histogram filled by p_dos. eq is the number of equal nearest
+ * neighbor pairs and up is the number of up spins.
+ */
+#define DOS_INDEX(EQ, UP, L) ((EQ) * ((L) + 1) + (UP))
+
+/*
+ * The most positions that can be enumerated in full. Configurations are 64 bit
+ * integers, and longer chains have to be enumerated in chunks with p_dos_range.
+ */
+#define MAX_POSITIONS 63
+
+// The most positions of a chain that p_dos_range enumerates with a prefix.
+#define MAX_CHAIN (64 + MAX_POSITIONS)
+
+/*
+ * The high sites of a chain that are held fixed while p_dos_range enumerates
+ * the low width sites. eq is the number of equal neighbor pairs among the
+ * fixed sites, and up is the number of fixed up spins. first is the top bit of
+ * the chain, at bit length - 1, which wraps around to sit next to bit 0. last
+ * is the lowest fixed bit, at bit width, which sits next to bit width - 1.
+ * Both are 0 or 1.
+ */
+typedef struct {
+  int eq, up, first, last;
+} dos_prefix_t;
+
 /*
  * Compute values for energy, heat capacity, and magnetic susceptibility at
  * the given grid points and with the given coupling constants.
  */
 
-extern double energy(uint32_t spinconf, int positions, double coupling, double magnet);
+extern double energy(uint64_t spinconf, int positions, double coupling, double magnet);
 
-extern int magnet(uint32_t sp, int pos);
+extern int magnet(uint64_t sp, int pos);
+
+/*
+ * Find the energies or magnetizations of len periodic configurations at once,
+ * into out.
+ */
+extern void energy_batch(uint64_t const *confs, size_t len, int pos,
+			 double coupling, double magnet, double *out);
+
+extern void magnet_batch(uint64_t const *confs, size_t len, int pos,
+			 double *out);
 
 extern int p_plots(int positions, double coupling, double magnet,
 		      double boltzmann, double const *temps, int len_temps,
 			  double *out_ens, double *out_heat, double *mag_sus,
-			  int threads);
+			  thread_pool_t *pool);
+
+/*
+ * Like p_plots, but each thread takes blocks of block temperatures at a time.
+ * The energy and magnetization of each configuration are found once per block
+ * instead of once per temperature. A block of 0 is the same as p_plots.
+ * Returns -1 if memory could not be allocated, and 0 otherwise.
+ */
+extern int p_plots_block(int positions, double coupling, double magnet,
+			 double boltzmann, double const *temps, int len_temps,
+			 double *out_ens, double *out_heat, double *mag_sus,
+			 thread_pool_t *pool, int block);
 
 extern double p_partition(int positions, double coupling,
 				   double magnet, double temp,
-			  double boltzmann, int threads);
+			  double boltzmann, thread_pool_t *pool);
+
+/*
+ * Compute the natural log of the partition function. The sum is done in the
+ * log domain, so it stays finite when the partition function itself would not.
+ */
+extern double p_log_partition(int positions, double coupling, double magnet,
+			      double temp, double boltzmann,
+			      thread_pool_t *pool);
+
+/*
+ * Enumerate every configuration of a periodic chain once, and count how many
+ * share each spin coupling and magnetization. counts must hold
+ * (positions + 1)^2 entries, indexed by DOS_INDEX.
+ */
+extern int p_dos(int positions, uint64_t *counts, thread_pool_t *pool);
+
+/*
+ * Find the same density of states as p_dos from the binary necklaces, which
+ * are the configurations up to rotation, and only those with at most half of
+ * their spins up. This visits about 2^positions / (2 * positions) of them.
+ */
+extern int p_dos_necklace(int positions, uint64_t *counts,
+			  thread_pool_t *pool);
+
+/*
+ * Enumerate the configurations start <= i < end of the low width sites of a
+ * periodic chain and add them to counts, so that histograms of separate ranges
+ * can be summed. If prefix is NULL, then width must equal positions. Otherwise,
+ * the other positions - width sites are fixed as described by prefix.
+ */
+extern int p_dos_range(int positions, int width, const dos_prefix_t *prefix,
+		       uint64_t start, uint64_t end, uint64_t *counts,
+		       thread_pool_t *pool);
+
+/*
+ * Compute energies, heat capacities, and magnetic susceptibilities from a
+ * density of states. The cost only depends on the number of levels.
+ */
+extern int dos_plots(const dos_level_t *levels, int len_levels,
+		     double coupling, double magnet, double boltzmann,
+		     double const *temps, int len_temps, double *out_ens,
+		     double *out_heat, double *out_magsus);
+
+extern double dos_partition(const dos_level_t *levels, int len_levels,
+			    double coupling, double magnet, double temp,
+			    double boltzmann);
+
+extern double dos_log_partition(const dos_level_t *levels, int len_levels,
+				double coupling, double magnet, double temp,
+				double boltzmann);
+
+/*
+ * The observables that can be found from a density of states alone. The
+ * correlation is the average product of neighbouring spins, and the walls are
+ * the number of neighbouring pairs that differ.
+ */
+typedef enum {
+  OBS_ENERGY,
+  OBS_MAGNET,
+  OBS_ABS_MAGNET,
+  OBS_MAGNET2,
+  OBS_MAGNET4,
+  OBS_CORRELATION,
+  OBS_WALLS,
+  OBS_COUNT
+} observable_t;
+
+/*
+ * Compute the thermal average and variance of an observable from the density
+ * of states of a periodic chain with the given number of positions.
+ */
+extern int dos_observe(const dos_level_t *levels, int len_levels,
+		       int positions, observable_t observable,
+		       double coupling, double magnet, double temp,
+		       double boltzmann, double *out_mean, double *out_var);
+
+/*
+ * Set the neighbour masks of a graph Hamiltonian from its couplings.
+ */
+extern void graph_ham_masks(graph_ham_t *ham);
+
+// The energy of one configuration of a graph Hamiltonian.
+extern double graph_energy(const graph_ham_t *ham, uint64_t conf);
+
+/*
+ * Enumerate every configuration of a graph Hamiltonian once, walking blocks in
+ * Gray code order so each step updates the energy from the neighbours of one
+ * spin. The energy is found from scratch at the start of each block of at most
+ * 2^GRAPH_BLOCK_BITS configurations, so rounding does not build up. Threads
+ * take separate ranges of configurations, and find the sums at every
+ * temperature. Without fields, only the configurations with the top spin down
+ * are walked, and each one counts for its spin flip too. Any output may be
+ * NULL.
+ */
+#define GRAPH_BLOCK_BITS 20
+
+extern int g_plots(const graph_ham_t *ham, double boltzmann,
+		   double const *temps, int len_temps, double *out_log_part,
+		   double *out_ens, double *out_heat, double *out_magsus,
+		   thread_pool_t *pool);
 
 #ifndef NO_PYTHON
-extern double p_average(PyObject *func,
-			       int positions,
-			       double coupling, double magnet,
-			double temp, double boltzmann);
-
-extern double p_variance(PyObject *func,
-				int positions,
-				double coupling, double magnet,
-			 double temp, double boltzmann);
+/*
+ * Finds the thermal average of a Python observable over a periodic chain.
+ * If batch is positive, the observable is called on memoryviews of up to batch
+ * configurations, and returns a value for each. Otherwise, it is called on
+ * each configuration.
+ * Returns NaN with a Python exception set if the observable fails.
+ */
+extern double p_average(PyObject *func, int positions, double coupling,
+			double magnet, double temp, double boltzmann,
+			int batch);
+
+/*
+ * Finds the thermal variance of a Python observable over a periodic chain, as
+ * p_average does.
+ */
+extern double p_variance(PyObject *func, int positions, double coupling,
+			 double magnet, double temp, double boltzmann,
+			 int batch);
 #endif
 #endif
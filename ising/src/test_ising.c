@@ -15,7 +15,8 @@ int main(void) {
     temps[i] = 0.1 + 20 * i;
   }
   
-  int ret0 = p_plots(4, -2, 1.1, 1, temps, 10, ens, heat, mag, 4);
+  thread_pool_t *pool = pool_create(4);
+  int ret0 = p_plots(4, -2, 1.1, 1, temps, 10, ens, heat, mag, pool);
   free(ens);
   free(heat);
   free(mag);
@@ -42,7 +43,8 @@ int main(void) {
     }
   }
   printf(" ]\n");
-  double ret1 = p_partition(4, -2, 1.1, 298.15, 1, 4);
+  double ret1 = p_partition(4, -2, 1.1, 298.15, 1, pool);
+  pool_destroy(pool);
   printf("%f\n", ret1);
   fflush(stdout);
   return (ret0);
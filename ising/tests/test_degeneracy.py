@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+
+"""
+Test the exact degeneracy tables.
+"""
+
+import fractions
+import math
+import ising
+
+__J = -2
+__M = 1.1
+__K = 1
+
+
+def test_levels():
+    """
+Test the tables against the enumerated density of states.
+"""
+    for length in range(1, 13):
+        levels = ising.degeneracy.ring_levels(length)
+        assert sum(count for _, _, count in levels) == 2 ** length
+        assert sorted(levels) == sorted(ising.fastc.p_dos(length, 2))
+        for couple, mag, count in levels:
+            assert count == ising.degeneracy.ring_degeneracy(
+                length, (length - couple) // 2, mag
+            )
+    # Counts stay exact past the range of floats.
+    levels = ising.degeneracy.ring_levels(1200)
+    assert sum(count for _, _, count in levels) == 2 ** 1200
+
+
+def test_moments():
+    """
+Test the high precision and exact moments.
+"""
+    ham = ising.hamiltonian.PeriodicHamiltonian(__J, __M)
+    strat = ising.degeneracy.DegeneracyStrategy.getsingleton()
+    transfer = ising.thermo.TransferMatrixStrategy.getsingleton()
+    for length, temp in ((8, 2.0), (300, 0.5), (300, 10.0)):
+        exact = (
+            strat.log_partition(ham, length, temp, __K),
+            strat.energy(ham, length, temp, __K),
+            strat.heatcap(ham, length, temp, __K),
+            strat.magneticsus(ham, length, temp, __K),
+        )
+        other = (
+            transfer.log_partition(ham, length, temp, __K),
+            transfer.energy(ham, length, temp, __K),
+            transfer.heatcap(ham, length, temp, __K),
+            transfer.magneticsus(ham, length, temp, __K),
+        )
+        assert all(
+            abs(e - o) < 1e-8 * max(1, abs(o)) for e, o in zip(exact, other)
+        )
+        for name in ("average", "variance"):
+            for func in (
+                ising.thermo.magnetization,
+                ising.spins.SpinConfig.magnetization,
+            ):
+                got = getattr(strat, name)(func, ham, length, temp, __K)
+                expect = getattr(transfer, name)(func, ham, length, temp, __K)
+                assert abs(got - expect) < 1e-8 * max(1, abs(expect))
+    # Anything else is found in full.
+    full = ising.thermo.FullCalcStrategy.getsingleton()
+    assert strat.average(ising.thermo.correlation, ham, 8, 2.0, __K) == full.average(
+        ising.thermo.correlation, ham, 8, 2.0, __K
+    )
+
+    # The rational moments for a small ring by hand.
+    part, coup1, _, mag1, _ = ising.degeneracy.ring_exact_moments(
+        2, 2, fractions.Fraction(1, 3)
+    )
+    assert part == 4 * (9 + fractions.Fraction(1, 9)) + 2 * fractions.Fraction(1, 4)
+    assert coup1 == (
+        2 * 4 * (9 + fractions.Fraction(1, 9)) - 2 * 2 * fractions.Fraction(1, 4)
+    ) / part
+    assert mag1 == 2 * 4 * (fractions.Fraction(1, 9) - 9) / part
+    assert math.isclose(
+        ising.degeneracy.ring_moments(2, 1, 0, 1, 1)[0], math.log(4 * math.cosh(2))
+    )
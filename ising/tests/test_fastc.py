@@ -4,6 +4,7 @@
 Tests the C backend.
 """
 
+import math
 import time
 import random
 import pytest
@@ -48,3 +49,414 @@ Test the C backend.
     assert abs(avg1 - avg2) < 1e-4
     assert abs(var1 - var2) < 1e-4
     assert abs(time2 - time1) < abs(time4 - time3) / 2
+
+
+def test_dos():
+    """
+Test the density of states against the direct enumeration.
+"""
+    levels = ising.fastc.p_dos(__LENGTH, __THREADS)
+    assert sum(level[2] for level in levels) == 2 ** __LENGTH
+    temps = [0.5, 1.0, 5.0, 20.0]
+    dos_vals = ising.fastc.p_dos_plots(levels, __J, __M, temps, __K)
+    direct_vals = ising.fastc.p_plots(__LENGTH, __J, __M, temps, __K, __THREADS)
+    for dos, direct in zip(dos_vals, direct_vals):
+        assert all(abs(d - e) < 1e-8 for d, e in zip(dos, direct))
+    assert abs(
+        ising.fastc.p_dos_partition(levels, __J, __M, 2.0, __K)
+        - ising.fastc.p_partition(__LENGTH, __J, __M, 2.0, __K, __THREADS)
+    ) < 1e-6
+    # The same levels work with other constants.
+    assert all(
+        abs(d - e) < 1e-8
+        for d, e in zip(
+            ising.fastc.p_dos_plots(levels, 1.5, -0.3, temps, 2)[0],
+            ising.fastc.p_plots(__LENGTH, 1.5, -0.3, temps, 2, __THREADS)[0],
+        )
+    )
+
+
+def test_chunks():
+    """
+Test the chunked density of states against a direct count.
+"""
+
+    def direct(length, start, stop):
+        counts = {}
+        for spin in range(start, stop):
+            rot = ((spin << (length - 1)) | (spin >> 1)) & ((1 << length) - 1)
+            level = (
+                length - 2 * bin(rot ^ spin).count("1"),
+                2 * bin(spin).count("1") - length,
+            )
+            counts[level] = counts.get(level, 0) + 1
+        return sorted((couple, mag, count) for (couple, mag), count in counts.items())
+
+    assert sorted(ising.fastc.p_dos(__LENGTH, __THREADS)) == ising.fastcwrapper.merge_dos(
+        ising.fastcwrapper.dos_chunk(__LENGTH, 0, 100, __THREADS),
+        ising.fastcwrapper.dos_chunk(__LENGTH, 100, 2 ** __LENGTH, 1),
+    )
+    # Past 32 bits, and past 64 bits across the boundary of the fixed sites.
+    for length, start in ((32, 2 ** 31 - 500), (40, 12345), (100, 5 * 2 ** 63 - 500)):
+        assert ising.fastcwrapper.dos_chunk(
+            length, start, start + 1000, __THREADS
+        ) == direct(length, start, start + 1000)
+    spin = 2 ** 40 - 12345
+    assert ising.PeriodicHamiltonian(__J, __M).energy(
+        ising.spins.SpinInteger(spin, 40)
+    ) == ising.fastc.energy(spin, 40, __J, __M)
+    with pytest.raises(ValueError):
+        ising.fastc.p_dos(64, 1)
+
+
+def test_block():
+    """
+Test the temperature-blocked kernel against the plain one.
+"""
+    temps = [0.05 + 0.7 * i for i in range(11)]
+    plain = ising.fastc.p_plots(__LENGTH, __J, __M, temps, __K, __THREADS)
+    for block in (1, 4, 8, 16):
+        blocked = ising.fastc.p_plots(__LENGTH, __J, __M, temps, __K, __THREADS, block)
+        for vals1, vals2 in zip(plain, blocked):
+            assert all(abs(a - b) <= 1e-10 * max(1, abs(a)) for a, b in zip(vals1, vals2))
+    with pytest.raises(ValueError):
+        ising.fastc.p_plots(__LENGTH, __J, __M, temps, __K, __THREADS, -1)
+    # Buffers that can not be allocated raise MemoryError rather than crashing.
+    try:
+        blocked = ising.fastc.p_plots(6, __J, __M, temps[:2], __K, 1, 2 ** 31 - 1)
+    except MemoryError:
+        pass
+    else:
+        assert all(all(math.isfinite(val) for val in vals) for vals in blocked)
+
+
+def test_pool():
+    """
+Test that a thread pool gives the same results as a number of threads.
+"""
+    pool = ising.fastc.Pool(__THREADS)
+    assert pool.threads == __THREADS
+    temps = [0.5, 1.0, 5.0]
+    for _ in range(3):
+        assert ising.fastc.p_plots(
+            __LENGTH, __J, __M, temps, __K, pool
+        ) == ising.fastc.p_plots(__LENGTH, __J, __M, temps, __K, __THREADS)
+        assert ising.fastc.p_dos(__LENGTH, pool) == ising.fastc.p_dos(__LENGTH, 1)
+        assert abs(
+            ising.fastc.p_log_partition(__LENGTH, __J, __M, 2.0, __K, pool)
+            - ising.fastc.p_log_partition(__LENGTH, __J, __M, 2.0, __K, 1)
+        ) < 1e-10
+    pool.close()
+    assert pool.threads == 0
+    with pytest.raises(ValueError):
+        ising.fastc.p_dos(__LENGTH, pool)
+
+    # The strategies replace their pools when the threads change.
+    strat = ising.fastcwrapper.CPlotStrategy.getsingleton()
+    strat.setthreads(2)
+    assert strat.getpool().threads == 2
+    strat.setthreads(__THREADS)
+    assert strat.getpool().threads == __THREADS
+
+
+def test_nogil():
+    """
+Test that other threads keep running while the C code runs.
+"""
+    import threading
+
+    pool = ising.fastc.Pool(2)
+    results = []
+    worker = threading.Thread(
+        target=lambda: results.append(
+            ising.fastc.p_plots(20, __J, __M, [0.5 * i + 0.5 for i in range(16)], __K, pool)
+        )
+    )
+    start = time.perf_counter()
+    worker.start()
+    stamps = [time.perf_counter()]
+    while worker.is_alive():
+        time.sleep(0.001)
+        stamps.append(time.perf_counter())
+    duration = time.perf_counter() - start
+    worker.join()
+    assert len(results) == 1
+    # Holding the lock would stall this thread for the whole call.
+    assert max(b - a for a, b in zip(stamps, stamps[1:])) < max(duration / 2, 0.05)
+    with pytest.raises(RuntimeError):
+        holder = threading.Thread(
+            target=lambda: ising.fastc.p_plots(20, __J, __M, [1.0] * 16, __K, pool)
+        )
+        holder.start()
+        time.sleep(0.01)
+        try:
+            pool.close()
+        finally:
+            holder.join()
+    pool.close()
+
+
+def test_buffers():
+    """
+Test that the plotting functions read and write buffers of doubles.
+"""
+    import numpy as np
+
+    temps = [0.5, 1.0, 5.0, 20.0]
+    levels = ising.fastc.p_dos(__LENGTH, 1)
+    plain = ising.fastc.p_plots(__LENGTH, __J, __M, temps, __K, 1)
+    assert all(isinstance(vals, list) for vals in plain)
+    array = np.array(temps)
+
+    # Buffers in give buffers out.
+    for vals in (
+        ising.fastc.p_plots(__LENGTH, __J, __M, array, __K, 1),
+        ising.fastc.p_dos_plots(levels, __J, __M, array, __K),
+    ):
+        for vals1, vals2 in zip(plain, vals):
+            assert np.allclose(np.asarray(vals2), vals1)
+
+    # Results go into the given arrays.
+    out = tuple(np.zeros(len(temps)) for _ in range(3))
+    assert ising.fastc.p_plots(__LENGTH, __J, __M, array, __K, 1, out=out) == out
+    for vals1, vals2 in zip(plain, out):
+        assert np.allclose(vals2, vals1)
+    out = tuple(np.zeros(len(temps)) for _ in range(3))
+    ising.fastc.p_dos_plots(levels, __J, __M, temps, __K, out=out)
+    for vals1, vals2 in zip(plain, out):
+        assert np.allclose(vals2, vals1)
+
+    with pytest.raises(ValueError):
+        ising.fastc.p_plots(
+            __LENGTH, __J, __M, array, __K, 1, out=tuple(np.zeros(2) for _ in range(3))
+        )
+    # Other arrays are copied.
+    for vals1, vals2 in zip(
+        ising.fastc.p_plots(__LENGTH, __J, __M, temps[::2], __K, 1),
+        ising.fastc.p_plots(__LENGTH, __J, __M, array[::2], __K, 1),
+    ):
+        assert np.allclose(vals2, vals1)
+    ising.fastc.p_plots(__LENGTH, __J, __M, array.astype(np.float32), __K, 1)
+    with pytest.raises(TypeError):
+        ising.fastc.p_plots(
+            __LENGTH, __J, __M, array, __K, 1, out=tuple(np.zeros(4, np.float32) for _ in range(3))
+        )
+    with pytest.raises(TypeError):
+        ising.fastc.p_plots(__LENGTH, __J, __M, array, __K, 1, out=out[:2])
+
+
+def test_energy_batch():
+    """
+Test finding the energies and magnetizations of many configurations.
+"""
+    import numpy as np
+
+    confs = np.arange(2 ** __LENGTH, dtype=np.uint64)
+    energies = [ising.fastc.energy(int(c), __LENGTH, __J, __M) for c in confs]
+    mags = [ising.fastc.magnet(int(c), __LENGTH) for c in confs]
+    assert np.allclose(
+        np.asarray(ising.fastc.energy_batch(confs, __LENGTH, __J, __M)), energies
+    )
+    assert np.allclose(np.asarray(ising.fastc.magnet_batch(confs, __LENGTH)), mags)
+    # NumPy's default integers work too, and sequences give lists.
+    assert np.allclose(
+        np.asarray(ising.fastc.magnet_batch(confs.astype(np.int64), __LENGTH)), mags
+    )
+    assert ising.fastc.energy_batch(confs.tolist(), __LENGTH, __J, __M) == energies
+    out = np.zeros(len(confs))
+    assert ising.fastc.energy_batch(confs, __LENGTH, __J, __M, out=out) is out
+    assert np.allclose(out, energies)
+    with pytest.raises(TypeError):
+        ising.fastc.energy_batch(confs.astype(np.int32), __LENGTH, __J, __M)
+    with pytest.raises(ValueError):
+        ising.fastc.magnet_batch(confs, __LENGTH, out=np.zeros(3))
+
+
+def test_batched():
+    """
+Test that batched observables give the same averages as plain ones.
+"""
+    import numpy as np
+
+    ham = ising.PeriodicHamiltonian(__J, __M)
+    strat = ising.fastcwrapper.CThermoStrategy.getsingleton()
+    mag = ising.fastcwrapper.batched(lambda sp: sp.sum(axis=1), as_spins=True)
+    first = ising.fastcwrapper.batched(lambda confs, length: confs >> np.uint64(length - 1))
+    for func, plain in (
+        (mag, lambda sp: sp.magnetization()),
+        (first, lambda sp: (sp[0] + 1) // 2),
+    ):
+        for temp in (0.5, 3.0):
+            assert abs(
+                strat.average(func, ham, 12, temp, __K)
+                - strat.average(plain, ham, 12, temp, __K)
+            ) < 1e-10
+            assert abs(
+                strat.variance(func, ham, 12, temp, __K)
+                - strat.variance(plain, ham, 12, temp, __K)
+            ) < 1e-10
+        # Other strategies call it on one configuration at a time.
+        spin = ising.spins.SpinInteger(0b1011, 4)
+        assert func(spin) == plain(spin)
+    assert (
+        ising.fastcwrapper.spin_array([0b1011], 4) == [[1, -1, 1, 1]]
+    ).all()
+
+    # The batches cover every configuration, including a short last one.
+    seen = []
+    assert ising.fastc.p_average(
+        lambda confs: seen.extend(confs) or [1.0] * len(confs), 5, __J, __M, 1.0, __K, batch=7
+    ) == 1.0
+    assert sorted(seen) == list(range(32))
+    with pytest.raises(ValueError):
+        ising.fastc.p_average(lambda confs: [1.0], 5, __J, __M, 1.0, __K, batch=7)
+    with pytest.raises(ZeroDivisionError):
+        ising.fastc.p_variance(lambda confs: 1 / 0, 5, __J, __M, 1.0, __K, batch=7)
+    with pytest.raises(ZeroDivisionError):
+        ising.fastc.p_variance(lambda conf: 1 / 0, 5, __J, __M, 1.0, __K)
+
+
+def test_native():
+    """
+Test the observables found from the density of states against the full
+calculation.
+"""
+    ham = ising.PeriodicHamiltonian(__J, __M)
+    strat = ising.fastcwrapper.CThermoStrategy.getsingleton()
+    full = ising.thermo.FullCalcStrategy.getsingleton()
+    calls = []
+
+    def spy(spin):
+        calls.append(spin)
+        return spin.magnetization()
+
+    for func in list(ising.fastcwrapper.NATIVE_OBSERVABLES) + [ham.energy]:
+        for temp in (0.3, 2.0):
+            for method in ("average", "variance"):
+                native = getattr(strat, method)(func, ham, __LENGTH, temp, __K)
+                exact = getattr(full, method)(func, ham, __LENGTH, temp, __K)
+                assert abs(native - exact) <= 1e-9 * max(1, abs(exact))
+    assert abs(
+        strat.variance(spy, ham, __LENGTH, 2.0, __K)
+        - strat.variance(ising.thermo.magnetization, ham, __LENGTH, 2.0, __K)
+    ) < 1e-9
+    assert len(calls) == 2 ** __LENGTH
+
+    # The susceptibility goes through the magnetization.
+    thermo = ising.thermo.ThermoMethod.getsingleton()
+    thermo.setstrat(strat)
+    try:
+        native = thermo.magneticsus(ham, __LENGTH, temp=2.0, boltzmann=__K)
+    finally:
+        thermo.setstrat(full)
+    assert abs(native - full.magneticsus(ham, __LENGTH, 2.0, __K)) < 1e-9
+    with pytest.raises(ValueError):
+        ising.fastc.p_dos_observe(ising.fastc.p_dos(4, 1), 4, "spin", __J, __M, 1.0, __K)
+
+
+def test_ranges():
+    """
+Test that any range of configurations is enumerated exactly once.
+"""
+    random.seed(12)
+    for length in range(1, 10):
+        for _ in range(5):
+            start = random.randrange(2 ** length)
+            stop = random.randrange(start, 2 ** length + 1)
+            counts = {}
+            for conf in range(start, stop):
+                spin = ising.spins.SpinInteger(conf, length)
+                couple = sum(spin[i] * spin[i + 1] for i in range(length))
+                key = (couple, spin.magnetization())
+                counts[key] = counts.get(key, 0) + 1
+            levels = ising.fastc.p_dos_range(length, length, None, start, stop, 3)
+            assert {(c, m): n for c, m, n in levels if n} == counts
+    # Prefixes that do not fit the fixed sites would index past the counts.
+    for prefix in (
+        (500000, 3, 1, 0),
+        (-1, 0, 0, 0),
+        (6, 0, 0, 0),
+        (0, 7, 0, 0),
+        (0, -1, 0, 0),
+        (0, 0, 2, 0),
+        (0, 0, 0, -1),
+    ):
+        with pytest.raises(ValueError):
+            ising.fastc.p_dos_range(10, 4, prefix, 0, 16, 1)
+    with pytest.raises(ValueError):
+        ising.fastc.p_dos_range(200, 4, (0, 0, 0, 0), 0, 16, 1)
+    assert ising.fastc.p_dos_range(10, 4, (5, 6, 1, 1), 0, 16, 1)
+
+
+def test_symmetric():
+    """
+Test that enumerating up to rotations and spin flips gives the same results.
+"""
+    for length in range(1, 17):
+        assert ising.fastc.p_dos(length, 1) == ising.fastc.p_dos(
+            length, __THREADS, symmetric=True
+        )
+    ham = ising.PeriodicHamiltonian(__J, __M)
+    temps = [0.5, 1.0, 5.0]
+    plain = ising.fastc.p_plots(12, __J, __M, temps, __K, 1)
+    strat = ising.fastcwrapper.CPlotStrategy.getsingleton()
+    ising.fastcwrapper.DOSCache.getsingleton().clear()
+    strat.setsymmetry(True)
+    try:
+        assert strat.getsymmetry()
+        vals = strat.calc_plot_vals(ham, 12, temps, __K)
+    finally:
+        strat.setsymmetry(False)
+        ising.fastcwrapper.DOSCache.getsingleton().clear()
+    for vals1, vals2 in zip(plain, vals):
+        assert all(abs(a - b) <= 1e-12 * max(1, abs(a)) for a, b in zip(vals1, vals2))
+
+
+def test_graph():
+    """
+Test the enumeration of graph Hamiltonians against sums over every
+configuration.
+"""
+    random.seed(23)
+    nverts = 7
+    temps = [0.3, 1.0, 5.0]
+    couplings = [[0.0] * nverts for _ in range(nverts)]
+    for _ in range(12):
+        i, j = random.sample(range(nverts), 2)
+        couplings[i][j] = couplings[j][i] = random.gauss(0, 1)
+    flat = [coup for row in couplings for coup in row]
+    for fields in ([random.gauss(0, 1) for _ in range(nverts)], [0.0] * nverts):
+        states = []
+        for conf in range(2 ** nverts):
+            spin = [((conf >> i) & 1) * 2 - 1 for i in range(nverts)]
+            energy = 0.25 + sum(fields[i] * spin[i] for i in range(nverts))
+            energy += 0.5 * sum(
+                couplings[i][j] * spin[i] * spin[j]
+                for i in range(nverts)
+                for j in range(nverts)
+            )
+            states.append((energy, sum(spin)))
+        vals = ising.fastc.g_plots(flat, fields, 0.25, temps, __K, __THREADS)
+        for i, temp in enumerate(temps):
+            weights = [math.exp(-energy / (__K * temp)) for energy, _ in states]
+            part = sum(weights)
+
+            def mean(func):
+                return sum(w * func(*state) for w, state in zip(weights, states)) / part
+
+            ener = mean(lambda en, mag: en)
+            magn = mean(lambda en, mag: mag)
+            assert vals[0][i] == pytest.approx(math.log(part))
+            assert vals[1][i] == pytest.approx(ener)
+            assert vals[2][i] == pytest.approx(
+                mean(lambda en, mag: (en - ener) ** 2) / (__K * temp ** 2)
+            )
+            assert vals[3][i] == pytest.approx(
+                mean(lambda en, mag: (mag - magn) ** 2) / (__K * temp)
+            )
+    with pytest.raises(ValueError):
+        ising.fastc.g_plots([], [], 0, temps, __K, 1)
+    with pytest.raises(ValueError):
+        ising.fastc.g_plots([0.0] * 3, [0.0, 0.0], 0, temps, __K, 1)
+    with pytest.raises(TypeError):
+        ising.fastc.g_plots(flat, fields, 0, temps, __K, 1, out=(None,) * 3)
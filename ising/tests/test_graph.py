@@ -4,6 +4,8 @@
 Test graphs.
 """
 
+import random
+import numpy as np
 import pytest
 import ising
 
@@ -87,3 +89,233 @@ Test the graphs.
     assert konig.getneighbors(verts1[0]) is not None
     assert str(konig) is not None
     assert ising.graph.dijkstra(konig, verts1[1], verts1[3]) is not None
+
+
+def test_indices():
+    """
+Test that the indexed lookups match scans over every vertex and edge.
+"""
+    rand = random.Random(7)
+    verts = ising.graph.VertexFactory.getsingleton().makevertex_list(12)
+    graph = ising.graph.Graph([], [])
+    graph.addverts(verts[:10])
+    edges = [
+        ising.graph.EdgeFactory.getsingleton().makeedge(
+            rand.choice(verts[:10]),
+            rand.choice(verts[:10]),
+            rand.choice([1, 2, 3]),
+            directed=rand.random() < 0.5,
+        )
+        for _ in range(40)
+    ]
+    graph.addedges(edges[:30])
+    # Things appended straight to the lists are found too.
+    graph.getverts().append(verts[10])
+    graph.getedges().extend(edges[30:])
+
+    def check():
+        for vert in verts:
+            assert graph.getvert(vert.getindex()) is next(
+                (ver for ver in graph.getverts() if ver.getindex() == vert.getindex()),
+                None,
+            )
+            assert graph.hasvertex(vert) == (vert in graph.getverts())
+            assert graph.getneighbors(vert) == [
+                tuple(list(edg.traverse(vert)) + [isinstance(edg, ising.graph.UndirectedEdge)])
+                for edg in graph.getedges()
+                if edg.cantraverse(vert)
+            ]
+            for other in verts:
+                for query in [(vert, other), (vert, other, 2)]:
+                    expect = None
+                    for edg in graph.getedges():
+                        ends = [(edg.getstart(), edg.getend())]
+                        if isinstance(edg, ising.graph.UndirectedEdge):
+                            ends.append((edg.getend(), edg.getstart()))
+                        if (query[0], query[1]) in ends and (
+                            len(query) == 2 or edg.getlength() == query[2]
+                        ):
+                            expect = edg
+                            break
+                    assert graph.getedge(query) is expect
+        for edg in edges:
+            assert graph.getedge(edg.getindex()) is edg
+            assert graph.hasedge(edg)
+            assert graph.hasedge(edg.getindex())
+        assert not graph.hasedge(-1)
+
+    check()
+    # Changes in place are seen after touch.
+    edges[3].setstart(verts[11])
+    graph.touch()
+    check()
+
+
+def test_arraygraph():
+    """
+Test graphs held in arrays against graphs of vertex and edge objects.
+"""
+    nverts = 6
+    conns = [(0, 1, 2.0, False), (1, 2, 0.5, True), (2, 2, 1.5, False), (5, 0, -1.0, False)]
+    arrays = ising.graph.ArrayGraph(
+        nverts,
+        [conn[0] for conn in conns],
+        [conn[1] for conn in conns],
+        [conn[2] for conn in conns],
+        [conn[3] for conn in conns],
+    )
+    verts = ising.graph.VertexFactory.getsingleton().makevertex_list(
+        nverts, range(nverts)
+    )
+    objects = ising.graph.Graph(verts, [])
+    objects.addedges(
+        [
+            ising.graph.EdgeFactory.getsingleton().makeedge(
+                verts[conn[0]], verts[conn[1]], conn[2], directed=conn[3]
+            )
+            for conn in conns
+        ]
+    )
+
+    def summary(graph):
+        return [
+            [(nei[0].getdata(), nei[1], nei[2]) for nei in graph.getneighbors(vert)]
+            for vert in graph.getverts()
+        ]
+
+    assert summary(arrays) == summary(objects)
+    assert len(arrays.getverts()) == nverts and len(arrays.getedges()) == len(conns)
+    # The views act like vertices and edges.
+    vert = arrays.getverts()[2]
+    assert isinstance(vert, ising.graph.Vertex)
+    assert arrays.getvert(vert.getindex()) == vert
+    assert arrays.hasvertex(vert) and not objects.hasvertex(vert)
+    assert not arrays.hasvertex(verts[2])
+    edge = arrays.getedges()[0]
+    assert isinstance(edge, ising.graph.UndirectedEdge)
+    assert isinstance(arrays.getedges()[1], ising.graph.Edge)
+    assert not isinstance(arrays.getedges()[1], ising.graph.UndirectedEdge)
+    assert arrays.getedge(edge.getindex()) == edge
+    assert arrays.getedge((arrays.getverts()[1], arrays.getverts()[0])) == edge
+    assert arrays.getedge((arrays.getverts()[2], arrays.getverts()[1])) is None
+    assert arrays.getedge((arrays.getverts()[0], arrays.getverts()[1], 3)) is None
+    assert arrays.hasedge(edge) and arrays.hasedge(edge.getindex())
+    assert edge.getindex() != arrays.getedges()[1].getindex()
+    assert str(edge) is not None and str(arrays) is not None
+    assert edge.copy() == edge
+
+    # Hamiltonians built on either graph agree.
+    ham1 = ising.GraphHamiltonian(arrays, 0.3)
+    ham2 = ising.GraphHamiltonian(objects, 0.3)
+    for part1, part2 in zip(ham1.compile(nverts), ham2.compile(nverts)):
+        assert part1 == pytest.approx(part2)
+    version = arrays.getversion()
+    edge.setlength(4.0)
+    arrays.getedges()[3].setend(arrays.getverts()[4])
+    objects.getedges()[0].setlength(4.0)
+    objects.getedges()[3].setend(verts[4])
+    objects.touch()
+    assert arrays.getversion() != version
+    assert summary(arrays) == summary(objects)
+    for conf in range(2 ** nverts):
+        spin = ising.SpinInteger(conf, nverts)
+        assert ham1.energy(spin) == pytest.approx(ham2.energy(spin))
+
+    # Bulk additions get new indices.
+    first = arrays.addvertarray([10, 11])
+    arrays.addedgearray([first], [first + 1], 0.25)
+    assert arrays.getverts()[first].getdata() == 10
+    assert arrays.getverts()[-1].getindex() not in [v.getindex() for v in verts]
+    assert summary(arrays)[first] == [(11, 0.25, True)]
+    with pytest.raises(TypeError):
+        arrays.addedges(objects.getedges()[0])
+    with pytest.raises(IndexError):
+        arrays.addedgearray([0], [100])
+
+    # Two million bonds take tens of megabytes.
+    size = 1000
+    lattice = ising.graph.ArrayGraph(
+        size * size,
+        np.repeat(np.arange(size * size), 2),
+        np.stack(
+            [
+                np.arange(size * size) // size * size + (np.arange(size * size) + 1) % size,
+                (np.arange(size * size) + size) % (size * size),
+            ],
+            axis=1,
+        ).reshape(-1),
+        -1.0,
+    )
+    nbytes = sum(arr.nbytes for arr in lattice.getarrays())
+    assert len(lattice.getedges()) == 2 * size * size
+    assert nbytes < 50 * 2 ** 20
+    assert len(lattice.getneighbors(lattice.getverts()[0])) == 4
+
+
+def test_distances():
+    """
+Test the shortest paths against a brute force search.
+"""
+    rand = random.Random(7)
+    nverts = 12
+    conns = [
+        (rand.randrange(nverts), rand.randrange(nverts), rand.choice([1, 2, 3.5]))
+        for _ in range(20)
+    ] + [(11, 10, 1)]
+    directed = [rand.random() < 0.3 for _ in conns]
+    verts = ising.graph.VertexFactory.getsingleton().makevertex_list(
+        nverts, range(nverts)
+    )
+    objects = ising.graph.Graph(verts, [])
+    objects.addedges(
+        [
+            ising.graph.EdgeFactory.getsingleton().makeedge(
+                verts[conn[0]], verts[conn[1]], conn[2], directed=direct
+            )
+            for conn, direct in zip(conns, directed)
+        ]
+    )
+    arrays = ising.graph.ArrayGraph(
+        nverts,
+        [conn[0] for conn in conns],
+        [conn[1] for conn in conns],
+        [conn[2] for conn in conns],
+        directed,
+    )
+
+    # Bellman-Ford, for reference.
+    def relax(hops):
+        expect = np.full((nverts, nverts), np.inf)
+        np.fill_diagonal(expect, 0)
+        for _ in range(nverts):
+            for (start, end, length), direct in zip(conns, directed):
+                length = 1 if hops else length
+                expect[:, end] = np.minimum(expect[:, end], expect[:, start] + length)
+                if not direct:
+                    expect[:, start] = np.minimum(
+                        expect[:, start], expect[:, end] + length
+                    )
+        return expect
+
+    for hops in (False, True):
+        expect = relax(hops)
+        assert np.array_equal(ising.graph.all_distances(objects, hops), expect)
+        assert np.array_equal(ising.graph.all_distances(arrays, hops), expect)
+        assert np.array_equal(
+            ising.graph.distances(arrays, [arrays.getverts()[3], arrays.getverts()[5].getindex()], hops),
+            expect[[3, 5]],
+        )
+    expect = relax(False)
+    for start in range(nverts):
+        for end in range(nverts):
+            path = ising.graph.dijkstra(objects, verts[start], verts[end])
+            if np.isinf(expect[start, end]):
+                assert path is None
+                continue
+            assert sum(edge.getlength() for edge in path.getedges()) == expect[
+                start, end
+            ]
+            if start != end:
+                assert path.getverts()[0] == verts[end]
+    with pytest.raises(ValueError):
+        ising.graph.all_distances(ising.graph.ArrayGraph(2, [0], [1], -1))
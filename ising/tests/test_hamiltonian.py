@@ -4,6 +4,7 @@
 Test the Hamiltonians.
 """
 
+import numpy as np
 import pytest
 import ising
 
@@ -83,3 +84,256 @@ Test general graph Hamiltonians.
     ham.setmagnet(__MAGS)
     assert ham.energy(ising.SpinMatrix(__MATRIX)) == 4 * -__J + __M * 4
     assert ham.temperature(ising.SpinMatrix(__MATRIX), 1) == 4 * -__J + __M * 4
+
+
+def test_energy_batch():
+    """
+Test finding many energies at once.
+"""
+    length = 6
+    verts = [
+        ising.graph.VertexFactory.getsingleton().makevertex(i) for i in range(length)
+    ]
+    graph = ising.graph.Graph(verts, [])
+    graph.addedges(
+        [
+            ising.graph.EdgeFactory.getsingleton().makeedge(
+                graph.getvert(verts[edg[0]]),
+                graph.getvert(verts[edg[1]]),
+                edg[2],
+                directed=edg[3],
+            )
+            for edg in [(0, 1, __J, False), (1, 4, 0.3, True), (5, 5, 0.7, False)]
+        ]
+    )
+    confs = np.arange(2 ** length, dtype=np.uint64)
+    rows = ising.hamiltonian.spin_rows(confs, length)
+    assert rows.shape == (2 ** length, length)
+    # The base class calls energy on each configuration.
+    base = ising.NPHamiltonian(__J, __M)
+    base.energy_batch = lambda configs, length=None: ising.Hamiltonian.energy_batch(
+        base, configs, length
+    )
+    for ham in [
+        ising.PeriodicHamiltonian(__J, __M),
+        ising.NPHamiltonian(__J, __M),
+        ising.GraphHamiltonian(graph, __M),
+        ising.GraphHamiltonian(graph, [0.1 * i for i in range(length)]),
+        base,
+    ]:
+        expect = [ham.energy(ising.SpinInteger(int(c), length)) for c in confs]
+        assert ham.energy_batch(confs, length) == pytest.approx(expect)
+        assert ham.energy_batch(rows) == pytest.approx(expect)
+        assert ham.energy_batch(confs, length).dtype == np.float64
+        with pytest.raises(ValueError):
+            ham.energy_batch(confs)
+    with pytest.raises(Exception):
+        ising.GraphHamiltonian(graph, [1, 2]).energy_batch(confs, length)
+
+
+def test_delta_energy():
+    """
+Test the change in energy from flipping one spin.
+"""
+    length = 5
+    verts = [
+        ising.graph.VertexFactory.getsingleton().makevertex(i) for i in range(length)
+    ]
+    graph = ising.graph.Graph(verts, [])
+    graph.addedges(
+        [
+            ising.graph.EdgeFactory.getsingleton().makeedge(
+                graph.getvert(verts[edg[0]]),
+                graph.getvert(verts[edg[1]]),
+                edg[2],
+                directed=edg[3],
+            )
+            for edg in [
+                (0, 1, __J, False),
+                (1, 0, 0.4, True),
+                (1, 4, 0.3, True),
+                (3, 3, 0.7, False),
+            ]
+        ]
+    )
+    hams = [
+        (ising.PeriodicHamiltonian(__J, __M), [1, 2, 3, length]),
+        (ising.NPHamiltonian(__J, __M), [1, 2, length]),
+        (ising.GraphHamiltonian(graph, __M), [length]),
+        (ising.GraphHamiltonian(graph, __MAGS + [0.5]), [length]),
+    ]
+    for ham, lengths in hams:
+        for size in lengths:
+            for conf in range(2 ** size):
+                spin = ising.SpinInteger(conf, size)
+                for index in range(size):
+                    flipped = spin.copy()
+                    flipped.flipbit(index)
+                    diff = ham.energy(flipped) - ham.energy(spin)
+                    assert ham.delta_energy(spin, index) == pytest.approx(diff)
+                    assert ising.Hamiltonian.delta_energy(
+                        ham, spin, index
+                    ) == pytest.approx(diff)
+    # The couplings are found again when the graph or field changes.
+    ham = hams[2][0]
+    ham.setmagnet(0)
+    assert ham.getlocal(length)[1] == [0] * length
+    graph.addedges(
+        [
+            ising.graph.EdgeFactory.getsingleton().makeedge(
+                graph.getvert(verts[2]), graph.getvert(verts[3]), 1.5
+            )
+        ]
+    )
+    assert (3, -1.5) in ham.getlocal(length)[0][2]
+
+
+def test_compile():
+    """
+Test the sparse couplings of graph Hamiltonians.
+"""
+    length = 6
+    verts = [
+        ising.graph.VertexFactory.getsingleton().makevertex(i) for i in range(length)
+    ]
+    graph = ising.graph.Graph(verts, [])
+    conns = [(0, 1, __J, False), (1, 4, 0.3, True), (5, 5, 0.7, False), (2, 2, 0.2, True)]
+
+    def add(conn):
+        edge = ising.graph.EdgeFactory.getsingleton().makeedge(
+            graph.getvert(verts[conn[0]]),
+            graph.getvert(verts[conn[1]]),
+            conn[2],
+            directed=conn[3],
+        )
+        graph.addedges(edge)
+        return edge
+
+    edges = [add(conn) for conn in conns]
+
+    def brute(spin, mags):
+        # Undirected loops are counted once from each end, at half of their length.
+        energy = 0
+        for first, second, coup, directed in conns:
+            if not directed and first == second:
+                coup /= 2
+            energy -= coup * spin[first] * spin[second]
+        if hasattr(mags, "__iter__"):
+            return energy + sum(mags[i] * spin[i] for i in range(len(spin)))
+        return energy + mags * sum(spin)
+
+    ham = ising.GraphHamiltonian(graph, __M)
+    indptr, indices, coefs, fields, offset = ham.compile(length)
+    assert list(indptr) == [0, 1, 3, 3, 3, 4, 4]
+    assert offset == pytest.approx(-0.35 - 0.2)
+    assert list(fields) == [__M] * length
+    assert ham.compile(length)[1] is indices
+
+    def check():
+        confs = np.arange(2 ** length, dtype=np.uint64)
+        expect = [
+            brute(ising.SpinInteger(int(c), length), ham.getmagnet()) for c in confs
+        ]
+        assert [
+            ham.energy(ising.SpinInteger(int(c), length)) for c in confs
+        ] == pytest.approx(expect)
+        assert ham.energy(
+            ising.SpinMatrix(ising.SpinInteger(37, length))
+        ) == pytest.approx(expect[37])
+        assert ham.energy_batch(confs, length) == pytest.approx(expect)
+
+    check()
+    # Changes to the graph and the field are seen.
+    conns.append((3, 5, 1.25, False))
+    add(conns[-1])
+    check()
+    # Edits in place are seen without touching the graph.
+    conns[0] = (0, 1, 0.5, False)
+    edges[0].setlength(0.5)
+    check()
+    conns[1] = (1, 3, 0.3, True)
+    edges[1].setend(verts[3])
+    check()
+    conns[0] = (0, 2, 0.5, False)
+    verts[1].setdata(2)
+    verts[2].setdata(1)
+    conns[1] = (2, 3, 0.3, True)
+    check()
+    ham.setmagnet([0.1 * i for i in range(length)])
+    check()
+    ham.getmagnet()[2] = -0.4
+    ham.touch()
+    check()
+
+    # A ring of three spins.
+    ring = [
+        ising.graph.VertexFactory.getsingleton().makevertex(i) for i in range(3)
+    ]
+    ham = ising.GraphHamiltonian(
+        ising.graph.Graph(
+            ring,
+            [
+                ising.graph.EdgeFactory.getsingleton().makeedge(
+                    ring[i], ring[(i + 1) % 3], 1.0, directed=False
+                )
+                for i in range(3)
+            ],
+        ),
+        0,
+    )
+    assert ham.energy(ising.SpinInteger(7, 3)) == pytest.approx(-3.0)
+    ham.getconns().getedges()[0].setlength(5.0)
+    assert ham.energy(ising.SpinInteger(7, 3)) == pytest.approx(-7.0)
+    with pytest.raises(Exception):
+        ham.setmagnet([1, 2])
+        ham.compile(length)
+
+
+def test_native_graph():
+    """
+Test that the C strategies enumerate graph Hamiltonians like the full
+calculation.
+"""
+    rng = np.random.default_rng(23)
+    nverts = 9
+    hams = [
+        ising.lattice.square(3, 3, rng.normal(size=(2, 3, 3)), rng.normal(size=9)),
+        ising.lattice.triangular(3, 3, [__J, 0.5, 1.0]),
+    ]
+    temps = [0.3, 1.0, 5.0]
+    full = ising.thermo.FullCalcStrategy.getsingleton()
+    strat = ising.fastcwrapper.CThermoStrategy.getsingleton()
+    plots = ising.fastcwrapper.CPlotStrategy.getsingleton()
+    for ham in hams:
+        vals = plots.calc_plot_vals(ham, nverts, temps, 1)
+        for i, temp in enumerate(temps):
+            assert vals[0][i] == pytest.approx(full.energy(ham, nverts, temp, 1))
+            assert vals[1][i] == pytest.approx(full.heatcap(ham, nverts, temp, 1))
+            assert vals[2][i] == pytest.approx(full.magneticsus(ham, nverts, temp, 1))
+            assert strat.log_partition(ham, nverts, temp, 1) == pytest.approx(
+                full.log_partition(ham, nverts, temp, 1)
+            )
+            assert strat.partition(ham, nverts, temp, 1) == pytest.approx(
+                full.partition(ham, nverts, temp, 1)
+            )
+            for method in ("average", "variance"):
+                assert getattr(strat, method)(
+                    ham.energy, ham, nverts, temp, 1
+                ) == pytest.approx(getattr(full, method)(ham.energy, ham, nverts, temp, 1))
+
+    # Graphs over the limit are left to the fallbacks.
+    def refuse(*args):
+        raise AssertionError("The graph should not be enumerated in C.")
+
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(ising.fastcwrapper, "_GRAPH_WIDTH", nverts - 1)
+        patch.setattr(ising.fastcwrapper, "graph_plots", refuse)
+        ham = hams[0]
+        vals = plots.calc_plot_vals(ham, nverts, temps, 1)
+        assert vals[0][1] == pytest.approx(full.energy(ham, nverts, temps[1], 1))
+        assert strat.log_partition(ham, nverts, 1.0, 1) == pytest.approx(
+            full.log_partition(ham, nverts, 1.0, 1)
+        )
+        assert strat.average(ham.energy, ham, nverts, 1.0, 1) == pytest.approx(
+            full.energy(ham, nverts, 1.0, 1)
+        )
@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+
+"""
+Test the lattice builders.
+"""
+
+import numpy as np
+import pytest
+import ising
+
+__J = -1.3
+__M = 0.4
+
+
+def test_chain():
+    """
+Test chains against the one dimensional Hamiltonians.
+"""
+    for length in (1, 2, 3, 7):
+        for periodic, ref in (
+            (True, ising.hamiltonian.PeriodicHamiltonian(__J, __M)),
+            (False, ising.hamiltonian.NPHamiltonian(__J, __M)),
+        ):
+            ham = ising.lattice.chain(length, __J, __M, periodic)
+            for conf in range(2 ** length):
+                spin = ising.SpinInteger(conf, length)
+                assert ham.energy(spin) == pytest.approx(ref.energy(spin))
+
+
+def test_lattices():
+    """
+Test the numbers of neighbors and the energies of the two and three
+dimensional lattices.
+"""
+    for build, args, nsites, neighbors in (
+        (ising.lattice.square, (4, 5), 20, 4),
+        (ising.lattice.triangular, (4, 5), 20, 6),
+        (ising.lattice.honeycomb, (4, 5), 40, 3),
+        (ising.lattice.cubic, (3, 4, 5), 60, 6),
+    ):
+        indptr, _, coefs, fields, offset = build(*args, __J, __M, compiled=True)
+        assert len(indptr) == nsites + 1
+        assert np.all(np.diff(indptr) == neighbors)
+        assert coefs == pytest.approx(-__J)
+        assert fields == pytest.approx(__M)
+        assert offset == 0
+        # All up has every bond satisfied.
+        ham = build(*args, __J, __M)
+        spin = ising.SpinInteger(2 ** nsites - 1, nsites)
+        assert ham.energy(spin) == pytest.approx(
+            -__J * nsites * neighbors / 2 + __M * nsites
+        )
+
+    # Open boundaries drop the bonds that wrap around.
+    indptr = ising.lattice.square(3, 4, periodic=False, compiled=True)[0]
+    assert indptr[-1] == 2 * (2 * 4 + 3 * 3)
+    indptr = ising.lattice.square(3, 4, periodic=(True, False), compiled=True)[0]
+    assert indptr[-1] == 2 * (3 * 4 + 3 * 3)
+
+
+def test_couplings():
+    """
+Test couplings for each kind of bond and for each bond, and fields for each
+site.
+"""
+    rows, cols = 3, 4
+    rand = np.random.default_rng(5)
+    each = rand.normal(size=(2, rows, cols))
+    mags = rand.normal(size=rows * cols)
+    ham = ising.lattice.square(rows, cols, each, mags)
+    spin = ising.SpinInteger(int(rand.integers(2 ** (rows * cols))), rows * cols)
+    grid = np.array(list(spin)).reshape(rows, cols)
+    expect = -np.sum(each[0] * grid * np.roll(grid, -1, 1))
+    expect -= np.sum(each[1] * grid * np.roll(grid, -1, 0))
+    expect += np.dot(mags, grid.reshape(-1))
+    assert ham.energy(spin) == pytest.approx(expect)
+    ham = ising.lattice.square(rows, cols, [1.0, 2.0])
+    assert ham.energy(spin) == pytest.approx(
+        -np.sum(grid * np.roll(grid, -1, 1)) - 2 * np.sum(grid * np.roll(grid, -1, 0))
+    )
+    with pytest.raises(ValueError):
+        ising.lattice.square(rows, cols, [1.0, 2.0, 3.0])
+    with pytest.raises(ValueError):
+        ising.lattice.square(rows, cols, np.ones((2, cols, rows)))
+    with pytest.raises(ValueError):
+        ising.lattice.square(rows, cols, 1, [1.0, 2.0])
@@ -48,3 +48,17 @@ Test the Python backend.
             ising.__main__.main(pass_args=__ARGS + ["--backend", "python"], test=True),
         )
     )
+
+
+def test_transferback():
+    """
+Test the transfer matrix backend.
+"""
+    assert all(
+        map(
+            lambda x: x is not None,
+            ising.__main__.main(
+                pass_args=__ARGS + ["--backend", "transfer-matrix"], test=True
+            ),
+        )
+    )
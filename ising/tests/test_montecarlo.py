@@ -76,3 +76,94 @@ Tests the Metropolis sampling.
         and variance >= 0
         and (variance == 0 or math.log10(abs(variance)) < 12)
     )
+
+
+def test_metropolis_walk():
+    """
+Tests that the energies followed along the Markov chains stay right.
+"""
+    ham = ising.NPHamiltonian(__J, __M)
+    strat = ising.montecarlo.MetropolisStrategy.getsingleton()
+    strat.setpoints(5)
+    strat.setdepth(10)
+    temp = 3
+    for spin, weight in strat._walk(  # pylint: disable=protected-access
+        ham, 5, temp, __K
+    ):
+        assert weight == pytest.approx(math.exp(-ham.energy(spin) / (__K * temp)))
+
+
+def test_checkerboard():
+    """
+Tests the checkerboard sweeps against every state of a small lattice.
+"""
+    strat = ising.montecarlo.CheckerboardStrategy.getsingleton()
+    full = ising.numpycalc.NumpyFullCalcStrategy.getsingleton()
+    strat.setseed(3)
+    strat.setsweeps(20000)
+    strat.setburnin(200)
+    strat.setthinning(2)
+    assert strat.getsweeps() == 20000
+    assert strat.getburnin() == 200
+    assert strat.getthinning() == 2
+    with pytest.raises(ValueError):
+        strat.setthinning(0)
+    ham = ising.lattice.square(4, 4, (1.0, -0.5), 0.2)
+    temp = 3
+    ising.thermo.ThermoMethod.getsingleton().setstrat(strat)
+    for func, scale in (
+        (ham.energy, 1),
+        (ising.thermo.magnetization, 1),
+        (ising.thermo.abs_magnetization, 1),
+        (ising.thermo.magnetization2, 1),
+        (ising.thermo.correlation, 0.05),
+    ):
+        assert ising.thermo.ThermoMethod.getsingleton().average(
+            func, ham, 16, temp=temp, boltzmann=__K
+        ) == pytest.approx(full.average(func, ham, 16, temp, __K), rel=0.05, abs=scale)
+    for got, expect in zip(
+        strat.calc_plot_vals(ham, 16, [temp], __K),
+        full.calc_plot_vals(ham, 16, [temp], __K),
+    ):
+        assert got[0] == pytest.approx(expect[0], rel=0.1)
+    # Odd sides can not be colored, so they go to the Metropolis sampling.
+    assert strat._board(  # pylint: disable=protected-access
+        ising.lattice.square(3, 4), 12
+    ) is None
+    assert math.isfinite(strat.energy(ising.lattice.square(3, 2), 6, temp, __K))
+
+
+def test_checkerboard_measure():
+    """
+Tests the energies and magnetizations found from the checkerboard arrays.
+"""
+    strat = ising.montecarlo.CheckerboardStrategy.getsingleton()
+    strat.setseed(4)
+    strat.setsweeps(5)
+    strat.setburnin(0)
+    strat.setthinning(1)
+    for rows, cols in ((2, 2), (2, 6), (4, 4)):
+        ham = ising.lattice.square(rows, cols, (0.7, -1.2), 0.3)
+        board = strat._board(ham, rows * cols)  # pylint: disable=protected-access
+        start = strat._start(board)  # pylint: disable=protected-access
+        for state in strat._chain(  # pylint: disable=protected-access
+            board, 5, __K, start
+        ):
+            spin = strat._spin(state)  # pylint: disable=protected-access
+            energy, mag = strat._measure(  # pylint: disable=protected-access
+                board, state
+            )
+            assert energy == pytest.approx(ham.energy(spin))
+            assert mag == spin.magnetization()
+
+
+def test_montecarlo_long():
+    """
+Tests the naive Monte-Carlo on chains too long for 64 bit configurations.
+"""
+    ham = ising.PeriodicHamiltonian(__J, __M)
+    strat = ising.montecarlo.MonteCarloStrategy.getsingleton()
+    strat.setpoints(50)
+    energy = strat.average(ham.energy, ham, 100, __TEMP, __K)
+    assert math.isfinite(energy)
+    assert abs(energy) <= 100 * (abs(__J) + abs(__M))
@@ -0,0 +1,160 @@
+#!/usr/bin/python3
+
+"""
+Test the NumPy enumeration.
+"""
+
+import pytest
+import ising
+
+__LENGTH = 8
+__J = -2
+__M = 1.1
+__K = 1
+__TEMPS = [0.5, 3, 298.15]
+
+
+def __graph_hamiltonian(mags):
+    """
+Makes a ring with a loop, a directed edge, and a long range edge.
+"""
+    verts = [
+        ising.graph.VertexFactory.getsingleton().makevertex(i)
+        for i in range(__LENGTH)
+    ]
+    graph = ising.graph.Graph(verts, [])
+    conns = [(i, (i + 1) % __LENGTH, __J, False) for i in range(__LENGTH)]
+    conns += [(0, 0, 0.5, False), (1, 5, 0.7, True), (2, 6, -1.3, False)]
+    graph.addedges(
+        [
+            ising.graph.EdgeFactory.getsingleton().makeedge(
+                graph.getvert(verts[conn[0]]),
+                graph.getvert(verts[conn[1]]),
+                conn[2],
+                directed=conn[3],
+            )
+            for conn in conns
+        ]
+    )
+    return ising.hamiltonian.GraphHamiltonian(graph, mags)
+
+
+def test_numpycalc():
+    """
+Test the NumPy enumeration against the Python enumeration.
+"""
+    strat = ising.numpycalc.NumpyFullCalcStrategy.getsingleton()
+    full = ising.thermo.FullCalcStrategy.getsingleton()
+    hams = [
+        ising.hamiltonian.PeriodicHamiltonian(__J, __M),
+        ising.hamiltonian.NPHamiltonian(__J, __M),
+        __graph_hamiltonian(__M),
+        __graph_hamiltonian([0.1 * i - 0.3 for i in range(__LENGTH)]),
+    ]
+    funcs = [
+        ising.thermo.magnetization,
+        ising.thermo.abs_magnetization,
+        ising.thermo.magnetization4,
+        ising.thermo.correlation,
+        ising.thermo.domain_walls,
+        lambda spin: spin[0] * spin[3],
+    ]
+    # Use small chunks so that they get merged.
+    strat.setchunk(37)
+    assert strat.getchunk() == 37
+    try:
+        for ham in hams:
+            for temp in __TEMPS:
+                assert strat.log_partition(
+                    ham, __LENGTH, temp, __K
+                ) == pytest.approx(full.log_partition(ham, __LENGTH, temp, __K))
+                assert strat.energy(ham, __LENGTH, temp, __K) == pytest.approx(
+                    full.energy(ham, __LENGTH, temp, __K)
+                )
+                assert strat.heatcap(ham, __LENGTH, temp, __K) == pytest.approx(
+                    full.heatcap(ham, __LENGTH, temp, __K)
+                )
+                for func in funcs:
+                    assert strat.average(
+                        func, ham, __LENGTH, temp, __K
+                    ) == pytest.approx(full.average(func, ham, __LENGTH, temp, __K))
+                    assert strat.variance(
+                        func, ham, __LENGTH, temp, __K
+                    ) == pytest.approx(
+                        full.variance(func, ham, __LENGTH, temp, __K), abs=1e-9
+                    )
+            plots = strat.calc_plot_vals(ham, __LENGTH, __TEMPS, __K)
+            for i, temp in enumerate(__TEMPS):
+                assert plots[0][i] == pytest.approx(full.energy(ham, __LENGTH, temp, __K))
+                assert plots[1][i] == pytest.approx(
+                    full.heatcap(ham, __LENGTH, temp, __K)
+                )
+                assert plots[2][i] == pytest.approx(
+                    full.magneticsus(ham, __LENGTH, temp, __K)
+                )
+        with pytest.raises(ValueError):
+            strat.setchunk(0)
+    finally:
+        strat.setchunk(1 << 16)
+
+
+def test_tables(tmp_path, monkeypatch):
+    """
+Test the tables stored on disk.
+"""
+    strat = ising.numpycalc.NumpyFullCalcStrategy.getsingleton()
+    cache = ising.numpycalc.EnergyTableCache.getsingleton()
+    full = ising.thermo.FullCalcStrategy.getsingleton()
+    old_dir, old_budget = cache.getdir(), cache.getbudget()
+    cache.setdir(str(tmp_path))
+    strat.settables(True)
+    assert strat.gettables()
+    try:
+        hams = [
+            ising.hamiltonian.PeriodicHamiltonian(__J, __M),
+            ising.hamiltonian.NPHamiltonian(__J, __M),
+            __graph_hamiltonian([0.1 * i - 0.3 for i in range(__LENGTH)]),
+        ]
+        keys = {ising.numpycalc.fingerprint(ham) for ham in hams}
+        assert len(keys) == len(hams)
+        assert ising.numpycalc.fingerprint(
+            ising.hamiltonian.PeriodicHamiltonian(__J, __M)
+        ) == ising.numpycalc.fingerprint(hams[0])
+        for ham in hams:
+            energies, mags = cache.gettable(ham, __LENGTH)
+            for conf in (0, 5, 200, 255):
+                spin = ising.SpinInteger(conf, __LENGTH)
+                assert energies[conf] == pytest.approx(ham.energy(spin))
+                assert mags[conf] == spin.magnetization()
+            assert strat.heatcap(ham, __LENGTH, 3, __K) == pytest.approx(
+                full.heatcap(ham, __LENGTH, 3, __K)
+            )
+        assert len(list(tmp_path.glob("*.energy.npy"))) == 3
+        # Tables that are still mapped can not be removed on Windows.
+        del energies, mags
+        # Each table takes a little more than 9 bytes for each configuration.
+        cache.setbudget(2 * 9 * 2 ** __LENGTH + 1000)
+        assert len(list(tmp_path.glob("*.energy.npy"))) == 2
+        cache.setbudget(1000)
+        assert cache.gettable(hams[0], __LENGTH) is None
+        assert strat.energy(hams[0], __LENGTH, 3, __K) == pytest.approx(
+            full.energy(hams[0], __LENGTH, 3, __K)
+        )
+        cache.setbudget(old_budget)
+        cache.gettable(hams[0], __LENGTH)
+
+        # Tables that are in use are skipped.
+        def in_use(path):
+            raise PermissionError(path)
+
+        with monkeypatch.context() as patch:
+            patch.setattr(ising.numpycalc.os, "remove", in_use)
+            cache.clear()
+        assert len(list(tmp_path.glob("*.energy.npy"))) == 1
+        cache.clear()
+        assert not list(tmp_path.glob("*.npy"))
+        assert cache.gettable(ising.hamiltonian.Hamiltonian(), __LENGTH) is None
+    finally:
+        strat.settables(False)
+        cache.setdir(old_dir)
+        cache.setbudget(old_budget)
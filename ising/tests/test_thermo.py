@@ -85,3 +85,85 @@ Test energy, heat capacity, and magnetic susceptibility.
             cpl_m,
         )
     )
+
+
+def test_transfer():
+    """
+Test the transfer matrix against the full calculation.
+"""
+    method = ising.thermo.ThermoMethod.getsingleton()
+    transfer = ising.thermo.TransferMatrixStrategy.getsingleton()
+    full = ising.thermo.FullCalcStrategy.getsingleton()
+    temps = [0.5, 2.0, 10.0]
+    for ham in (
+        ising.hamiltonian.PeriodicHamiltonian(__J, __M),
+        ising.hamiltonian.NPHamiltonian(__J, __M),
+        ising.hamiltonian.PeriodicHamiltonian(-__J, 0),
+    ):
+        for temp in temps:
+            vals = []
+            for strat in (transfer, full):
+                method.setstrat(strat)
+                vals.append(
+                    (
+                        math.log(method.partition(ham, 8, temp, __K)),
+                        method.energy(ham, 8, temp, __K),
+                        method.heatcap(ham, 8, temp, __K),
+                        method.magneticsus(ham, 8, temp, __K),
+                    )
+                )
+            assert all(
+                abs(t - f) < 1e-8 * max(1, abs(f)) for t, f in zip(vals[0], vals[1])
+            )
+            for func in (
+                ising.thermo.magnetization,
+                ising.spins.SpinConfig.magnetization,
+                ising.thermo.correlation,
+            ):
+                for name in ("average", "variance"):
+                    got = getattr(transfer, name)(func, ham, 8, temp, __K)
+                    expect = getattr(full, name)(func, ham, 8, temp, __K)
+                    assert abs(got - expect) < 1e-8 * max(1, abs(expect))
+
+    # Long chains approach the thermodynamic limit, E / N = -J tanh(J / kT).
+    ham = ising.hamiltonian.PeriodicHamiltonian(-__J, 0)
+    ens, heats, mags = transfer.calc_plot_vals(ham, 10 ** 6, temps, __K)
+    for temp, energy in zip(temps, ens):
+        assert abs(energy / 10 ** 6 + -__J * math.tanh(-__J / temp)) < 1e-8
+    assert all(math.isfinite(x) for x in heats + mags)
+    assert math.isfinite(transfer.log_partition(ham, 10 ** 6, 0.01, __K))
+
+
+def test_lowtemp():
+    """
+Test that the exact calculations stay finite at low temperatures.
+"""
+    ham = ising.hamiltonian.PeriodicHamiltonian(-1, 0.5)
+    full = ising.thermo.FullCalcStrategy.getsingleton()
+    for temp in (0.01, 0.1):
+        exact = ising.degeneracy.ring_moments(8, -1, 0.5, temp, 1)
+        cvals = ising.fastc.p_plots(8, -1, 0.5, [temp], 1, 2)
+        assert math.isclose(full.log_partition(ham, 8, temp, 1), exact[0])
+        assert math.isclose(ising.fastc.p_log_partition(8, -1, 0.5, temp, 1, 2), exact[0])
+        assert math.isclose(full.energy(ham, 8, temp, 1), exact[1])
+        assert math.isclose(cvals[0][0], exact[1])
+        assert math.isclose(full.variance(ham.energy, ham, 8, temp, 1), exact[2])
+        assert math.isclose(cvals[1][0] * temp ** 2, exact[2], rel_tol=1e-6)
+
+
+def test_chunks(monkeypatch):
+    """
+Test that the full calculation gives the same values in small chunks.
+"""
+    ham = ising.hamiltonian.PeriodicHamiltonian(-1, 0.5)
+    full = ising.thermo.FullCalcStrategy.getsingleton()
+    for temp in (0.05, 2.0):
+        exact = ising.degeneracy.ring_moments(10, -1, 0.5, temp, 1)
+        monkeypatch.setattr(ising.thermo, "_CHUNK", 48)
+        assert math.isclose(full.log_partition(ham, 10, temp, 1), exact[0])
+        assert math.isclose(full.energy(ham, 10, temp, 1), exact[1])
+        assert math.isclose(full.variance(ham.energy, ham, 10, temp, 1), exact[2])
+        assert math.isclose(
+            full.average(ising.thermo.magnetization, ham, 10, temp, 1), exact[3]
+        )
+        monkeypatch.undo()
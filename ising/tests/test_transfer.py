@@ -0,0 +1,107 @@
+#!/usr/bin/python3
+
+"""
+Test the transfer matrix between the rows of square lattices.
+"""
+
+import pytest
+import ising
+
+__TEMPS = [0.8, 2.3, 5.0]
+
+
+def values(strat, ham, length, temp):
+    """
+Finds the values to compare between strategies.
+"""
+    return [
+        strat.log_partition(ham, length, temp, 1),
+        strat.energy(ham, length, temp, 1),
+        strat.heatcap(ham, length, temp, 1),
+        strat.magneticsus(ham, length, temp, 1),
+        strat.average(ising.thermo.magnetization, ham, length, temp, 1),
+    ]
+
+
+def test_dense():
+    """
+Test the full transfer matrix against every state.
+"""
+    full = ising.numpycalc.NumpyFullCalcStrategy.getsingleton()
+    strip = ising.transfer.StripTransferStrategy()
+    for rows, cols, coupling, magnet in (
+        (1, 1, 1.0, 0.5),
+        (1, 4, 1.0, 0.1),
+        (4, 1, 1.0, -0.2),
+        (2, 2, 1.0, 0.1),
+        (3, 4, 1.0, 0.0),
+        (4, 3, (1.0, 0.5), 0.3),
+        (2, 5, (0.7, -0.4), -0.2),
+        (3, 3, (-1.0, 1.0), 0.4),
+    ):
+        ham = ising.lattice.square(rows, cols, coupling, magnet)
+        length = rows * cols
+        for temp in __TEMPS:
+            assert values(strip, ham, length, temp) == pytest.approx(
+                values(full, ham, length, temp), rel=1e-8, abs=1e-8
+            )
+    ham = ising.lattice.square(3, 4, 1.0, 0.2)
+    assert strip.partition(ham, 12, 2.0, 1) == pytest.approx(
+        full.partition(ham, 12, 2.0, 1)
+    )
+    temps = [1.5, 2.5]
+    for got, expect in zip(
+        strip.calc_plot_vals(ham, 12, temps, 1), full.calc_plot_vals(ham, 12, temps, 1)
+    ):
+        assert list(got) == pytest.approx(list(expect))
+    with pytest.raises(NotImplementedError):
+        strip.average(ising.thermo.correlation, ham, 12, 2.0, 1)
+
+
+def test_lanczos():
+    """
+Test the Lanczos iteration against the full transfer matrix.
+"""
+    strip = ising.transfer.StripTransferStrategy()
+    full = ising.numpycalc.NumpyFullCalcStrategy.getsingleton()
+    strip.setdense(1)
+    strip.seteigenvalues(16)
+    # Every eigenvalue of a narrow strip is found.
+    ham = ising.lattice.square(4, 4, 1.0, 0.2)
+    for temp in __TEMPS:
+        assert values(strip, ham, 16, temp) == pytest.approx(
+            values(full, ham, 16, temp), rel=1e-6, abs=1e-6
+        )
+    # A long strip only needs the leading ones.
+    strip.seteigenvalues(8)
+    dense = ising.transfer.StripTransferStrategy()
+    ham = ising.lattice.square(64, 6, 1.0, 0.05)
+    for temp in __TEMPS:
+        assert values(strip, ham, 384, temp) == pytest.approx(
+            values(dense, ham, 384, temp), rel=1e-5
+        )
+    with pytest.raises(ValueError):
+        strip.seteigenvalues(0)
+
+
+def test_fallback():
+    """
+Test that lattices the strips do not describe are found in full.
+"""
+    strip = ising.transfer.StripTransferStrategy()
+    full = ising.FullCalcStrategy.getsingleton()
+    for ham in (
+        ising.lattice.square(2, 3, periodic=(True, False)),
+        ising.lattice.triangular(2, 3),
+        ising.lattice.square(2, 3, magnet=[0, 0, 0, 0, 0, 1.0]),
+        ising.hamiltonian.PeriodicHamiltonian(1.0, 0.2),
+    ):
+        assert strip.energy(ham, 6, 2.0, 1) == pytest.approx(
+            full.energy(ham, 6, 2.0, 1)
+        )
+    ham = ising.lattice.square(2, 3)
+    ham.getconns().addedgearray([0], [5], 1.0)
+    assert not ham.isintact()
+    assert strip.heatcap(ham, 6, 2.0, 1) == pytest.approx(
+        full.heatcap(ham, 6, 2.0, 1)
+    )
@@ -17,6 +17,54 @@ except ImportError:
 import os
 import math
 import concurrent.futures
+import numpy as np
+
+# The most configurations FullCalcStrategy holds the energies of at once.
+_CHUNK = 1 << 16
+
+
+def magnetization(spin: spins.SpinConfig):
+    """
+Finds the spin excess of a spin configuration.
+"""
+    return spin.magnetization()
+
+
+def abs_magnetization(spin: spins.SpinConfig):
+    """
+Finds the absolute value of the spin excess.
+"""
+    return abs(spin.magnetization())
+
+
+def magnetization2(spin: spins.SpinConfig):
+    """
+Finds the square of the spin excess.
+"""
+    return spin.magnetization() ** 2
+
+
+def magnetization4(spin: spins.SpinConfig):
+    """
+Finds the fourth power of the spin excess.
+"""
+    return spin.magnetization() ** 4
+
+
+def correlation(spin: spins.SpinConfig):
+    """
+Finds the average product of neighbouring spins around a ring.
+"""
+    return sum(spin[i] * spin[(i + 1) % len(spin)] for i in range(len(spin))) / len(
+        spin
+    )
+
+
+def domain_walls(spin: spins.SpinConfig):
+    """
+Counts the neighbouring pairs of spins around a ring that point different ways.
+"""
+    return sum(spin[i] != spin[(i + 1) % len(spin)] for i in range(len(spin)))
 
 
 class ThermoStrategy(despats.singleton.Singleton):
@@ -36,6 +84,18 @@ Calculates the partition function.
 """
         raise NotImplementedError
 
+    def log_partition(
+        self,
+        hamilt: hamiltonian.Hamiltonian,
+        length: int,
+        temp: float,
+        boltzmann: float,
+    ):
+        """
+Calculates the natural log of the partition function.
+"""
+        return math.log(self.partition(hamilt, length, temp, boltzmann))
+
     def average(
         self,
         func,
@@ -66,6 +126,46 @@ Calculates the variance of a function weighted with the Boltzmann distribution.
 """
         raise NotImplementedError
 
+    def energy(
+        self,
+        hamilt: hamiltonian.Hamiltonian,
+        length: int,
+        temp: float,
+        boltzmann: float,
+    ):
+        """
+Calculates the average energy.
+"""
+        return self.average(hamilt.energy, hamilt, length, temp, boltzmann)
+
+    def heatcap(
+        self,
+        hamilt: hamiltonian.Hamiltonian,
+        length: int,
+        temp: float,
+        boltzmann: float,
+    ):
+        """
+Calculates the heat capacity.
+"""
+        return self.variance(hamilt.energy, hamilt, length, temp, boltzmann) / (
+            boltzmann * temp ** 2
+        )
+
+    def magneticsus(
+        self,
+        hamilt: hamiltonian.Hamiltonian,
+        length: int,
+        temp: float,
+        boltzmann: float,
+    ):
+        """
+Calculates the magnetic susceptibility.
+"""
+        return self.variance(magnetization, hamilt, length, temp, boltzmann) / (
+            boltzmann * temp
+        )
+
 
 class ThermoMethod(despats.singleton.Singleton):
     """
@@ -99,6 +199,18 @@ Calculates the partition function.
 """
         return self.__strat.partition(hamilt, length, temp, boltzmann)
 
+    def log_partition(
+        self,
+        hamilt: hamiltonian.Hamiltonian,
+        length: int,
+        temp=298.15,
+        boltzmann=constants.BOLTZMANN_K,
+    ):
+        """
+Calculates the natural log of the partition function.
+"""
+        return self.__strat.log_partition(hamilt, length, temp, boltzmann)
+
     def average(
         self,
         func,
@@ -143,7 +255,7 @@ Calculates the variance.
         """
 Calculates the average energy.
 """
-        return self.__strat.average(hamilt.energy, hamilt, length, temp, boltzmann)
+        return self.__strat.energy(hamilt, length, temp, boltzmann)
 
     def heatcap(
         self,
@@ -155,9 +267,7 @@ Calculates the average energy.
         """
 Calculates the heat capacity.
 """
-        return self.__strat.variance(hamilt.energy, hamilt, length, temp, boltzmann) / (
-            boltzmann * temp ** 2
-        )
+        return self.__strat.heatcap(hamilt, length, temp, boltzmann)
 
     def magneticsus(
         self,
@@ -169,9 +279,7 @@ Calculates the heat capacity.
         """
 Calculates the magnetic susceptibility.
 """
-        return self.__strat.variance(
-            lambda sc: sc.magnetization(), hamilt, length, temp, boltzmann
-        ) / (boltzmann * temp)
+        return self.__strat.magneticsus(hamilt, length, temp, boltzmann)
 
 
 class PlotValsStrategy(
@@ -321,8 +429,65 @@ temperatures.
 
 class FullCalcStrategy(ThermoStrategy):
     """
-Calculates values using every configuration in python.
+Calculates values using every configuration in python. The configurations are
+taken a chunk at a time, and the Boltzmann weights of each chunk are shifted by
+its lowest energy, so only one chunk is held at once and nothing overflows at
+low temperatures.
+"""
+
+    @staticmethod
+    def _chunks(hamilt, length, temp, boltzmann):
+        """
+Yields the first configuration of each chunk of at most _CHUNK configurations,
+the Boltzmann weights of the chunk divided by that of its lowest energy, and the
+log of that weight.
+"""
+        total = 2 ** length
+        for start in range(0, total, _CHUNK):
+            expos = -hamilt.energy_batch(
+                np.arange(start, min(start + _CHUNK, total), dtype=np.uint64),
+                length,
+            ) / (boltzmann * temp)
+            shift = float(expos.max())
+            yield start, np.exp(expos - shift), shift
+
+    @staticmethod
+    def _spins(start, count, length):
+        """
+Yields count configurations in turn, starting from start.
+"""
+        return (
+            spins.SpinInteger(sp, length) for sp in range(start, start + count)
+        )
+
+    @staticmethod
+    def _merge(logs):
+        """
+Finds the weight of each chunk as a fraction of the whole from the logs of their
+partition functions, and the log of the whole.
 """
+        logs = np.asarray(logs)
+        top = logs.max()
+        fracs = np.exp(logs - top)
+        total = math.fsum(fracs)
+        return fracs / total, float(top) + math.log(total)
+
+    def log_partition(
+        self,
+        hamilt: hamiltonian.Hamiltonian,
+        length: int,
+        temp: float,
+        boltzmann: float,
+    ):
+        """
+Returns the natural log of the partition function.
+"""
+        return self._merge(
+            [
+                shift + math.log(math.fsum(weights))
+                for _, weights, shift in self._chunks(hamilt, length, temp, boltzmann)
+            ]
+        )[1]
 
     def partition(
         self,
@@ -335,10 +500,7 @@ Calculates values using every configuration in python.
 Returns the value of the partition function for a Hamiltonian at a given
 temperature and a boltzmann constant with given units.
 """
-        return sum(
-            math.exp(-hamilt.energy(spins.SpinInteger(sp, length)) / (boltzmann * temp))
-            for sp in range(2 ** length)
-        )
+        return math.exp(self.log_partition(hamilt, length, temp, boltzmann))
 
     def average(
         self,
@@ -353,14 +515,22 @@ temperature and a boltzmann constant with given units.
         """
 Find the value of an intrinsic property normalized by the partition function.
 """
-
-        return sum(
-            func(spins.SpinInteger(sp, length), *args, *kwargs)
-            * math.exp(
-                -hamilt.energy(spins.SpinInteger(sp, length)) / (boltzmann * temp)
+        logs, means = [], []
+        for start, weights, shift in self._chunks(hamilt, length, temp, boltzmann):
+            part = math.fsum(weights)
+            logs.append(shift + math.log(part))
+            means.append(
+                math.fsum(
+                    func(conf, *args, **kwargs) * weight
+                    for conf, weight in zip(
+                        self._spins(start, len(weights), length),
+                        map(float, weights),
+                    )
+                )
+                / part
             )
-            for sp in range(2 ** length)
-        ) / self.partition(hamilt, length, temp, boltzmann)
+        fracs, _ = self._merge(logs)
+        return math.fsum(fracs * means)
 
     def variance(
         self,
@@ -375,31 +545,424 @@ Find the value of an intrinsic property normalized by the partition function.
         """
 Find the variance of an intrinsic property normalized by the partition function.
 """
-        part = self.partition(hamilt, length, temp, boltzmann)
-        head = (
-            sum(
-                func(spins.SpinInteger(sp, length), *args, **kwargs) ** 2
-                * math.exp(
-                    -hamilt.energy(spins.SpinInteger(sp, length)) / (boltzmann * temp)
-                )
-                for sp in range(2 ** length)
+        logs, means, varis = [], [], []
+        for start, weights, shift in self._chunks(hamilt, length, temp, boltzmann):
+            part = math.fsum(weights)
+            vals = np.fromiter(
+                (
+                    func(conf, *args, **kwargs)
+                    for conf in self._spins(start, len(weights), length)
+                ),
+                dtype=np.float64,
+                count=len(weights),
             )
-            / part
+            # Take the moment about the chunk mean so that it does not cancel.
+            mean = math.fsum(vals * weights) / part
+            logs.append(shift + math.log(part))
+            means.append(mean)
+            varis.append(math.fsum((vals - mean) ** 2 * weights) / part)
+        fracs, _ = self._merge(logs)
+        means = np.asarray(means)
+        mean = math.fsum(fracs * means)
+        return math.fsum(fracs * (np.asarray(varis) + (means - mean) ** 2))
+
+
+def _abs_complement(gap, power):
+    """
+Finds 1 - (1 - gap) ** power without losing precision when gap is small.
+"""
+    if power == 0:
+        return 0.0
+    if gap >= 1:
+        return 1.0
+    return -math.expm1(power * math.log1p(-gap))
+
+
+def _ratio_powers(ratio, below, above, power):
+    """
+Finds 1 - ratio ** power and 1 + ratio ** power, given 1 - ratio and 1 + ratio
+computed directly.
+"""
+    gap = below if ratio >= 0 else above
+    comp = _abs_complement(gap, power)
+    if ratio >= 0 or power % 2 == 0:
+        return comp, 2 - comp
+    return 2 - comp, comp
+
+
+def _geometric(ratio, below, above, power):
+    """
+Finds (1 - ratio ** power) / (1 - ratio).
+"""
+    if below == 0:
+        return float(power)
+    return _ratio_powers(ratio, below, above, power)[0] / below
+
+
+def _second_geometric(ratio, below, above, power):
+    """
+Finds the sums of (power - 1 - j) * ratio ** j and (j + 1) * ratio ** j for j
+from 0 to power - 2. These are the scaled second divided differences of
+x ** power.
+"""
+    if power < 2:
+        return 0.0, 0.0
+    if below == 0:
+        return power * (power - 1) / 2, power * (power - 1) / 2
+    if ratio <= 0.5:
+        first = (power - _geometric(ratio, below, above, power)) / below
+        second = (
+            1 - power * ratio ** (power - 1) + (power - 1) * ratio ** power
+        ) / below ** 2
+        return first, second
+    # Near one, expand to avoid cancellation.
+    expo = power * math.log1p(-below)
+    if abs(expo) < 0.5:
+        term = expo ** 2 / 2
+        expm1mx = 0
+        k = 2
+        while abs(term) > 1e-17 * abs(expm1mx) or k < 4:
+            expm1mx += term
+            k += 1
+            term *= expo / k
+    else:
+        expm1mx = math.expm1(expo) - expo
+    if below < 0.1:
+        log1pdx = 0
+        term = below
+        k = 2
+        while True:
+            term *= below
+            step = term / k
+            log1pdx -= step
+            if abs(step) <= 1e-17 * abs(log1pdx):
+                break
+            k += 1
+    else:
+        log1pdx = below + math.log1p(-below)
+    first = (expm1mx + power * log1pdx) / below ** 2
+    second = power * _geometric(ratio, below, above, power - 1) - first
+    return first, second
+
+
+def _chain_log_partition(periodic, length, coup, field, dcoup, dfield):
+    """
+Finds the log of the partition function of a chain from its transfer matrix,
+along with its first and second derivatives along a direction in parameter
+space. The weight of a configuration is exp(coup * sum(s_i s_j) + field * sum(s_i)),
+and dcoup and dfield give the direction. The derivatives of the trace come from
+perturbation theory in the eigenbasis, so nearly degenerate eigenvalues do not
+lose precision.
+"""
+    sign = 1 if field >= 0 else -1
+    # Scale the matrix by exp(-scale) so nothing overflows.
+    if coup + sign * field >= -coup:
+        scale, dscale = coup + sign * field, dcoup + sign * dfield
+    else:
+        scale, dscale = -coup, -dcoup
+    logs = (coup + field - scale, coup - field - scale, -coup - scale)
+    dlogs = (dcoup + dfield - dscale, dcoup - dfield - dscale, -dcoup - dscale)
+    diag_p, diag_m, off = (math.exp(l) for l in logs)
+    if abs(field) < 1:
+        half_diff = math.exp(coup - scale) * math.sinh(field)
+    else:
+        half_diff = (diag_p - diag_m) / 2
+    if abs(coup) < 1:
+        det = 2 * math.exp(-2 * scale) * math.sinh(2 * coup)
+    else:
+        det = math.exp(2 * coup - 2 * scale) - math.exp(-2 * coup - 2 * scale)
+    root = math.hypot(half_diff, off)
+    lam = (diag_p + diag_m) / 2 + root
+    ratio = det / lam ** 2
+    below = 2 * root / lam
+    above = (diag_p + diag_m) / lam
+
+    # Rotation into the eigenbasis.
+    if root == 0:
+        cos2, sin2 = 1.0, 0.0
+    else:
+        cos2, sin2 = half_diff / root, off / root
+    if cos2 >= 0:
+        cos = math.sqrt((1 + cos2) / 2)
+        sin = sin2 / (2 * cos)
+    else:
+        sin = math.sqrt((1 - cos2) / 2)
+        cos = sin2 / (2 * sin)
+
+    def rotate(diag1, diag2, offd):
+        return (
+            (cos * cos * diag1 + 2 * cos * sin * offd + sin * sin * diag2) / lam,
+            (sin * sin * diag1 - 2 * cos * sin * offd + cos * cos * diag2) / lam,
+            (cos * sin * (diag2 - diag1) + (cos * cos - sin * sin) * offd) / lam,
         )
-        tail = (
-            sum(
-                func(spins.SpinInteger(sp, length), *args, **kwargs)
-                * math.exp(
-                    -hamilt.energy(spins.SpinInteger(sp, length)) / (boltzmann * temp)
-                )
-                for sp in range(2 ** length)
-            )
-            ** 2
-            / part ** 2
+
+    first = rotate(dlogs[0] * diag_p, dlogs[1] * diag_m, dlogs[2] * off)
+    second = rotate(
+        dlogs[0] ** 2 * diag_p, dlogs[1] ** 2 * diag_m, dlogs[2] ** 2 * off
+    )
+
+    if periodic:
+        size = length
+        norm = _ratio_powers(ratio, below, above, size)[1]
+        if size == 1:
+            dlog1 = (first[0] + first[1]) / norm
+            dlog2 = (second[0] + second[1]) / norm - dlog1 ** 2
+        else:
+            dlog1 = size * (first[0] + ratio ** (size - 1) * first[1]) / norm
+            dlog2 = (
+                size * (second[0] + ratio ** (size - 1) * second[1])
+                + 2 * size * first[2] ** 2 * _geometric(ratio, below, above, size - 1)
+                - size * (first[0] ** 2 + ratio ** (size - 2) * first[1] ** 2)
+            ) / norm + size ** 2 * ratio ** (size - 2) * (
+                first[0] * ratio - first[1]
+            ) ** 2 / norm ** 2
+        return (
+            size * (scale + math.log(lam)) + math.log(norm),
+            size * dscale + dlog1,
+            dlog2,
+        )
+
+    # Open chains need the boundary vector, scaled by exp(-|field| / 2).
+    size = length - 1
+    ends = (math.exp((field - sign * field) / 2), math.exp((-field - sign * field) / 2))
+    dends = ((dfield - sign * dfield) / 2, (-dfield - sign * dfield) / 2)
+
+    def to_eigen(vec):
+        return (cos * vec[0] + sin * vec[1], -sin * vec[0] + cos * vec[1])
+
+    vec0 = to_eigen(ends)
+    vec1 = to_eigen((dends[0] * ends[0], dends[1] * ends[1]))
+    vec2 = to_eigen((dends[0] ** 2 * ends[0], dends[1] ** 2 * ends[1]))
+    power = ratio ** size
+    if ratio < 0 and size % 2 == 1:
+        # Avoid the cancellation between the two eigenvalues.
+        norm = (
+            cos2 * (ends[0] ** 2 - ends[1] ** 2)
+            + 2 * sin2 * ends[0] * ends[1]
+            + vec0[1] ** 2 * _ratio_powers(ratio, below, above, size)[1]
+        )
+    else:
+        norm = vec0[0] ** 2 + power * vec0[1] ** 2
+    # Divided differences of x ** size, scaled by the eigenvalue.
+    if size == 0:
+        div1 = ((0.0, 0.0), (0.0, 0.0))
+    else:
+        mixed = _geometric(ratio, below, above, size)
+        div1 = ((size, mixed), (mixed, size * ratio ** (size - 1)))
+    corner = size * (size - 1) / 2
+    most, least = _second_geometric(ratio, below, above, size)
+    div2 = (corner, most, least, corner * ratio ** (size - 2) if size >= 2 else 0.0)
+    pmat = ((first[0], first[2]), (first[2], first[1]))
+    qmat = ((second[0], second[2]), (second[2], second[1]))
+    weights = (1, power)
+
+    dnorm1 = 2 * sum(vec1[i] * weights[i] * vec0[i] for i in range(2)) + sum(
+        vec0[i] * vec0[j] * pmat[i][j] * div1[i][j] for i in range(2) for j in range(2)
+    )
+    dnorm2 = (
+        2 * sum(vec2[i] * weights[i] * vec0[i] for i in range(2))
+        + 2 * sum(vec1[i] * weights[i] * vec1[i] for i in range(2))
+        + 4
+        * sum(
+            vec1[i] * vec0[j] * pmat[i][j] * div1[i][j]
+            for i in range(2)
+            for j in range(2)
+        )
+        + sum(
+            vec0[i] * vec0[j] * qmat[i][j] * div1[i][j]
+            for i in range(2)
+            for j in range(2)
+        )
+        + 2
+        * sum(
+            vec0[i] * pmat[i][j] * pmat[j][k] * vec0[k] * div2[i + j + k]
+            for i in range(2)
+            for j in range(2)
+            for k in range(2)
+        )
+    )
+    dlog1 = dnorm1 / norm
+    return (
+        sign * field + size * (scale + math.log(lam)) + math.log(norm),
+        sign * dfield + size * dscale + dlog1,
+        dnorm2 / norm - dlog1 ** 2,
+    )
+
+
+class TransferMatrixStrategy(ThermoStrategy, PlotValsStrategy):
+    """
+Calculates values for one dimensional chains exactly from the 2x2 transfer
+matrix. The cost does not depend on the length of the chain.
+"""
+
+    @staticmethod
+    def _supports(hamilt):
+        return isinstance(
+            hamilt, (hamiltonian.PeriodicHamiltonian, hamiltonian.NPHamiltonian)
+        )
+
+    def _beta_derivs(self, hamilt, length, temp, boltzmann):
+        """
+Finds the log of the partition function and its derivatives with respect to
+1 / kT.
+"""
+        beta = 1 / (boltzmann * temp)
+        return _chain_log_partition(
+            isinstance(hamilt, hamiltonian.PeriodicHamiltonian),
+            length,
+            beta * hamilt.getcoupling(),
+            -beta * hamilt.getmagnet(),
+            hamilt.getcoupling(),
+            -hamilt.getmagnet(),
         )
-        out = head - tail
-        if out < 0:
-            raise ArithmeticError(
-                f"Variance ({out} = {head} - {tail}) was less than 0!"
+
+    def _field_derivs(self, hamilt, length, temp, boltzmann):
+        """
+Finds the log of the partition function and its derivatives with respect to
+-h / kT.
+"""
+        beta = 1 / (boltzmann * temp)
+        return _chain_log_partition(
+            isinstance(hamilt, hamiltonian.PeriodicHamiltonian),
+            length,
+            beta * hamilt.getcoupling(),
+            -beta * hamilt.getmagnet(),
+            0.0,
+            1.0,
+        )
+
+    def log_partition(
+        self,
+        hamilt: hamiltonian.Hamiltonian,
+        length: int,
+        temp: float,
+        boltzmann: float,
+    ):
+        """
+Calculates the natural log of the partition function. Use this for long chains,
+where the partition function itself overflows.
+"""
+        if not self._supports(hamilt):
+            return FullCalcStrategy.getsingleton().log_partition(
+                hamilt, length, temp, boltzmann
             )
-        return out
+        return self._beta_derivs(hamilt, length, temp, boltzmann)[0]
+
+    def partition(
+        self,
+        hamilt: hamiltonian.Hamiltonian,
+        length: int,
+        temp: float,
+        boltzmann: float,
+    ):
+        """
+Calculates the partition function.
+"""
+        if not self._supports(hamilt):
+            return FullCalcStrategy.getsingleton().partition(
+                hamilt, length, temp, boltzmann
+            )
+        return math.exp(self.log_partition(hamilt, length, temp, boltzmann))
+
+    def average(
+        self,
+        func,
+        hamilt: hamiltonian.Hamiltonian,
+        length: int,
+        temp: float,
+        boltzmann: float,
+        *args,
+        **kwargs,
+    ):
+        """
+Calculates the average. The energy and the magnetization come from the
+transfer matrix, and anything else from FullCalcStrategy.
+"""
+        if self._supports(hamilt) and not args and not kwargs:
+            if func == hamilt.energy:
+                return self.energy(hamilt, length, temp, boltzmann)
+            if func in (magnetization, spins.SpinConfig.magnetization):
+                return self._field_derivs(hamilt, length, temp, boltzmann)[1]
+        return FullCalcStrategy.getsingleton().average(
+            func, hamilt, length, temp, boltzmann, *args, **kwargs
+        )
+
+    def variance(
+        self,
+        func,
+        hamilt: hamiltonian.Hamiltonian,
+        length: int,
+        temp: float,
+        boltzmann: float,
+        *args,
+        **kwargs,
+    ):
+        """
+Calculates the variance. The energy and the magnetization come from the
+transfer matrix, and anything else from FullCalcStrategy.
+"""
+        if self._supports(hamilt) and not args and not kwargs:
+            if func == hamilt.energy:
+                return self._beta_derivs(hamilt, length, temp, boltzmann)[2]
+            if func in (magnetization, spins.SpinConfig.magnetization):
+                return self._field_derivs(hamilt, length, temp, boltzmann)[2]
+        return FullCalcStrategy.getsingleton().variance(
+            func, hamilt, length, temp, boltzmann, *args, **kwargs
+        )
+
+    def energy(
+        self,
+        hamilt: hamiltonian.Hamiltonian,
+        length: int,
+        temp: float,
+        boltzmann: float,
+    ):
+        """
+Calculates the average energy.
+"""
+        if not self._supports(hamilt):
+            return super().energy(hamilt, length, temp, boltzmann)
+        return -self._beta_derivs(hamilt, length, temp, boltzmann)[1]
+
+    def heatcap(
+        self,
+        hamilt: hamiltonian.Hamiltonian,
+        length: int,
+        temp: float,
+        boltzmann: float,
+    ):
+        """
+Calculates the heat capacity.
+"""
+        if not self._supports(hamilt):
+            return super().heatcap(hamilt, length, temp, boltzmann)
+        return self._beta_derivs(hamilt, length, temp, boltzmann)[2] / (
+            boltzmann * temp ** 2
+        )
+
+    def magneticsus(
+        self,
+        hamilt: hamiltonian.Hamiltonian,
+        length: int,
+        temp: float,
+        boltzmann: float,
+    ):
+        """
+Calculates the magnetic susceptibility.
+"""
+        if not self._supports(hamilt):
+            return super().magneticsus(hamilt, length, temp, boltzmann)
+        return self._field_derivs(hamilt, length, temp, boltzmann)[2] / (
+            boltzmann * temp
+        )
+
+    def calc_plot_vals(self, hamilt: hamiltonian.Hamiltonian, length, temps, boltzmann):
+        """
+Returns the energies, heat capacities, and magnetic susceptibilities at several
+temperatures.
+"""
+        return (
+            [self.energy(hamilt, length, t, boltzmann) for t in temps],
+            [self.heatcap(hamilt, length, t, boltzmann) for t in temps],
+            [self.magneticsus(hamilt, length, t, boltzmann) for t in temps],
+        )
@@ -0,0 +1,389 @@
+#!/usr/bin/python3
+
+"""
+ising.transfer
+
+Exact values for square lattices that are periodic in both directions, from the
+transfer matrix between neighbouring rows. A strip of width L has 2 ** L row
+configurations. Narrow strips are diagonalized in full, which gives the
+partition function and its derivatives for any number of rows. Wider strips
+use a Lanczos iteration on the matrix applied one site at a time, which finds
+the leading eigenvalues, so the cost stays linear in the number of rows.
+"""
+
+try:
+    from . import thermo
+    from . import spins
+    from . import lattice
+    from . import numpycalc
+except ImportError:
+    import thermo
+    import spins
+    import lattice
+    import numpycalc
+
+import math
+import numpy as np
+
+# Relative steps for the finite differences of the Lanczos partition function.
+_STEP = 1e-3
+# Vectors in each block of the Lanczos iteration, enough for the eigenvalues
+# that the symmetries of a strip repeat.
+_BLOCK = 4
+
+
+def _row_terms(width: int):
+    """
+Finds every configuration of a row, as integers where bit i is site i, along
+with the sum of the products of neighbouring spins around the row and the
+magnetization of each.
+"""
+    confs = np.arange(1 << width, dtype=np.uint64)
+    mask = np.uint64((1 << width) - 1)
+    rot = ((confs >> np.uint64(1)) | (confs << np.uint64(width - 1))) & mask
+    couple = width - 2 * numpycalc.popcount(confs ^ rot)
+    mag = 2 * numpycalc.popcount(confs) - width
+    return confs, couple, mag
+
+
+def _divided_powers(above, below, power: int):
+    """
+Finds (above ** power - below ** power) / (above - below) for arrays of values
+between -1 and 1, or power * above ** (power - 1) where they are equal. Values
+with the same sign are taken as ratios, so close values do not cancel.
+"""
+    if power == 0:
+        return np.zeros(np.broadcast(above, below).shape)
+    big = np.where(np.abs(above) >= np.abs(below), above, below)
+    small = np.where(np.abs(above) >= np.abs(below), below, above)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(big == 0, 0.0, small / np.where(big == 0, 1.0, big))
+        logs = np.log1p(np.where(ratio > 0, ratio - 1, 0.0))
+        near = np.where(
+            logs == 0, float(power), np.expm1(power * logs) / np.expm1(logs)
+        )
+        far = (1 - ratio ** power) / (1 - ratio)
+    return big ** (power - 1) * np.where(ratio > 0, near, far)
+
+
+def _dense_log_partition(width: int, rows: int, params, dirs):
+    """
+Finds the log of the partition function of a strip from the full transfer
+matrix, and its first and second derivatives along each direction in parameter
+space. params are the couplings along and between the rows and the field, each
+over kT, with the field sign chosen so the weight of a configuration is
+exp(coupling * sum(s_i s_j) + field * sum(s_i)). The derivatives of the trace
+come from perturbation theory in the eigenbasis.
+"""
+    confs, couple, mag = _row_terms(width)
+    bond = width - 2 * numpycalc.popcount(
+        (confs[:, np.newaxis] ^ confs[np.newaxis, :]).reshape(-1)
+    ).reshape(len(confs), len(confs))
+    diag = params[0] * couple + params[2] * mag
+    logs = (diag[:, np.newaxis] + diag[np.newaxis, :]) / 2 + params[1] * bond
+    # Scale the matrix by exp(-shift) so nothing overflows.
+    shift = logs.max()
+    tmat = np.exp(logs - shift)
+    vals, vecs = np.linalg.eigh(tmat)
+    top = vals[-1]
+    ratios = vals / top
+    norm = np.sum(ratios ** rows)
+    divs = _divided_powers(ratios[:, np.newaxis], ratios[np.newaxis, :], rows - 1)
+    out = []
+    for direc in dirs:
+        ddiag = direc[0] * couple + direc[2] * mag
+        dlogs = (ddiag[:, np.newaxis] + ddiag[np.newaxis, :]) / 2 + direc[1] * bond
+        first = vecs.T @ (dlogs * tmat) @ vecs / top
+        second = np.einsum("ik,ik->k", vecs, (dlogs ** 2 * tmat) @ vecs) / top
+        dlog1 = rows * np.sum(np.diag(first) * ratios ** (rows - 1)) / norm
+        dlog2 = (
+            rows * np.sum(second * ratios ** (rows - 1))
+            + rows * np.sum(first ** 2 * divs)
+        ) / norm - dlog1 ** 2
+        out.append((dlog1, dlog2))
+    return rows * (shift + math.log(top)) + math.log(norm), out
+
+
+def _apply(vecs, width: int, half, near: float, far: float):
+    """
+Applies the scaled transfer matrix to the columns of vecs. half is the square
+root of the weight of each row by itself, and each site of the next row is
+weighted by near if it matches and far if it does not.
+"""
+    out = half[:, np.newaxis] * vecs
+    for site in range(width):
+        view = out.reshape(1 << (width - site - 1), 2, 1 << site, -1)
+        out = (near * view + far * view[:, ::-1]).reshape(out.shape)
+    return half[:, np.newaxis] * out
+
+
+def _lanczos(apply, start, count: int, steps: int, power: int = 1, tol=1e-12):
+    """
+Finds the count largest eigenvalues of a symmetric matrix, given as a function
+that applies it to the columns of an array, with a block Lanczos iteration that
+keeps its basis orthogonal. It starts from the columns of start, so eigenvalues
+repeated up to that many times are all found. Eigenvalues whose power is
+negligible next to that of the largest need not converge. Returns the
+eigenvalues largest first, stopping after the given number of blocks if they
+have not converged.
+"""
+    size, block = start.shape
+    steps = max(1, min(steps, size // block))
+    # Held by rows, so the vectors so far are contiguous.
+    basis = np.zeros(((steps + 1) * block, size))
+    basis[:block] = np.linalg.qr(start)[0].T
+    proj = np.zeros(((steps + 1) * block, (steps + 1) * block))
+    for step in range(steps):
+        here = slice(step * block, (step + 1) * block)
+        after = slice((step + 1) * block, (step + 2) * block)
+        vecs = apply(basis[here].T).T
+        proj[here, here] = vecs @ basis[here].T
+        # Orthogonalize twice against the whole basis.
+        for _ in range(2):
+            vecs -= (vecs @ basis[: here.stop].T) @ basis[: here.stop]
+        quot, tail = np.linalg.qr(vecs.T)
+        basis[after] = quot.T
+        proj[after, here] = tail
+        proj[here, after] = tail.T
+        vals, ritz = np.linalg.eigh(proj[: here.stop, : here.stop])
+        vals, ritz = vals[::-1][:count], ritz[:, ::-1][:, :count]
+        resid = np.linalg.norm(tail @ ritz[here], axis=0)
+        weight = np.abs(vals / vals[0]) ** max(power - 1, 0)
+        # The errors in the eigenvalues go as the squares of the residuals. Past
+        # the end of an invariant subspace, the new block is only noise.
+        if np.all(resid ** 2 * weight <= tol * vals[0] ** 2) or np.any(
+            np.abs(np.diag(tail)) <= tol * abs(vals[0])
+        ):
+            break
+    return vals
+
+
+class StripTransferStrategy(thermo.ThermoStrategy, thermo.PlotValsStrategy):
+    """
+Calculates values for lattice.square lattices that are periodic in both
+directions, with uniform couplings and fields, from the transfer matrix between
+rows. The narrower side is taken as the width of the strip. Other Hamiltonians
+go to thermo.FullCalcStrategy.
+"""
+
+    def __init__(self):
+        super().__init__()
+        self._dense = 8
+        self._eigenvalues = 8
+        self._steps = 16
+
+    def getdense(self):
+        """
+Gets the widest strip that is diagonalized in full.
+"""
+        return self._dense
+
+    def setdense(self, width: int):
+        """
+Sets the widest strip that is diagonalized in full. This is exact for any
+number of rows, but takes memory and time that go as 4 ** width and 8 ** width.
+"""
+        self._dense = width
+
+    def geteigenvalues(self):
+        """
+Gets the number of leading eigenvalues found for wider strips.
+"""
+        return self._eigenvalues
+
+    def seteigenvalues(self, count: int, steps: int = None):
+        """
+Sets the number of leading eigenvalues found for wider strips, and optionally
+the most Lanczos steps taken to find them. The eigenvalues that are left out
+are smaller by a power of the number of rows.
+"""
+        if count < 1:
+            raise ValueError("At least one eigenvalue is needed.")
+        self._eigenvalues = count
+        if steps is not None:
+            self._steps = steps
+
+    @staticmethod
+    def _strip(hamilt, length):
+        """
+Finds the width and number of rows of the strip, the couplings along and
+between the rows, and the magnetic constant, or returns None if the Hamiltonian
+is not a strip.
+"""
+        if not isinstance(hamilt, lattice.LatticeHamiltonian):
+            return None
+        if (
+            hamilt.getkinds() != lattice.SQUARE
+            or hamilt.getbasis() != 1
+            or not all(hamilt.getperiodic())
+        ):
+            return None
+        rows, cols = hamilt.getshape()
+        uniform = hamilt.getuniform()
+        if rows * cols != length or uniform is None:
+            return None
+        (along, between), magnet = uniform
+        if cols > rows:
+            return rows, cols, between, along, magnet
+        return cols, rows, along, between, magnet
+
+    def _derivs(self, strip, temp, boltzmann):
+        """
+Finds the log of the partition function, and its derivatives with respect to
+1 / kT and with respect to -h / kT.
+"""
+        width, rows, along, between, magnet = strip
+        beta = 1 / (boltzmann * temp)
+        params = (beta * along, beta * between, -beta * magnet)
+        dirs = ((along, between, -magnet), (0.0, 0.0, 1.0))
+        if width <= self._dense:
+            return _dense_log_partition(width, rows, params, dirs)
+
+        def log_partition(point, start):
+            diag = point[0] * couple + point[2] * mag
+            half = np.exp((diag - diag.max()) / 2)
+            near = math.exp(point[1] - abs(point[1]))
+            far = math.exp(-point[1] - abs(point[1]))
+            vals = _lanczos(
+                lambda vecs: _apply(vecs, width, half, near, far),
+                start,
+                self._eigenvalues,
+                self._steps,
+                rows,
+            )
+            shift = diag.max() + width * abs(point[1])
+            return rows * (shift + math.log(vals[0])) + math.log(
+                np.sum((vals / vals[0]) ** rows)
+            )
+
+        _, couple, mag = _row_terms(width)
+        start = np.random.default_rng(0).random((len(couple), _BLOCK)) - 0.5
+        center = log_partition(params, start)
+        out = []
+        # Five point differences, with steps relative to 1 / kT and the field.
+        for direc, step in zip(dirs, (_STEP * beta, _STEP * max(1.0, abs(params[2])))):
+            vals = [
+                log_partition(
+                    tuple(p + k * step * d for p, d in zip(params, direc)), start
+                )
+                for k in (-2, -1, 1, 2)
+            ]
+            out.append(
+                (
+                    (vals[0] - 8 * vals[1] + 8 * vals[2] - vals[3]) / (12 * step),
+                    (-vals[0] + 16 * vals[1] - 30 * center + 16 * vals[2] - vals[3])
+                    / (12 * step ** 2),
+                )
+            )
+        return center, out
+
+    def log_partition(
+        self,
+        hamilt: lattice.LatticeHamiltonian,
+        length: int,
+        temp: float,
+        boltzmann: float,
+    ):
+        """
+Calculates the natural log of the partition function.
+"""
+        strip = self._strip(hamilt, length)
+        if strip is None:
+            return thermo.FullCalcStrategy.getsingleton().log_partition(
+                hamilt, length, temp, boltzmann
+            )
+        return self._derivs(strip, temp, boltzmann)[0]
+
+    def partition(
+        self,
+        hamilt: lattice.LatticeHamiltonian,
+        length: int,
+        temp: float,
+        boltzmann: float,
+    ):
+        """
+Calculates the partition function.
+"""
+        if self._strip(hamilt, length) is None:
+            return thermo.FullCalcStrategy.getsingleton().partition(
+                hamilt, length, temp, boltzmann
+            )
+        return math.exp(self.log_partition(hamilt, length, temp, boltzmann))
+
+    def _moment(self, func, hamilt, length, temp, boltzmann, index):
+        """
+Finds the average or variance of the energy or the magnetization from the
+derivatives of the partition function.
+"""
+        derivs = self._derivs(self._strip(hamilt, length), temp, boltzmann)[1]
+        if func == hamilt.energy:
+            return -derivs[0][0] if index == 0 else derivs[0][1]
+        if func in (thermo.magnetization, spins.SpinConfig.magnetization):
+            return derivs[1][index]
+        raise NotImplementedError(
+            "The transfer matrix can only find values for the energy and the "
+            "magnetization."
+        )
+
+    def average(
+        self,
+        func,
+        hamilt: lattice.LatticeHamiltonian,
+        length: int,
+        temp: float,
+        boltzmann: float,
+        *args,
+        **kwargs,
+    ):
+        """
+Calculates the average. Only the energy and the magnetization are available
+from the transfer matrix.
+"""
+        if self._strip(hamilt, length) is None or args or kwargs:
+            return thermo.FullCalcStrategy.getsingleton().average(
+                func, hamilt, length, temp, boltzmann, *args, **kwargs
+            )
+        return self._moment(func, hamilt, length, temp, boltzmann, 0)
+
+    def variance(
+        self,
+        func,
+        hamilt: lattice.LatticeHamiltonian,
+        length: int,
+        temp: float,
+        boltzmann: float,
+        *args,
+        **kwargs,
+    ):
+        """
+Calculates the variance. Only the energy and the magnetization are available
+from the transfer matrix.
+"""
+        if self._strip(hamilt, length) is None or args or kwargs:
+            return thermo.FullCalcStrategy.getsingleton().variance(
+                func, hamilt, length, temp, boltzmann, *args, **kwargs
+            )
+        return self._moment(func, hamilt, length, temp, boltzmann, 1)
+
+    def calc_plot_vals(
+        self, hamilt: lattice.LatticeHamiltonian, length, temps, boltzmann
+    ):
+        """
+Returns the energies, heat capacities, and magnetic susceptibilities at several
+temperatures. The derivatives at each temperature come from one
+diagonalization.
+"""
+        strip = self._strip(hamilt, length)
+        if strip is None:
+            return (
+                [self.energy(hamilt, length, t, boltzmann) for t in temps],
+                [self.heatcap(hamilt, length, t, boltzmann) for t in temps],
+                [self.magneticsus(hamilt, length, t, boltzmann) for t in temps],
+            )
+        ens, heats, sus = [], [], []
+        for temp in temps:
+            derivs = self._derivs(strip, temp, boltzmann)[1]
+            ens.append(-derivs[0][0])
+            heats.append(derivs[0][1] / (boltzmann * temp ** 2))
+            sus.append(derivs[1][1] / (boltzmann * temp))
+        return ens, heats, sus
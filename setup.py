@@ -3,6 +3,7 @@ Ising
 Ising package
 """
 import sys
+import platform
 from setuptools import setup, find_packages
 import setuptools
 import versioneer
@@ -23,6 +24,10 @@ fastc = setuptools.distutils.core.Extension(
     "ising.fastc",
     sources=["./ising/src/fastcmodule.c", "./ising/src/ising.c"],
     libraries=["m", "pthread"] if sys.platform.lower() == "linux" else [],
+    # Use the hardware popcount instruction.
+    extra_compile_args=["-mpopcnt"]
+    if platform.machine().lower() in ("x86_64", "amd64") and sys.platform != "win32"
+    else [],
 )
 
 setup(